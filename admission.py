@@ -0,0 +1,250 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from metrics import REGISTRY
+
+# Why a request was shed
+REASON_CLIENT_RATE = 'client_rate'
+REASON_RATE = 'rate'
+REASON_CONCURRENCY = 'concurrency'
+REASON_CONNECTIONS = 'connections'
+
+ADMITTED = REGISTRY.counter('admission_admitted', "Requests let through admission control", ('service',))
+SHED = REGISTRY.counter('admission_shed', "Requests rejected by admission control, by reason", ('service', 'reason'))
+
+
+class Overloaded(Exception):
+    """Raised when admission control sheds a request; ``retry_after`` is in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Overloaded ({reason}), retry after {retry_after:.2f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def retry_after_header(self):
+        """Whole seconds for an HTTP Retry-After header"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Rate limit of ``rate`` requests per second with bursts of up to ``burst``"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("A token bucket needs a positive rate")
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now=None):
+        """Take a token; returns 0.0 when one was taken, else the seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class KeyedBuckets:
+    """One TokenBucket per client, forgetting the least recently seen beyond ``max_keys``.
+
+    A forgotten client starts again with a full bucket, which only ever
+    errs towards admitting it.
+    """
+
+    def __init__(self, rate, burst=None, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def try_acquire(self, key, now=None):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.try_acquire(now)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that follows the latency of the work it admits.
+
+    Additive increase, multiplicative decrease: every request finished
+    within ``target`` seconds raises the limit by 1/limit, about one more
+    slot per limit's worth of completions. A request slower than the
+    target, or one that failed, cuts the limit to what was in flight
+    scaled by target / latency, by at least ``backoff`` and at most by
+    half, so a deep overload is left in a few steps. Cuts happen at most
+    once per smoothed latency (or target, if shorter) so one wave of slow
+    requests counts as a single signal. The limit stays between
+    ``min_limit`` and ``max_limit``.
+    """
+
+    def __init__(self, max_limit=64, target=5.0, min_limit=1, initial=None, backoff=0.9, smoothing=0.2):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError("Limits must satisfy 1 <= min_limit <= max_limit")
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.target = target
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.limit = float(max_limit if initial is None else min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.latency = None  # Smoothed latency of finished requests
+        self.decreases = 0
+        self._decreased = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Take a slot if fewer than ``limit`` requests are in flight"""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency, ok=True):
+        """Give back a slot, adjusting the limit by how long its request took"""
+        with self._lock:
+            self.in_flight -= 1
+            self.latency = latency if self.latency is None else (
+                self.latency + self.smoothing * (latency - self.latency))
+            if ok and latency <= self.target:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                return
+            now = time.monotonic()
+            if now - self._decreased >= min(self.latency, self.target):
+                self._decreased = now
+                self.decreases += 1
+                factor = min(self.backoff, max(0.5, self.target / latency)) if ok else self.backoff
+                self.limit = max(self.min_limit, min(self.limit, self.in_flight + 1) * factor)
+
+    def cancel(self):
+        """Give back a slot whose request never ran, leaving the limit as it is"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def retry_after(self):
+        """Rough wait until a slot frees up: the smoothed latency, or the target before any completed"""
+        return self.latency if self.latency is not None else self.target
+
+    def stats(self):
+        return {
+            'limit': round(self.limit, 2),
+            'in_flight': self.in_flight,
+            'latency_ms': None if self.latency is None else round(self.latency * 1000, 1),
+            'decreases': self.decreases
+        }
+
+
+class AdmissionController:
+    """Decides which requests a service takes on and which it sheds at once.
+
+    ``admit`` applies the per-client and then the global token bucket;
+    ``slot`` (or ``acquire`` and ``release``) holds one of the adaptive
+    limiter's slots for the expensive part of the work. Both raise
+    Overloaded instead of queuing, so a shed request costs almost nothing
+    and the requests let in keep their latency. Rates of None and a
+    limiter of None switch that check off.
+    """
+
+    def __init__(self, name, rate=None, burst=None, client_rate=None, client_burst=None,
+                 limiter=None, max_connections=None, tracked_clients=10000):
+        self.name = name
+        self.global_bucket = TokenBucket(rate, burst) if rate else None
+        self.client_buckets = KeyedBuckets(client_rate, client_burst, tracked_clients) if client_rate else None
+        self.limiter = limiter
+        self.max_connections = max_connections
+        self.admitted = 0
+        self.shed = {}
+        self._admitted = ADMITTED.labels(name)
+        self._lock = threading.Lock()
+        if limiter is not None:
+            REGISTRY.gauge_function(f'admission_{name}_limit', f"Adaptive concurrency limit of {name}",
+                                    lambda: limiter.limit)
+            REGISTRY.gauge_function(f'admission_{name}_in_flight', f"Requests holding a {name} concurrency slot",
+                                    lambda: limiter.in_flight)
+
+    def reject(self, reason, retry_after):
+        """Count a shed request and raise Overloaded for it"""
+        with self._lock:
+            self.shed[reason] = self.shed.get(reason, 0) + 1
+        SHED.labels(self.name, reason).inc()
+        raise Overloaded(reason, retry_after)
+
+    def admit(self, key=None):
+        """Pass a request through the rate limits, raising Overloaded if either is exhausted"""
+        if self.client_buckets is not None or self.global_bucket is not None:
+            reason, wait = None, 0.0
+            now = time.monotonic()
+            with self._lock:
+                # A client over its own rate does not use up the global budget
+                if self.client_buckets is not None and key is not None:
+                    wait = self.client_buckets.try_acquire(key, now)
+                    reason = REASON_CLIENT_RATE
+                if not wait and self.global_bucket is not None:
+                    wait = self.global_bucket.try_acquire(now)
+                    reason = REASON_RATE
+            if wait:
+                self.reject(reason, wait)
+        with self._lock:
+            self.admitted += 1
+        self._admitted.inc()
+
+    def admit_connection(self, connections):
+        """Refuse a new connection when ``connections`` are already open"""
+        if self.max_connections is not None and connections >= self.max_connections:
+            self.reject(REASON_CONNECTIONS, self.limiter.retry_after() if self.limiter is not None else 1.0)
+
+    def acquire(self):
+        """Take a concurrency slot, raising Overloaded when none is free; returns the start time for ``release``"""
+        if self.limiter is not None and not self.limiter.try_acquire():
+            self.reject(REASON_CONCURRENCY, self.limiter.retry_after())
+        return time.perf_counter()
+
+    def release(self, start, ok=True):
+        """Give back the slot taken by ``acquire`` at ``start``"""
+        self.release_after(time.perf_counter() - start, ok)
+
+    def release_after(self, latency, ok=True):
+        """Give back a slot whose request took ``latency`` seconds, for work timed elsewhere"""
+        if self.limiter is not None:
+            self.limiter.release(latency, ok)
+
+    def cancel(self):
+        """Give back a slot taken by ``acquire`` for work that was abandoned before it ran"""
+        if self.limiter is not None:
+            self.limiter.cancel()
+
+    @contextmanager
+    def slot(self):
+        """Hold a concurrency slot for the duration of the block"""
+        start = self.acquire()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.release(start, ok)
+
+    def stats(self):
+        """Requests admitted and shed, with the limiter's current state"""
+        return {
+            'admitted': self.admitted,
+            'shed': dict(self.shed),
+            'clients': len(self.client_buckets) if self.client_buckets is not None else 0,
+            'limiter': self.limiter.stats() if self.limiter is not None else None
+        }
@@ -1,11 +1,28 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context, g
 from flask_cors import CORS
 import openai
 import os
-import markdown
+import json
+import atexit
 from dotenv import load_dotenv
-from mcp_client import MCPClient
+from mcp_pool import MCPClientPool
+from mcp_protocol import PROTOCOL_COMPACT
+from audit_outbox import AuditOutbox
+from response_cache import ResponseCache, fingerprint, normalize_message
+from single_flight import SingleFlight, FlightTimeout
+from conversation_store import ConversationStore
+from fast_path import BankInfoAnswerer
+from markdown_stream import MarkdownStream
+from markdown_renderer import MarkdownRenderer
+from metrics import REGISTRY, CONTENT_TYPE
+from tracing import Tracer, Span
+from admission import AdmissionController, AdaptiveLimiter, Overloaded
+import time
 import logging
+import hashlib
+import hmac
+import secrets
+import uuid
 
 # Configure logging
 logging.basicConfig(
@@ -26,17 +43,6 @@ openai.api_key = os.getenv("AZURE_OPENAI_API_KEY")
 app = Flask(__name__)
 CORS(app)
 
-# Create MCP client instance
-mcp_client = MCPClient()
-
-def init_mcp():
-    """Initialize MCP client connection"""
-    if mcp_client.connect():
-        mcp_client.register_handler('chat', handle_chat_response)
-        logging.info("MCP client connected successfully")
-    else:
-        logging.error("Failed to connect to MCP server")
-
 # Bank Information
 BANK_INFO = {
     "name": "Global Trust Bank",
@@ -74,75 +80,407 @@ BANK_INFO = {
 SYSTEM_MESSAGE = f"""You are an AI banking assistant for {BANK_INFO['name']}. You have access to the following bank information:
 [Previous system message content...]"""
 
-def handle_chat_response(message):
-    """Handle chat responses from MCP server"""
-    logging.info(f"Received chat response: {message}")
-    # You can implement additional handling here
+# Parameters for every chat completion; part of the response cache key
+COMPLETION_PARAMS = {
+    "temperature": 0.7,
+    "max_tokens": 800,
+    "top_p": 0.95,
+    "frequency_penalty": 0.5,
+    "presence_penalty": 0.5
+}
+
+def cache_namespace():
+    """Hash of everything besides the user message that shapes an answer"""
+    return fingerprint(SYSTEM_MESSAGE, BANK_INFO, COMPLETION_PARAMS, os.getenv("DEPLOYMENT_NAME"))
+
+def build_messages(user_message, history=None):
+    """Chat completion messages for a user question, after any earlier turns of the conversation"""
+    messages = [{"role": "system", "content": SYSTEM_MESSAGE}]
+    if history:
+        messages.extend(history)
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+# Request latency by how the answer was produced, plus the stages inside it
+CHAT_LATENCY = REGISTRY.histogram('chat_request_seconds', "Time to answer /chat, by answer source", ('source',))
+CHAT_STAGE = REGISTRY.histogram('chat_stage_seconds', "Time spent in each stage of /chat", ('stage',))
+LLM_LATENCY = REGISTRY.histogram('llm_request_seconds', "Chat completion latency, until the whole answer arrived")
+RENDER_TIME = REGISTRY.histogram('markdown_render_seconds', "Time to render an answer to HTML")
+STAGE_AUDIT = CHAT_STAGE.labels('audit')
+STAGE_FAST_PATH = CHAT_STAGE.labels('fast_path')
+STAGE_CACHE = CHAT_STAGE.labels('cache')
+STAGE_HISTORY = CHAT_STAGE.labels('history')
+
+# Answers are rendered by a reused per-thread converter with raw HTML escaped,
+# and the HTML of recent answers is cached by content hash
+markdown_renderer = MarkdownRenderer(
+    max_entries=int(os.getenv("MARKDOWN_CACHE_SIZE", "1024")),
+    max_chars=int(os.getenv("MARKDOWN_CACHE_CHARS", str(4 * 1024 * 1024)))
+)
+
+def render_markdown(text):
+    """Convert an answer to sanitized HTML with extra features enabled"""
+    with Span('markdown', RENDER_TIME):
+        return markdown_renderer.render(text)
+
+# Sampled /chat traces go to logs/traces.log, along with every request slower
+# than TRACE_SLOW_MS. Set PROFILE_SLOW_MS to also dump the sampled stacks of
+# slower requests to logs/profiles/<trace id>.folded
+profile_ms = os.getenv("PROFILE_SLOW_MS")
+tracer = Tracer(
+    'app',
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0.01")),
+    slow_ms=float(os.getenv("TRACE_SLOW_MS", "2000")),
+    profile_ms=float(profile_ms) if profile_ms else None,
+    profile_interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+)
+TRACED_ENDPOINTS = ('chat', 'chat_stream')
+
+# Persistent MCP connections shared by all worker threads; each connection
+# is checked out by one request at a time
+mcp_pool = MCPClientPool(
+    size=int(os.getenv("MCP_POOL_SIZE", "4")),
+    host=os.getenv("MCP_HOST", "localhost"),
+    port=int(os.getenv("MCP_PORT", "5555")),
+    # Compact binary frames when the server offers them, JSON frames otherwise
+    # The pool only sends audit messages: it does not subscribe to copies of other clients' chats
+    protocol=os.getenv("MCP_PROTOCOL", PROTOCOL_COMPACT)
+)
+atexit.register(mcp_pool.close)
+
+# Chat audit messages are handed to a background sender so a slow or
+# unreachable MCP server never delays the response
+audit_outbox = AuditOutbox(mcp_pool, max_size=int(os.getenv("MCP_OUTBOX_SIZE", "10000")), tracer=tracer)
+atexit.register(audit_outbox.close)
+REGISTRY.gauge_function('audit_outbox_depth', "Audit messages waiting to be sent to the MCP server",
+                        lambda: audit_outbox.depth)
+
+# Simple questions about BANK_INFO are answered without calling the LLM at all
+fast_path = BankInfoAnswerer(BANK_INFO, version=cache_namespace())
+
+# Repeated FAQ-style questions are answered from the cache instead of the LLM.
+# Set RESPONSE_CACHE_PATH to keep answers across restarts and
+# RESPONSE_CACHE_SIMILARITY (e.g. 0.6) to also serve near-duplicate questions
+similarity = os.getenv("RESPONSE_CACHE_SIMILARITY")
+response_cache = ResponseCache(
+    cache_namespace(),
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    disk_path=os.getenv("RESPONSE_CACHE_PATH") or None,
+    similarity_threshold=float(similarity) if similarity else None
+)
+
+# Identical questions asked at the same time share one LLM call
+single_flight = SingleFlight(timeout=float(os.getenv("LLM_TIMEOUT", "30")))
+
+# Requests over a client's or the global rate are shed on arrival; LLM calls
+# are capped by a concurrency limit that shrinks when they slow down past
+# CHAT_LATENCY_TARGET seconds. The rate limits are off unless configured
+def env_float(name):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+chat_admission = AdmissionController(
+    'chat',
+    rate=env_float("CHAT_RATE"),
+    burst=env_float("CHAT_BURST"),
+    client_rate=env_float("CHAT_CLIENT_RATE"),
+    client_burst=env_float("CHAT_CLIENT_BURST"),
+    limiter=AdaptiveLimiter(
+        max_limit=int(os.getenv("CHAT_MAX_CONCURRENCY", "256")),
+        target=float(os.getenv("CHAT_LATENCY_TARGET", "10"))
+    )
+)
+
+def overloaded(error):
+    """429 response telling the client when to try again"""
+    response = jsonify({'error': 'The assistant is busy right now. Please try again shortly.',
+                        'reason': error.reason})
+    response.status_code = 429
+    response.headers['Retry-After'] = error.retry_after_header()
+    return response
+
+def flight_key(namespace, user_message):
+    """Questions are coalesced when they normalize to the same text under the same prompt and parameters"""
+    return f"{namespace}\n{normalize_message(user_message)}"
+
+def complete(user_message, history=None):
+    """Ask the LLM and return the answer with its HTML, caching answers that do not depend on earlier turns"""
+    start = time.perf_counter()
+    with chat_admission.slot(), Span('llm', LLM_LATENCY):
+        completion = openai.ChatCompletion.create(
+            engine=os.getenv("DEPLOYMENT_NAME"),
+            messages=build_messages(user_message, history),
+            **COMPLETION_PARAMS
+        )
+    ai_response = completion.choices[0].message.content
+    if not history:
+        response_cache.put(user_message, ai_response, time.perf_counter() - start)
+    return ai_response, render_markdown(ai_response)
+
+# Recent turns of each conversation, sent along with the next question.
+# Set CONVERSATION_SPILL_PATH to keep evicted sessions in SQLite
+conversations = ConversationStore(
+    max_sessions=int(os.getenv("CONVERSATION_SESSIONS", "10000")),
+    token_budget=int(os.getenv("CONVERSATION_TOKENS", "1500")),
+    spill_path=os.getenv("CONVERSATION_SPILL_PATH") or None
+)
+atexit.register(conversations.close)
+
+# Conversation ids are issued by the server and signed, so a client can only
+# continue a conversation it was given. Set SESSION_SECRET when several
+# processes serve the app so that they accept each other's ids.
+SESSION_SECRET = (os.getenv("SESSION_SECRET") or secrets.token_hex(32)).encode()
+
+def sign_session(session_id):
+    return hmac.new(SESSION_SECRET, session_id.encode(), hashlib.sha256).hexdigest()[:32]
+
+def issue_session():
+    """New signed conversation id for the chat page to send back with its questions"""
+    session_id = uuid.uuid4().hex
+    return f"{session_id}.{sign_session(session_id)}"
+
+def session_for(data):
+    """Conversation id of a chat request, or None unless it carries one issued by ``issue_session``"""
+    token = data.get('session_id')
+    if not isinstance(token, str) or len(token) > 128:
+        return None
+    session_id, _, signature = token.partition('.')
+    if session_id and hmac.compare_digest(signature.encode(), sign_session(session_id).encode()):
+        return session_id
+    return None
+
+def remember(session_id, user_message, ai_response):
+    """Record an exchange in its conversation"""
+    if session_id is not None:
+        conversations.add_exchange(session_id, user_message, ai_response)
+
+@app.before_request
+def begin_trace():
+    if request.endpoint in TRACED_ENDPOINTS:
+        g.trace = tracer.begin(request.path)
+
+@app.after_request
+def tag_trace(response):
+    trace = g.get('trace')
+    if trace is not None:
+        trace.attributes['status'] = response.status_code
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+@app.teardown_request
+def end_trace(error=None):
+    # Streamed responses are torn down once the stream has been sent
+    trace = g.pop('trace', None)
+    if trace is not None:
+        tracer.end(trace, error)
 
 @app.route('/')
 def home():
-    # Initialize MCP connection if not already connected
-    if not mcp_client.connected:
-        init_mcp()
-    return render_template('index.html', bank_info=BANK_INFO)
+    return render_template('index.html', bank_info=BANK_INFO, session_id=issue_session())
+
+@app.route('/session', methods=['POST'])
+def new_session():
+    """Conversation id for API clients, sent back as ``session_id`` with their questions"""
+    return jsonify({'session_id': issue_session()})
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    received = time.perf_counter()
     try:
-        # Ensure MCP connection
-        if not mcp_client.connected:
-            init_mcp()
-
         data = request.json
         user_message = data.get('message', '')
+        session_id = session_for(data)
         
         if not user_message:
             return jsonify({'error': 'No message provided'}), 400
 
+        # Shed clients over their rate before doing any work for them. Keyed on
+        # the address: a client can make up as many sessions as it likes
+        chat_admission.admit(request.remote_addr)
+
         # Send message to MCP server
-        mcp_client.send_chat_message(user_message)
+        with Span('audit', STAGE_AUDIT):
+            audit_outbox.emit(user_message)
 
-        # Prepare the messages for chat completion
-        messages = [
-            {"role": "system", "content": SYSTEM_MESSAGE},
-            {"role": "user", "content": user_message}
-        ]
+        # Fast-path intents and cached answers are rebuilt whenever BANK_INFO or the prompt changes
+        with Span('fast_path', STAGE_FAST_PATH):
+            namespace = cache_namespace()
+            fast_path.rebuild(BANK_INFO, version=namespace)
+            answer = fast_path.answer(user_message)
+        if answer is not None:
+            audit_outbox.emit(answer.text, is_user=False)
+            remember(session_id, user_message, answer.text)
+            CHAT_LATENCY.labels('fast_path').since(received)
+            return jsonify({'response': answer.html})
 
-        # Generate the completion
-        completion = openai.ChatCompletion.create(
-            engine=os.getenv("DEPLOYMENT_NAME"),
-            messages=messages,
-            temperature=0.7,
-            max_tokens=800,
-            top_p=0.95,
-            frequency_penalty=0.5,
-            presence_penalty=0.5
-        )
+        # Answers that depend on earlier turns are neither cached nor shared:
+        # every follow-up is its own LLM call, skipping the response cache and
+        # request coalescing
+        with Span('history', STAGE_HISTORY):
+            history = conversations.history(session_id) if session_id else []
+        with Span('cache', STAGE_CACHE):
+            response_cache.set_namespace(namespace)
+            ai_response = None if history else response_cache.get(user_message)
 
-        # Get the response
-        ai_response = completion.choices[0].message.content
+        if history:
+            source = 'conversation'
+            ai_response, ai_response_html = complete(user_message, history)
+        elif ai_response is None:
+            # Generate the completion, or wait for an identical one already in flight
+            source = 'llm'
+            with Span('single_flight'):
+                ai_response, ai_response_html = single_flight.do(
+                    flight_key(namespace, user_message), lambda: complete(user_message)
+                )
+        else:
+            source = 'cache'
+            ai_response_html = render_markdown(ai_response)
 
         # Send AI response to MCP server
-        mcp_client.send_chat_message(ai_response)
-
-        # Convert markdown to HTML with extra features enabled
-        ai_response_html = markdown.markdown(
-            ai_response,
-            extensions=['extra', 'smarty', 'tables']
-        )
+        with Span('audit', STAGE_AUDIT):
+            audit_outbox.emit(ai_response, is_user=False)
+        remember(session_id, user_message, ai_response)
 
+        CHAT_LATENCY.labels(source).since(received)
         return jsonify({'response': ai_response_html})
 
+    except Overloaded as e:
+        CHAT_LATENCY.labels('shed').since(received)
+        return overloaded(e)
+    except FlightTimeout as e:
+        logging.error(f"Error details: {str(e)}")
+        CHAT_LATENCY.labels('timeout').since(received)
+        return jsonify({'error': 'The assistant took too long to answer. Please try again.'}), 504
     except Exception as e:
         logging.error(f"Error details: {str(e)}")
+        CHAT_LATENCY.labels('error').since(received)
         return jsonify({'error': 'An error occurred while processing your request. Please try again later.'}), 500
 
-@app.teardown_appcontext
-def cleanup(exception=None):
-    """Cleanup when the app context ends"""
-    mcp_client.disconnect()
+def sse(event, data):
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream the answer as Server-Sent Events while the LLM generates it.
+
+    ``delta`` events carry raw text as it arrives, ``block`` events the HTML
+    of each finished markdown block together with the text still pending,
+    and ``done`` ends the stream.
+    """
+    data = request.json or {}
+    user_message = data.get('message', '')
+    session_id = session_for(data)
+    if not user_message:
+        return jsonify({'error': 'No message provided'}), 400
+    try:
+        chat_admission.admit(request.remote_addr)
+    except Overloaded as e:
+        return overloaded(e)
+
+    # Send message to MCP server
+    with Span('audit', STAGE_AUDIT):
+        audit_outbox.emit(user_message)
+
+    with Span('fast_path', STAGE_FAST_PATH):
+        namespace = cache_namespace()
+        fast_path.rebuild(BANK_INFO, version=namespace)
+        answer = fast_path.answer(user_message)
+    with Span('history', STAGE_HISTORY):
+        history = conversations.history(session_id) if session_id and answer is None else []
+    with Span('cache', STAGE_CACHE):
+        response_cache.set_namespace(namespace)
+        cached = response_cache.get(user_message) if answer is None and not history else None
+
+    # The LLM slot is taken before the stream starts so a shed request still gets a 429
+    slot = None
+    outcome = {'ok': False}
+    if answer is None and cached is None:
+        try:
+            slot = chat_admission.acquire()
+        except Overloaded as e:
+            return overloaded(e)
+
+    def generate():
+        if answer is not None:
+            audit_outbox.emit(answer.text, is_user=False)
+            remember(session_id, user_message, answer.text)
+            yield sse('block', {'html': answer.html, 'pending': ''})
+            yield sse('done', {})
+            return
+        if cached is not None:
+            audit_outbox.emit(cached, is_user=False)
+            remember(session_id, user_message, cached)
+            yield sse('block', {'html': render_markdown(cached), 'pending': ''})
+            yield sse('done', {})
+            return
+
+        renderer = MarkdownStream(markdown_renderer)
+        try:
+            start = time.perf_counter()
+            with Span('llm_stream', LLM_LATENCY):
+                chunks = openai.ChatCompletion.create(
+                    engine=os.getenv("DEPLOYMENT_NAME"),
+                    messages=build_messages(user_message, history),
+                    stream=True,
+                    **COMPLETION_PARAMS
+                )
+                for chunk in chunks:
+                    # Azure sends content filter results in chunks without choices
+                    if not chunk['choices']:
+                        continue
+                    text = chunk['choices'][0]['delta'].get('content')
+                    if not text:
+                        continue
+                    html = renderer.feed(text)
+                    if html:
+                        yield sse('block', {'html': html, 'pending': renderer.pending})
+                    else:
+                        yield sse('delta', {'text': text})
+                html = renderer.close()
+                if html:
+                    yield sse('block', {'html': html, 'pending': ''})
+                yield sse('done', {})
+            outcome['ok'] = True
+        except Exception as e:
+            logging.error(f"Error details: {str(e)}")
+            yield sse('error', {'error': 'An error occurred while processing your request. Please try again later.'})
+            return
+
+        # Only complete answers are audited, cached and remembered
+        ai_response = renderer.text
+        if not history:
+            response_cache.put(user_message, ai_response, time.perf_counter() - start)
+        audit_outbox.emit(ai_response, is_user=False)
+        remember(session_id, user_message, ai_response)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if slot is not None:
+        # Released even when the client goes away before the stream starts
+        response.call_on_close(lambda: chat_admission.release(slot, outcome['ok']))
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Counters, gauges and latency histograms in the Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route('/status')
+def status():
+    """MCP connection pool, audit outbox, fast path, response cache, coalescing, conversation, markdown, tracing and admission counters"""
+    return jsonify({
+        'mcp_pool': mcp_pool.stats(),
+        'audit_outbox': audit_outbox.stats(),
+        'fast_path': fast_path.stats(),
+        'response_cache': response_cache.stats(),
+        'single_flight': single_flight.stats(),
+        'conversations': conversations.stats(),
+        'markdown': markdown_renderer.stats(),
+        'tracing': tracer.stats(),
+        'admission': chat_admission.stats()
+    })
 
 if __name__ == '__main__':
-    # Initialize MCP connection before starting the app
-    init_mcp()
     app.run(debug=True) 
\ No newline at end of file
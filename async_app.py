@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import functools
+import logging
+import os
+import time
+import aiohttp
+import openai
+from aiohttp import web
+from flask import render_template
+import app as chat_app
+from markdown_stream import MarkdownStream
+from metrics import REGISTRY, CONTENT_TYPE
+from single_flight import AsyncSingleFlight, FlightTimeout
+
+
+class LLMBusy(Exception):
+    """Raised when no LLM slot frees up within the queue timeout"""
+
+
+class AsyncLLMClient:
+    """Chat completion client shared by every request of the async server.
+
+    Uses the openai 0.27 API's ``ChatCompletion.acreate`` over one aiohttp
+    session, so connections to Azure are pooled and reused instead of
+    opened per request.
+    """
+
+    def __init__(self, max_connections=100, timeout=30.0):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.session = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def create(self, messages, stream=False):
+        # The 0.27 API picks up the session from a context variable
+        openai.aiosession.set(self.session)
+        return await openai.ChatCompletion.acreate(
+            engine=os.getenv("DEPLOYMENT_NAME"),
+            messages=messages,
+            stream=stream,
+            **chat_app.COMPLETION_PARAMS
+        )
+
+    async def complete(self, messages):
+        """Text of a whole completion"""
+        completion = await self.create(messages)
+        return completion.choices[0].message.content
+
+    async def stream(self, messages):
+        """Yield the text of a streamed completion as it arrives"""
+        chunks = await self.create(messages, stream=True)
+        async for chunk in chunks:
+            # Azure sends content filter results in chunks without choices
+            text = chunk['choices'][0]['delta'].get('content') if chunk['choices'] else None
+            if text:
+                yield text
+
+
+class AsyncChatServer:
+    """Serves the chat app from one asyncio event loop.
+
+    ``/chat`` and ``/chat/stream`` are coroutines, so a request waiting on
+    the LLM holds no thread. At most ``max_concurrency`` LLM calls run at
+    once; a request that cannot get a slot within ``queue_timeout`` seconds
+    is answered 503, and one whose LLM call takes longer than
+    ``request_timeout`` seconds is answered 504. When the client
+    disconnects the handler is cancelled along with its LLM request, unless
+    identical questions coalesced onto the same call are still waiting for
+    it. Fast path, response cache, conversation store and audit outbox are
+    shared with app.py; their calls can block on SQLite, so they run in
+    the loop's default executor.
+    """
+
+    def __init__(self, llm, max_concurrency=64, queue_timeout=1.0, request_timeout=30.0):
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.flights = AsyncSingleFlight(timeout=request_timeout + queue_timeout)
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/', self.home)
+        app.router.add_post('/session', self.new_session)
+        app.router.add_post('/chat', self.chat)
+        app.router.add_post('/chat/stream', self.chat_stream)
+        app.router.add_get('/status', self.status)
+        app.router.add_get('/metrics', self.metrics)
+        app.on_startup.append(lambda app: self.llm.start())
+        app.on_cleanup.append(lambda app: self.llm.close())
+        return app
+
+    async def home(self, request):
+        with chat_app.app.app_context():
+            html = render_template('index.html', bank_info=chat_app.BANK_INFO, session_id=chat_app.issue_session())
+        return web.Response(text=html, content_type='text/html')
+
+    async def new_session(self, request):
+        return web.json_response({'session_id': chat_app.issue_session()})
+
+    async def read_message(self, request):
+        """User message and conversation id of a chat request"""
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return '', None
+        return data.get('message', ''), chat_app.session_for(data)
+
+    async def offload(self, fn, *args):
+        """Run a blocking call in the default executor so the event loop keeps serving"""
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+    def lookup(self, user_message, session_id):
+        """Markdown answer from the fast path or the response cache, or None, with the cache namespace and conversation history"""
+        namespace = chat_app.cache_namespace()
+        chat_app.fast_path.rebuild(chat_app.BANK_INFO, version=namespace)
+        answer = chat_app.fast_path.answer(user_message)
+        if answer is not None:
+            return answer.text, namespace, []
+        # Answers that depend on earlier turns are neither cached nor shared
+        history = chat_app.conversations.history(session_id) if session_id else []
+        if history:
+            return None, namespace, history
+        chat_app.response_cache.set_namespace(namespace)
+        return chat_app.response_cache.get(user_message), namespace, history
+
+    async def acquire(self):
+        """Wait for an LLM slot, returns False if none frees up in time"""
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+
+    def busy(self):
+        return web.json_response({'error': 'The assistant is busy. Please try again shortly.'},
+                                 status=503, headers={'Retry-After': '1'})
+
+    async def chat(self, request):
+        user_message, session_id = await self.read_message(request)
+        if not user_message:
+            return web.json_response({'error': 'No message provided'}, status=400)
+
+        # Send message to MCP server
+        chat_app.audit_outbox.emit(user_message)
+
+        ai_response, namespace, history = await self.offload(self.lookup, user_message, session_id)
+        if ai_response is None:
+            try:
+                if history:
+                    ai_response, html = await self.complete(user_message, history)
+                else:
+                    # Identical questions in flight share one LLM call
+                    ai_response, html = await self.flights.do(
+                        chat_app.flight_key(namespace, user_message), lambda: self.complete(user_message)
+                    )
+            except LLMBusy:
+                return self.busy()
+            except (asyncio.TimeoutError, FlightTimeout):
+                self.timeouts += 1
+                return web.json_response({'error': 'The assistant took too long to answer. Please try again.'},
+                                         status=504)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Error details: {str(e)}")
+                return web.json_response({'error': 'An error occurred while processing your request. Please try again later.'},
+                                         status=500)
+        else:
+            html = chat_app.render_markdown(ai_response)
+
+        # Send AI response to MCP server
+        chat_app.audit_outbox.emit(ai_response, is_user=False)
+        await self.offload(chat_app.remember, session_id, user_message, ai_response)
+        self.completed += 1
+        return web.json_response({'response': html})
+
+    async def complete(self, user_message, history=None):
+        """Ask the LLM within the concurrency limit and return the answer with its HTML, caching answers that do not depend on earlier turns"""
+        if not await self.acquire():
+            raise LLMBusy()
+        try:
+            start = time.perf_counter()
+            ai_response = await asyncio.wait_for(
+                self.llm.complete(chat_app.build_messages(user_message, history)), self.request_timeout
+            )
+            chat_app.LLM_LATENCY.since(start)
+        finally:
+            self.release()
+        if not history:
+            await self.offload(chat_app.response_cache.put, user_message, ai_response, time.perf_counter() - start)
+        return ai_response, chat_app.render_markdown(ai_response)
+
+    async def chat_stream(self, request):
+        user_message, session_id = await self.read_message(request)
+        if not user_message:
+            return web.json_response({'error': 'No message provided'}, status=400)
+
+        # Send message to MCP server
+        chat_app.audit_outbox.emit(user_message)
+
+        ai_response, _, history = await self.offload(self.lookup, user_message, session_id)
+        if ai_response is None and not await self.acquire():
+            return self.busy()
+
+        response = web.StreamResponse(headers={
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        if ai_response is not None:
+            await response.prepare(request)
+            chat_app.audit_outbox.emit(ai_response, is_user=False)
+            await self.offload(chat_app.remember, session_id, user_message, ai_response)
+            await response.write(chat_app.sse('block', {'html': chat_app.render_markdown(ai_response), 'pending': ''}).encode('utf-8'))
+            await response.write(chat_app.sse('done', {}).encode('utf-8'))
+            self.completed += 1
+            return response
+
+        renderer = MarkdownStream(chat_app.markdown_renderer)
+        try:
+            await response.prepare(request)
+            start = time.perf_counter()
+            await asyncio.wait_for(self.relay(response, user_message, history, renderer), self.request_timeout)
+            chat_app.LLM_LATENCY.since(start)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            await response.write(chat_app.sse('error', {'error': 'The assistant took too long to answer. Please try again.'}).encode('utf-8'))
+            return response
+        except (asyncio.CancelledError, ConnectionResetError):
+            # The client went away; the LLM stream is closed with the task
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Error details: {str(e)}")
+            await response.write(chat_app.sse('error', {'error': 'An error occurred while processing your request. Please try again later.'}).encode('utf-8'))
+            return response
+        finally:
+            self.release()
+
+        # Only complete answers are audited, cached and remembered
+        ai_response = renderer.text
+        if not history:
+            await self.offload(chat_app.response_cache.put, user_message, ai_response, time.perf_counter() - start)
+        chat_app.audit_outbox.emit(ai_response, is_user=False)
+        await self.offload(chat_app.remember, session_id, user_message, ai_response)
+        self.completed += 1
+        return response
+
+    async def relay(self, response, user_message, history, renderer):
+        """Forward a streamed completion to the client as Server-Sent Events"""
+        async for text in self.llm.stream(chat_app.build_messages(user_message, history)):
+            html = renderer.feed(text)
+            if html:
+                event = chat_app.sse('block', {'html': html, 'pending': renderer.pending})
+            else:
+                event = chat_app.sse('delta', {'text': text})
+            await response.write(event.encode('utf-8'))
+        html = renderer.close()
+        if html:
+            await response.write(chat_app.sse('block', {'html': html, 'pending': ''}).encode('utf-8'))
+        await response.write(chat_app.sse('done', {}).encode('utf-8'))
+
+    async def metrics(self, request):
+        """Counters, gauges and latency histograms in the Prometheus text format"""
+        return web.Response(body=REGISTRY.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+    async def status(self, request):
+        return web.json_response({
+            'mcp_pool': chat_app.mcp_pool.stats(),
+            'audit_outbox': chat_app.audit_outbox.stats(),
+            'fast_path': chat_app.fast_path.stats(),
+            'response_cache': chat_app.response_cache.stats(),
+            'single_flight': self.flights.stats(),
+            'conversations': chat_app.conversations.stats(),
+            'llm': self.stats()
+        })
+
+    def stats(self):
+        """LLM concurrency and outcome counters"""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'active': self.active,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'cancelled': self.cancelled,
+            'errors': self.errors
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the banking assistant from an asyncio event loop")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv("LLM_CONCURRENCY", "64")),
+                        help="LLM calls in flight at once")
+    parser.add_argument('--queue-timeout', type=float, default=1.0,
+                        help="seconds to wait for an LLM slot before answering 503")
+    parser.add_argument('--timeout', type=float, default=float(os.getenv("LLM_TIMEOUT", "30")),
+                        help="seconds per LLM call before answering 504")
+    parser.add_argument('--backlog', type=int, default=1024, help="accept queue size")
+    parser.add_argument('--connections', type=int, help="pooled connections to Azure OpenAI, defaults to --concurrency")
+    args = parser.parse_args()
+
+    server = AsyncChatServer(
+        AsyncLLMClient(max_connections=args.connections or args.concurrency, timeout=args.timeout),
+        max_concurrency=args.concurrency,
+        queue_timeout=args.queue_timeout,
+        request_timeout=args.timeout
+    )
+    web.run_app(server.make_app(), host=args.host, port=args.port, backlog=args.backlog,
+                handler_cancellation=True)
@@ -0,0 +1,207 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# When to fsync written batches
+FSYNC_NEVER = 'never'        # Leave it to the OS page cache
+FSYNC_BATCH = 'batch'        # After every batch written
+FSYNC_INTERVAL = 'interval'  # At most once per fsync_interval seconds
+FSYNC_POLICIES = (FSYNC_NEVER, FSYNC_BATCH, FSYNC_INTERVAL)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class AuditLogWriter:
+    """Background writer for JSON audit records.
+
+    Producers only append ``(time, record)`` to a deque, which is atomic and
+    takes no lock, so ``write`` stays cheap on the message hot path. A writer
+    thread serializes the queued records and writes them as one batch every
+    ``flush_interval`` seconds, rotating the file once it exceeds
+    ``max_bytes``. Lines keep the format of the logging handlers this
+    replaces: ``<asctime> - <json>``, or bare JSON with
+    ``timestamp_prefix=False``. If the file is renamed or removed by
+    something else, such as log retention, the next batch reopens the path.
+    """
+
+    def __init__(self, path, flush_interval=0.2, fsync=FSYNC_NEVER, fsync_interval=1.0,
+                 max_bytes=50 * 1024 * 1024, backup_count=5, timestamp_prefix=True,
+                 batch_size=5000):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.timestamp_prefix = timestamp_prefix
+        self.batch_size = batch_size
+        self.written = 0
+        self.batches = 0
+        self.rotations = 0
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._flushed = threading.Condition()
+        self._last_fsync = time.monotonic()
+        self._stream = None
+        self.running = True
+        self._thread = threading.Thread(target=self.run, name=f"audit-log-{os.path.basename(path)}")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Records waiting to be written"""
+        return len(self._pending)
+
+    def write(self, record):
+        """Queue a JSON-serializable record"""
+        self._pending.append((time.time(), record))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written"""
+        target = self.written + len(self._pending)
+        with self._flushed:
+            self._wakeup.set()
+            return self._flushed.wait_for(lambda: self.written >= target or not self.running, timeout)
+
+    def close(self):
+        """Write what is queued and stop the writer thread"""
+        if not self.running:
+            return
+        self.running = False
+        self._wakeup.set()
+        self._thread.join()
+
+    def run(self):
+        """Write queued records in batches until closed"""
+        while self.running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._write_logged()
+        self._write_logged()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        with self._flushed:
+            self._flushed.notify_all()
+
+    def _write_logged(self):
+        try:
+            self.write_pending()
+        except OSError as e:
+            logging.error(f"Error writing {self.path}: {e}")
+
+    def write_pending(self):
+        """Serialize and write every queued record as one batch"""
+        pending = self._pending
+        if not pending:
+            return
+        lines = []
+        dumps = json.dumps
+        last_second, second_text = None, ''
+        try:
+            while True:
+                created, record = pending.popleft()
+                if not self.timestamp_prefix:
+                    lines.append(dumps(record) + '\n')
+                    continue
+                # strftime only once per second of records
+                second = int(created)
+                if second != last_second:
+                    last_second = second
+                    second_text = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+                lines.append(f"{second_text},{int((created - second) * 1000):03d} - {dumps(record)}\n")
+        except IndexError:
+            pass
+
+        stream = self._open()
+        stream.write(''.join(lines))
+        stream.flush()
+        if self.fsync == FSYNC_BATCH or (
+                self.fsync == FSYNC_INTERVAL and time.monotonic() - self._last_fsync >= self.fsync_interval):
+            os.fsync(stream.fileno())
+            self._last_fsync = time.monotonic()
+        self.batches += 1
+        if self.max_bytes and stream.tell() >= self.max_bytes:
+            self.rotate()
+
+        with self._flushed:
+            self.written += len(lines)
+            self._flushed.notify_all()
+
+    def rotate(self):
+        """Shift path -> path.1 -> ... -> path.<backup_count> and start a new file"""
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            if os.path.exists(self.path):
+                os.replace(self.path, f"{self.path}.1")
+        else:
+            open(self.path, 'w').close()
+        self.rotations += 1
+
+    def _open(self):
+        if self._stream is not None and self._moved():
+            self._stream.close()
+            self._stream = None
+        if self._stream is None:
+            self._stream = open(self.path, 'a', encoding='utf-8')
+        return self._stream
+
+    def _moved(self):
+        """Whether the path no longer names the open file"""
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self._stream.fileno())
+        return (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def stats(self):
+        """Queue depth and write counters"""
+        return {
+            'path': self.path,
+            'depth': self.depth,
+            'written': self.written,
+            'batches': self.batches,
+            'rotations': self.rotations
+        }
+
+
+def get_audit_log(path, writer_class=AuditLogWriter, **kwargs):
+    """Return the process-wide writer for ``path``, creating it on first use.
+
+    Sharing one writer per file keeps records from several servers or
+    clients in the same process from interleaving partial batches.
+    ``writer_class`` picks an AuditLogWriter subclass such as ChatStore.
+    """
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or not writer.running:
+            writer = _writers[key] = writer_class(path, **kwargs)
+        return writer
+
+
+@atexit.register
+def close_all():
+    """Flush and stop every shared writer"""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for writer in writers:
+        writer.close()
@@ -0,0 +1,222 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import wait
+from datetime import datetime
+from audit_log import get_audit_log
+from mcp_client import AckTimeout, CLIENT_MESSAGE_LOG, outgoing_chat_entry
+from mcp_pool import PoolTimeout
+from tracing import current_trace_id
+
+
+class AuditOutbox:
+    """Bounded in-process outbox for chat messages bound for the MCP server.
+
+    Request threads only enqueue; a background sender drains the outbox in
+    batches over a pooled connection. A message counts as delivered once
+    the server acknowledges it. Whatever is not acknowledged is retried
+    every ``retry_interval`` seconds and then appended to an on-disk
+    journal, which is replayed in order once the server accepts messages
+    again. A message reaches client_messages.log once, when the outbox
+    accepts it, however many times it is sent. Messages emitted during a
+    traced request carry its trace ID, and with a ``tracer`` the time they
+    spent queued and being sent is recorded against that trace.
+    """
+
+    def __init__(self, pool, max_size=10000, batch_size=100, retries=1, retry_interval=1.0,
+                 checkout_timeout=1.0, ack_timeout=10.0, journal_path=os.path.join('logs', 'mcp_outbox.journal'),
+                 tracer=None):
+        self.pool = pool
+        self.tracer = tracer
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_interval = retry_interval
+        self.checkout_timeout = checkout_timeout
+        self.ack_timeout = ack_timeout
+        self.message_log = get_audit_log(CLIENT_MESSAGE_LOG, timestamp_prefix=False)
+        self.journal_path = journal_path
+        self.sent = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.send_failures = 0
+        self.running = True
+        self._queue = queue.Queue(maxsize=max_size)
+        self._journal_pending = self._count_journal()
+        self._thread = threading.Thread(target=self.run, name='mcp-outbox')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Messages waiting in memory"""
+        return self._queue.qsize()
+
+    def emit(self, content, is_user=True, **fields):
+        """Queue a chat message without blocking, returns False if the outbox is full"""
+        message = {
+            'type': 'chat',
+            'content': content,
+            'is_user': is_user,
+            'timestamp': datetime.now().isoformat(),
+            **fields
+        }
+        trace_id = current_trace_id()
+        if trace_id is not None:
+            message['trace_id'] = trace_id
+        try:
+            self._queue.put_nowait(message)
+            self.message_log.write(outgoing_chat_entry(content, is_user, message['timestamp']))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            logging.error("MCP outbox full, dropping chat message")
+            return False
+
+    def close(self, timeout=5.0):
+        """Stop the sender, spilling anything it could not deliver"""
+        if not self.running:
+            return
+        self.running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def run(self):
+        """Send queued messages in batches until closed"""
+        while True:
+            # Wake up periodically only while there is a journal to replay
+            timeout = self.retry_interval if self._journal_pending else None
+            try:
+                first = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self.replay_journal()
+                continue
+
+            batch = [] if first is None else [first]
+            while len(batch) < self.batch_size:
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message is not None:
+                    batch.append(message)
+
+            # Older journaled messages go first to keep the audit trail in order
+            if self._journal_pending and not self.replay_journal():
+                self.spill(batch)
+            elif batch:
+                undelivered = self.send(batch, self.retries)
+                self.sent += len(batch) - len(undelivered)
+                self.spill(undelivered)
+
+            if not self.running and self._queue.empty():
+                break
+
+    def send(self, batch, retries=0):
+        """Send one batch over a pooled connection, returns the messages the server did not acknowledge"""
+        start = time.perf_counter()
+        reconnects = self.pool.reconnects
+        for attempt in range(retries + 1):
+            if attempt:
+                time.sleep(self.retry_interval)
+            futures = None
+            try:
+                with self.pool.connection(timeout=self.checkout_timeout) as client:
+                    if client.connected:
+                        futures = client.send_batch_async(batch, self.ack_timeout)
+            except (PoolTimeout, AckTimeout):
+                pass
+            if futures is not None:
+                # The connection goes back to the pool while the acks are awaited
+                wait(futures, timeout=self.ack_timeout + 1.0)
+                acked = [future.done() and future.exception() is None for future in futures]
+                self.trace_send([message for message, ok in zip(batch, acked) if ok], time.perf_counter() - start,
+                                attempt, self.pool.reconnects - reconnects)
+                # A shed or unacknowledged message is sent again; an acknowledged one never is
+                batch = [message for message, ok in zip(batch, acked) if not ok]
+                if not batch:
+                    return batch
+            self.send_failures += 1
+        return batch
+
+    def trace_send(self, batch, duration, retries, reconnects):
+        """Record the queueing and send time of traced messages"""
+        if self.tracer is None:
+            return
+        now = datetime.now()
+        for message in batch:
+            if 'trace_id' in message:
+                queued = (now - datetime.fromisoformat(message['timestamp'])).total_seconds() - duration
+                self.tracer.record(message['trace_id'], 'mcp.outbox_send', duration, batch=len(batch),
+                                   queued_ms=round(max(queued, 0.0) * 1000, 3), retries=retries,
+                                   reconnects=reconnects)
+
+    def spill(self, batch):
+        """Append undeliverable messages to the on-disk journal"""
+        if not batch:
+            return
+        try:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                journal.write(''.join(json.dumps(message) + '\n' for message in batch))
+        except OSError as e:
+            self.dropped += len(batch)
+            logging.error(f"Could not spill {len(batch)} chat messages to {self.journal_path}: {e}")
+            return
+        self.spilled += len(batch)
+        self._journal_pending += len(batch)
+        logging.warning(f"MCP server unreachable, journaled {len(batch)} chat messages")
+
+    def replay_journal(self):
+        """Resend journaled messages, returns True once the journal is empty"""
+        if not self._journal_pending:
+            return True
+        try:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                messages = [json.loads(line) for line in journal if line.strip()]
+        except FileNotFoundError:
+            self._journal_pending = 0
+            return True
+
+        delivered = 0
+        remaining = []
+        for start in range(0, len(messages), self.batch_size):
+            batch = messages[start:start + self.batch_size]
+            undelivered = self.send(batch)
+            delivered += len(batch) - len(undelivered)
+            if undelivered:
+                remaining = undelivered + messages[start + self.batch_size:]
+                break
+        if remaining:
+            # Keep only what is still undelivered
+            with open(self.journal_path, 'w', encoding='utf-8') as journal:
+                journal.write(''.join(json.dumps(message) + '\n' for message in remaining))
+        else:
+            os.remove(self.journal_path)
+        if delivered:
+            logging.info(f"Replayed {delivered} journaled chat messages to the MCP server")
+        self.replayed += delivered
+        self.sent += delivered
+        self._journal_pending = len(remaining)
+        return not remaining
+
+    def _count_journal(self):
+        try:
+            with open(self.journal_path, encoding='utf-8') as journal:
+                return sum(1 for line in journal if line.strip())
+        except FileNotFoundError:
+            return 0
+
+    def stats(self):
+        """Outbox depth and delivery counters"""
+        return {
+            'depth': self.depth,
+            'sent': self.sent,
+            'spilled': self.spilled,
+            'replayed': self.replayed,
+            'journal_pending': self._journal_pending,
+            'dropped': self.dropped,
+            'send_failures': self.send_failures
+        }
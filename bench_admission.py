@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import aiohttp
+from bench_async_mode import SYNC_SERVER, launch
+from load_generator import free_port, percentile, raise_file_limit, start_server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+async def drive(port, rate, duration, timeout):
+    """Send unique questions to /chat at a fixed arrival rate, whether or not earlier ones were answered"""
+    latencies = []
+    statuses = {}
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def request(index):
+            # Unique questions miss the fast path and the response cache
+            message = f"Can you help me plan my savings? (request {index})"
+            start = time.perf_counter()
+            try:
+                async with session.post(f'http://127.0.0.1:{port}/chat', json={'message': message}) as response:
+                    await response.read()
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                status = 'error'
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        tasks = []
+        start = time.perf_counter()
+        for index in range(int(rate * duration)):
+            # Open loop: arrivals follow the schedule even while the server falls behind
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(request(index)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def run(name, admission_env, args, env, workdir):
+    port = free_port()
+    server = launch([sys.executable, '-c', SYNC_SERVER, str(port)], port, dict(env, **admission_env), workdir)
+    try:
+        latencies, statuses, elapsed = asyncio.run(drive(port, args.rate, args.duration, args.timeout))
+    finally:
+        server.terminate()
+        server.wait()
+    ok = statuses.get(200, 0)
+    shed = statuses.get(429, 0)
+    failed = ', '.join(f"{status}: {count}" for status, count in statuses.items() if status not in (200, 429)) or '-'
+    print(f"{name:<10} {ok / elapsed:>8,.1f} {percentile(latencies, 50):>8.0f} {percentile(latencies, 99):>8.0f} "
+          f"{max(latencies, default=0):>8.0f} {ok:>6} {shed:>6}   {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat under overload with and without admission control")
+    parser.add_argument('--rate', type=float, default=80, help="requests per second offered")
+    parser.add_argument('--duration', type=float, default=20, help="seconds of load")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument('--llm-capacity', type=int, default=8, help="requests the stub LLM answers at once")
+    parser.add_argument('--latency-target', type=float, default=0.5,
+                        help="CHAT_LATENCY_TARGET, seconds, with admission control on")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    raise_file_limit()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, 'logs'))
+        stub_port = free_port()
+        mcp_port = free_port()
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            ENDPOINT_URL=f'http://127.0.0.1:{stub_port}',
+            AZURE_OPENAI_API_KEY='stub',
+            DEPLOYMENT_NAME='stub',
+            MCP_PORT=str(mcp_port),
+            LLM_TIMEOUT=str(args.timeout)
+        )
+        mcp_server = start_server('async', mcp_port, 1024, workdir)
+        stub = launch([sys.executable, os.path.join(ROOT, 'stub_llm_server.py'), '--host', '127.0.0.1',
+                       '--port', str(stub_port), '--latency', str(args.llm_latency),
+                       '--capacity', str(args.llm_capacity)], stub_port, env, workdir)
+        try:
+            capacity = args.llm_capacity / args.llm_latency
+            print(f"{args.rate:.0f} req/s offered for {args.duration:.0f}s to an LLM that answers "
+                  f"{capacity:.0f} req/s ({args.llm_capacity} at a time, {args.llm_latency * 1000:.0f} ms each)")
+            print(f"{'admission':<10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'ok':>6} {'429':>6}   failures")
+            # A limit far above the offered load never sheds
+            run('off', {'CHAT_MAX_CONCURRENCY': '100000', 'CHAT_LATENCY_TARGET': '1000000'}, args, env, workdir)
+            run('on', {'CHAT_LATENCY_TARGET': str(args.latency_target)}, args, env, workdir)
+        finally:
+            stub.terminate()
+            stub.wait()
+            mcp_server.terminate()
+            mcp_server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import aiohttp
+from load_generator import free_port, percentile, raise_file_limit, rss_mb, start_server
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The current serving mode: Flask's threaded development server
+SYNC_SERVER = "import sys, app; app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+
+
+def launch(command, port, env, workdir):
+    """Start a server process and wait until it accepts connections"""
+    process = subprocess.Popen(command, cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', port)).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{command[1]} did not start")
+
+
+async def drive(port, requests, concurrency, timeout):
+    """Send ``requests`` unique questions to /chat from ``concurrency`` clients at once"""
+    latencies = []
+    statuses = {}
+    counter = iter(range(requests))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def client():
+            for index in counter:
+                # Unique questions miss the fast path and the response cache
+                message = f"Can you help me plan my savings? (request {index})"
+                start = time.perf_counter()
+                try:
+                    async with session.post(f'http://127.0.0.1:{port}/chat', json={'message': message}) as response:
+                        await response.read()
+                        status = response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    status = 'error'
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def run(mode, args, env, workdir):
+    port = free_port()
+    if mode == 'sync':
+        command = [sys.executable, '-c', SYNC_SERVER, str(port)]
+    else:
+        command = [sys.executable, os.path.join(ROOT, 'async_app.py'), '--host', '127.0.0.1',
+                   '--port', str(port), '--concurrency', str(args.llm_concurrency),
+                   '--queue-timeout', str(args.timeout)]
+    server = launch(command, port, env, workdir)
+    try:
+        latencies, statuses, elapsed = asyncio.run(drive(port, args.requests, args.concurrency, args.timeout))
+        rss = rss_mb(server.pid) or 0
+    finally:
+        server.terminate()
+        server.wait()
+    ok = statuses.get(200, 0)
+    failed = ', '.join(f"{status}: {count}" for status, count in statuses.items() if status != 200) or '-'
+    print(f"{mode:<6} {ok / elapsed:>8,.1f} {percentile(latencies, 50):>8.0f} "
+          f"{percentile(latencies, 99):>8.0f} {rss:>8.1f} {ok:>6}   {failed}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync Flask vs async serving mode load test against a stub LLM")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200, help="concurrent HTTP clients")
+    parser.add_argument('--llm-latency', type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument('--llm-concurrency', type=int, default=256, help="async mode LLM calls in flight")
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--modes', nargs='+', default=['sync', 'async'])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    raise_file_limit()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.makedirs(os.path.join(workdir, 'logs'))
+        stub_port = free_port()
+        mcp_port = free_port()
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            ENDPOINT_URL=f'http://127.0.0.1:{stub_port}',
+            AZURE_OPENAI_API_KEY='stub',
+            DEPLOYMENT_NAME='stub',
+            MCP_PORT=str(mcp_port)
+        )
+        mcp_server = start_server('async', mcp_port, 1024, workdir)
+        stub = launch([sys.executable, os.path.join(ROOT, 'stub_llm_server.py'), '--host', '127.0.0.1',
+                       '--port', str(stub_port), '--latency', str(args.llm_latency)], stub_port, env, workdir)
+        try:
+            print(f"{args.requests} requests from {args.concurrency} clients, stub LLM latency "
+                  f"{args.llm_latency * 1000:.0f} ms")
+            print(f"{'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'ok':>6}   failures")
+            for mode in args.modes:
+                run(mode, args, env, workdir)
+        finally:
+            stub.terminate()
+            stub.wait()
+            mcp_server.terminate()
+            mcp_server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from audit_log import AuditLogWriter, FSYNC_POLICIES, FSYNC_NEVER
+
+
+def sample_record(index):
+    """A chat record shaped like the ones MCPServer writes"""
+    return {
+        'timestamp': '2024-01-01T12:00:00.000000',
+        'client': "('127.0.0.1', 50000)",
+        'content': f'What are your branch opening hours on Saturday? ({index})',
+        'type': 'user_message'
+    }
+
+
+def bench_logging(path, count):
+    """Per-message json.dumps plus a synchronous logging.FileHandler write"""
+    logger = logging.getLogger('bench.audit')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
+    logger.addHandler(handler)
+
+    start = time.perf_counter()
+    for index in range(count):
+        logger.info(json.dumps(sample_record(index)))
+    elapsed = time.perf_counter() - start
+
+    logger.removeHandler(handler)
+    handler.close()
+    return elapsed, elapsed
+
+
+def bench_writer(path, count, flush_interval, fsync):
+    """Queue records on an AuditLogWriter and wait for them to reach the file"""
+    writer = AuditLogWriter(path, flush_interval=flush_interval, fsync=fsync, max_bytes=0)
+    start = time.perf_counter()
+    for index in range(count):
+        writer.write(sample_record(index))
+    produced = time.perf_counter() - start
+    writer.flush()
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return produced, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat audit log write benchmark")
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--flush-interval', type=float, default=0.2)
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default=FSYNC_NEVER)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [
+            ('logging.FileHandler', bench_logging(os.path.join(workdir, 'logging.log'), args.messages)),
+            ('AuditLogWriter', bench_writer(os.path.join(workdir, 'writer.log'), args.messages,
+                                            args.flush_interval, args.fsync))
+        ]
+        print(f"{args.messages} records, fsync={args.fsync}")
+        print(f"{'writer':<20} {'caller msg/s':>14} {'on disk msg/s':>14}")
+        for name, (produced, elapsed) in results:
+            print(f"{name:<20} {args.messages / produced:>14,.0f} {args.messages / elapsed:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import logging
+import threading
+import time
+from types import SimpleNamespace
+import app as chat_app
+from mcp_server import MCPServer
+from mcp_client import MCPClient
+from mcp_pool import MCPClientPool
+from audit_outbox import AuditOutbox
+from load_generator import percentile
+
+
+def stub_completion(latency):
+    """Replacement for openai.ChatCompletion.create that answers after ``latency`` seconds"""
+    def create(**kwargs):
+        if latency:
+            time.sleep(latency)
+        message = SimpleNamespace(content="Our branches are open 9:00 AM - 5:00 PM EST on weekdays.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    return create
+
+
+class ReconnectPerRequest:
+    """The original behaviour: a shared client that sends synchronously and
+    is disconnected after every request"""
+
+    def __init__(self, port):
+        self.client = MCPClient(port=port)
+
+    def emit(self, content, is_user=True):
+        if not self.client.connected:
+            self.client.connect()
+        return self.client.send_chat_message(content, is_user=is_user)
+
+    def teardown(self, exception=None):
+        self.client.disconnect()
+
+
+class SynchronousPool:
+    """Sends synchronously from the request thread over pooled connections"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def emit(self, content, is_user=True):
+        with self.pool.connection() as client:
+            return client.send_chat_message(content, is_user=is_user)
+
+
+def run(label, requests):
+    """Time sequential /chat requests through the Flask test client"""
+    client = chat_app.app.test_client()
+    timings = []
+    for index in range(requests):
+        start = time.perf_counter()
+        response = client.post('/chat', json={'message': f'What are your opening hours? {index}'})
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat failed with {response.status_code}")
+    total = sum(timings)
+    print(f"{label:<22} {requests / total * 1000:>8,.0f} req/s {total / requests:>8.3f} "
+          f"{percentile(timings, 50):>8.3f} {percentile(timings, 99):>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat MCP connection overhead benchmark")
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="stubbed LLM latency in seconds")
+    parser.add_argument('--pool-size', type=int, default=4)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    chat_app.openai.ChatCompletion.create = stub_completion(args.llm_latency)
+
+    server = MCPServer(port=0)
+    server_thread = threading.Thread(target=server.start)
+    server_thread.daemon = True
+    server_thread.start()
+    while not server.running:
+        time.sleep(0.01)
+
+    reconnecting = ReconnectPerRequest(server.port)
+    # Teardown hooks have to be registered before the app serves its first request
+    chat_app.app.teardown_appcontext(
+        lambda exception: chat_app.audit_outbox is reconnecting and reconnecting.teardown(exception)
+    )
+
+    print(f"{'mode':<22} {'throughput':>14} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    chat_app.audit_outbox = reconnecting
+    run('reconnect per request', args.requests)
+
+    pool = MCPClientPool(size=args.pool_size, port=server.port)
+    chat_app.audit_outbox = SynchronousPool(pool)
+    run(f'pool of {args.pool_size}', args.requests)
+
+    chat_app.audit_outbox = AuditOutbox(pool)
+    run(f'pool of {args.pool_size} + outbox', args.requests)
+    chat_app.audit_outbox.close()
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
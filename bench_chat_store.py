@@ -0,0 +1,150 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from audit_log import AuditLogWriter
+from chat_store import ChatStore
+from load_generator import percentile
+
+QUESTIONS = [
+    "Is the outage affecting my card payments?",
+    "What are your branch opening hours on Saturday?",
+    "How do I dispute a transaction on my statement?",
+    "Can I increase the limit on my credit card?",
+    "Why was my transfer to another bank delayed?",
+]
+ANSWERS = [
+    "Card payments are working again; pending payments will complete within the hour.",
+    "Most branches open from 9:00 AM to 1:00 PM on Saturday.",
+    "You can dispute a transaction from the statements page of online banking or by phone.",
+    "Credit limit increases can be requested in the mobile app under card settings.",
+    "Transfers to other banks made after 5:00 PM are processed on the next business day.",
+]
+
+
+def sample_records(rows, clients, days):
+    """Chat records spread evenly over ``days`` days, a question and its answer per client turn"""
+    start = datetime.now() - timedelta(days=days)
+    step = days * 86400 / rows
+    rng = random.Random(1)
+    for index in range(rows):
+        topic = rng.randrange(len(QUESTIONS))
+        is_user = index % 2 == 0
+        yield {
+            'timestamp': (start + timedelta(seconds=index * step)).isoformat(),
+            'client': f"('10.0.{(index // 2) % clients // 250}.{(index // 2) % clients % 250}', 50000)",
+            'content': f"{QUESTIONS[topic] if is_user else ANSWERS[topic]} (ref {index})",
+            'type': 'user_message' if is_user else 'ai_response'
+        }
+
+
+def load(writer, rows, clients, days, chunk=100000):
+    """Write every record, waiting for each chunk so the queue stays bounded"""
+    start = time.perf_counter()
+    for index, record in enumerate(sample_records(rows, clients, days), 1):
+        writer.write(record)
+        if index % chunk == 0:
+            writer.flush()
+    writer.flush()
+    return rows / (time.perf_counter() - start)
+
+
+def time_query(fn, runs):
+    timings = []
+    matched = 0
+    for run in range(runs):
+        start = time.perf_counter()
+        matched += fn(run)
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentile(timings, 50), percentile(timings, 99), matched / runs
+
+
+def scan_log(path, client):
+    """The current way to find a client's messages: read the whole log"""
+    needle = f'"client": "{client}"'
+    with open(path, encoding='utf-8') as stream:
+        return sum(1 for line in stream if needle in line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat history store insert throughput and query latency")
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--clients', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--runs', type=int, default=50, help="runs of each query")
+    parser.add_argument('--skip-scan', action='store_true', help="skip the chat_history.log scan baseline")
+    parser.add_argument('--dir', help="where to create the database, a temporary directory by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as workdir:
+        store = ChatStore(os.path.join(workdir, 'chat_history.db'))
+        rate = load(store, args.rows, args.clients, args.days)
+        size = sum(os.path.getsize(os.path.join(workdir, name)) for name in os.listdir(workdir)) / 2 ** 30
+        print(f"{args.rows:,} rows inserted at {rate:,.0f} rows/s, {size:.2f} GB on disk "
+              f"(full text: {store.full_text})")
+
+        rng = random.Random(2)
+        end = datetime.now()
+        first = end - timedelta(days=args.days)
+
+        def random_client():
+            index = rng.randrange(args.clients)
+            return f"('10.0.{index // 250}.{index % 250}', 50000)"
+
+        def random_time(span):
+            return first + timedelta(seconds=rng.uniform(0, args.days * 86400 - span))
+
+        def client_day(run):
+            since = random_time(86400)
+            return len(store.query(client=random_client(), since=since, until=since + timedelta(days=1), limit=0))
+
+        def client_history(run):
+            return len(store.query(client=random_client(), limit=0))
+
+        def minute_range(run):
+            since = random_time(60)
+            return len(store.query(since=since, until=since + timedelta(minutes=1), limit=0))
+
+        def type_hour_count(run):
+            since = random_time(3600)
+            return store.count(message_type='user_message', since=since, until=since + timedelta(hours=1))
+
+        def search_rare(run):
+            return len(store.query(search=f"{rng.randrange(args.rows)}", limit=100))
+
+        def search_common(run):
+            return len(store.query(search='"card payments"', limit=100, newest_first=True))
+
+        def search_client(run):
+            return len(store.query(client=random_client(), search='transfer', limit=100))
+
+        queries = [
+            ("client, one day", client_day),
+            ("client, all time", client_history),
+            ("one minute, all clients", minute_range),
+            ("count by type, one hour", type_hour_count),
+            ("search, rare term", search_rare),
+            ("search, common phrase", search_common),
+            ("search within a client", search_client),
+        ]
+        print(f"{'query':<26} {'p50 ms':>8} {'p99 ms':>8} {'rows':>8}")
+        for name, fn in queries:
+            p50, p99, matched = time_query(fn, args.runs)
+            print(f"{name:<26} {p50:>8.2f} {p99:>8.2f} {matched:>8.1f}")
+        store.close()
+
+        if not args.skip_scan:
+            log_path = os.path.join(workdir, 'chat_history.log')
+            writer = AuditLogWriter(log_path, max_bytes=0)
+            load(writer, args.rows, args.clients, args.days)
+            writer.close()
+            start = time.perf_counter()
+            matched = scan_log(log_path, random_client())
+            print(f"{'scan chat_history.log':<26} {(time.perf_counter() - start) * 1000:>8.0f} {'':>8} "
+                  f"{matched:>8} ({os.path.getsize(log_path) / 2 ** 30:.2f} GB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from mcp_client import MCPClient
+from mcp_cluster import MCPCluster, REUSE_PORT
+from mcp_protocol import PROTOCOL_COMPACT
+
+
+def drive(port, connections, duration, window, results):
+    """Load process: pipeline system messages on several connections, report how many were acknowledged"""
+    logging.getLogger().setLevel(logging.WARNING)
+    clients = [MCPClient(port=port, protocol=PROTOCOL_COMPACT, max_in_flight=window) for _ in range(connections)]
+    for client in clients:
+        client.connect()
+    deadline = time.monotonic() + duration
+
+    def send(client):
+        index = 0
+        while time.monotonic() < deadline and client.connected:
+            client.send_message_async('system', f'cluster benchmark message {index}')
+            index += 1
+
+    threads = [threading.Thread(target=send, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    acked = sum(client.acks for client in clients)
+    for client in clients:
+        client.disconnect()
+    results.put(acked)
+
+
+def run(processes, args):
+    """Messages per second acknowledged by a cluster of ``processes`` workers"""
+    cluster = MCPCluster(port=0, processes=processes, workers=args.shards)
+    cluster_thread = threading.Thread(target=cluster.start)
+    cluster_thread.start()
+    while not cluster.running:
+        time.sleep(0.01)
+    if not cluster.wait_ready():
+        raise RuntimeError("Cluster workers did not start")
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    loaders = [context.Process(target=drive, args=(cluster.port, args.connections, args.duration, args.window, results))
+               for _ in range(args.load_processes)]
+    start = time.perf_counter()
+    for loader in loaders:
+        loader.start()
+    acked = sum(results.get() for _ in loaders)
+    elapsed = time.perf_counter() - start
+    for loader in loaders:
+        loader.join()
+    cluster.stop()
+    cluster_thread.join()
+    return acked / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP cluster throughput against worker process count")
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4], help="worker counts to compare")
+    parser.add_argument('--load-processes', type=int, default=os.cpu_count(), help="client processes")
+    parser.add_argument('--connections', type=int, default=4, help="connections per client process")
+    parser.add_argument('--window', type=int, default=200, help="messages in flight per connection")
+    parser.add_argument('--shards', type=int, default=2, help="message processing shards per worker")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds of load per run")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    # Worker logs are written under the working directory
+    os.chdir(tempfile.mkdtemp(prefix='mcp-cluster-bench-'))
+    os.makedirs('logs', exist_ok=True)
+
+    print(f"{os.cpu_count()} CPUs, {args.load_processes} client processes x {args.connections} connections, "
+          f"{'SO_REUSEPORT' if REUSE_PORT else 'shared listening socket'}\n")
+    print(f"{'workers':>8} {'msg/s':>12} {'speedup':>8}")
+    baseline = None
+    for processes in args.processes:
+        rate = run(processes, args)
+        baseline = baseline or rate
+        print(f"{processes:>8} {rate:>12,.0f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
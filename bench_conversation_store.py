@@ -0,0 +1,120 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from conversation_store import ConversationStore, count_tokens
+from load_generator import percentile
+
+QUESTIONS = [
+    "Can you help me plan my savings for a house deposit over the next three years?",
+    "What would change if I paid an extra 200 dollars into it every month?",
+    "How does that compare with a fixed-term deposit?",
+    "Is there a penalty if I need to take the money out early?",
+    "And what about the business account I asked about before?",
+]
+ANSWERS = [
+    "Of course. A steady monthly contribution into a high-yield savings account is a good start. "
+    "Setting the transfer up for the day after payday means the money is saved before it can be spent, "
+    "and keeping three to six months of expenses aside covers emergencies without touching the deposit.",
+    "An extra 200 dollars a month adds 7,200 dollars over three years before interest. "
+    "With interest compounding monthly the difference grows a little further, so the deposit target "
+    "could be reached several months sooner. A branch advisor can run the exact figures with you.",
+    "A fixed-term deposit usually pays a higher rate in exchange for locking the money away. "
+    "It suits savings you are sure not to need before the term ends, while a savings account keeps "
+    "the money available. Many customers split their savings between the two.",
+]
+
+
+class NaiveStore:
+    """Unbounded list of turns per session, the whole list sent with every prompt"""
+
+    def __init__(self):
+        self._sessions = {}
+
+    def history(self, session_id):
+        return list(self._sessions.get(session_id, []))
+
+    def add_exchange(self, session_id, user_message, ai_response):
+        turns = self._sessions.setdefault(session_id, [])
+        turns.append({'role': 'user', 'content': user_message})
+        turns.append({'role': 'assistant', 'content': ai_response})
+
+
+def converse(store, sessions, exchanges, checkpoints, samples):
+    """Interleave ``exchanges`` exchanges across ``sessions`` sessions, sampling history builds at the checkpoints"""
+    rng = random.Random(1)
+    # Distinct strings, as each message arrives as its own request body
+    texts = [(f"{rng.choice(QUESTIONS)} ({index})", f"{rng.choice(ANSWERS)} ({index})") for index in range(997)]
+    results = []
+    base = tracemalloc.get_traced_memory()[0]
+    add_time = 0.0
+    for exchange in range(1, exchanges + 1):
+        start = time.perf_counter()
+        for session in range(sessions):
+            user_message, ai_response = texts[(session * 31 + exchange) % len(texts)]
+            store.add_exchange(f'session-{session}', user_message + ' ', ai_response + ' ')
+        add_time += time.perf_counter() - start
+        if exchange in checkpoints:
+            memory = tracemalloc.get_traced_memory()[0] - base
+            timings = []
+            tokens = []
+            for session in rng.sample(range(sessions), min(samples, sessions)):
+                start = time.perf_counter()
+                history = store.history(f'session-{session}')
+                timings.append((time.perf_counter() - start) * 1_000_000)
+                tokens.append(sum(count_tokens(message['content']) for message in history))
+            results.append((exchange, sum(timings) / len(timings), percentile(timings, 99),
+                            sum(tokens) / len(tokens), memory / sessions / 1024))
+    return results, sessions * exchanges * 2 / add_time
+
+
+def report(name, results, adds_per_second):
+    print(f"{name}: {adds_per_second:,.0f} turns added/s")
+    print(f"  {'turns':>6} {'build us':>9} {'p99 us':>8} {'prompt tok':>11} {'KB/session':>11}")
+    for exchange, mean, p99, tokens, memory in results:
+        print(f"  {exchange * 2:>6} {mean:>9.1f} {p99:>8.1f} {tokens:>11,.0f} {memory:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation store prompt-build time and memory per session")
+    parser.add_argument('--sessions', type=int, default=10000)
+    parser.add_argument('--turns', type=int, default=50, help="turns per session, a question and its answer each count")
+    parser.add_argument('--samples', type=int, default=1000, help="history builds timed at each checkpoint")
+    parser.add_argument('--token-budget', type=int, default=1500)
+    parser.add_argument('--skip-naive', action='store_true', help="only run the conversation store")
+    args = parser.parse_args()
+
+    exchanges = args.turns // 2
+    checkpoints = sorted({max(1, exchanges // 10), exchanges // 2, exchanges})
+    print(f"{args.sessions:,} sessions x {exchanges * 2} turns, token budget {args.token_budget}")
+
+    tracemalloc.start()
+    store = ConversationStore(max_sessions=args.sessions, token_budget=args.token_budget)
+    results, rate = converse(store, args.sessions, exchanges, checkpoints, args.samples)
+    report("ConversationStore", results, rate)
+    stats = store.stats()
+    print(f"  {stats['summarized']:,} turns condensed into summaries")
+    del store
+
+    if not args.skip_naive:
+        naive = NaiveStore()
+        results, rate = converse(naive, args.sessions, exchanges, checkpoints, args.samples)
+        report("Unbounded list", results, rate)
+        del naive
+    tracemalloc.stop()
+
+    # A tenth of the sessions fit in memory; the rest spill to SQLite and load back
+    with tempfile.TemporaryDirectory() as workdir:
+        store = ConversationStore(max_sessions=args.sessions // 10, token_budget=args.token_budget,
+                                  spill_path=os.path.join(workdir, 'sessions.db'))
+        _, rate = converse(store, args.sessions, 3, set(), 0)
+        stats = store.stats()
+        print(f"Spill to SQLite ({args.sessions // 10:,} in memory): {rate:,.0f} turns added/s, "
+              f"{stats['spilled']:,} spilled, {stats['loaded']:,} loaded")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import logging
+import selectors
+import socket
+import threading
+import time
+from mcp_server import MCPServer, MODE_THREAD, MODE_ASYNC
+from mcp_client import MCPClient
+from mcp_fanout import POLICIES, POLICY_DROP_OLDEST
+from mcp_protocol import MessageDecoder, PROTOCOL_FRAMED
+from load_generator import raise_file_limit
+
+
+def start_server(mode, max_queue, policy):
+    """Start an MCP server on an ephemeral local port"""
+    server = MCPServer(port=0, mode=mode, max_client_queue=max_queue, slow_client_policy=policy)
+    server_thread = threading.Thread(target=server.start)
+    server_thread.daemon = True
+    server_thread.start()
+    while not server.running:
+        time.sleep(0.01)
+    return server
+
+
+class Subscribers:
+    """Many raw client sockets read by a single selector thread"""
+
+    def __init__(self, port, count, slow):
+        self.selector = selectors.DefaultSelector()
+        self.received = {}
+        self.sockets = []
+        for index in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sockets.append(sock)
+            if index < slow:
+                # Slow consumers never read, so their server-side queues fill up
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                sock.connect(('localhost', port))
+                continue
+            sock.connect(('localhost', port))
+            sock.setblocking(False)
+            self.received[sock] = 0
+            self.selector.register(sock, selectors.EVENT_READ, MessageDecoder(PROTOCOL_FRAMED))
+        self.running = True
+        reader_thread = threading.Thread(target=self.read)
+        reader_thread.daemon = True
+        reader_thread.start()
+
+    def read(self):
+        while self.running:
+            for key, _ in self.selector.select(timeout=0.1):
+                try:
+                    if not key.data.recv_from(key.fileobj):
+                        self.selector.unregister(key.fileobj)
+                        continue
+                except BlockingIOError:
+                    continue
+                self.received[key.fileobj] += sum(1 for _ in key.data.messages())
+
+    def wait_for(self, expected, timeout, idle=1.0):
+        """Wait until every reading subscriber has ``expected`` messages.
+
+        Gives up early once nothing has arrived for ``idle`` seconds, which
+        happens when the drop policy discarded messages for some readers.
+        """
+        deadline = time.time() + timeout
+        last_total, last_change = -1, time.time()
+        while min(self.received.values()) < expected:
+            total = sum(self.received.values())
+            if total != last_total:
+                last_total, last_change = total, time.time()
+            if time.time() > deadline or time.time() - last_change > idle:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def close(self):
+        self.running = False
+        for sock in self.sockets:
+            sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Broadcast fan-out benchmark")
+    parser.add_argument('--clients', type=int, default=1000, help="subscribed clients")
+    parser.add_argument('--slow', type=int, default=10, help="subscribers that never read; their queues only fill once the kernel socket buffers (a few MB) are full")
+    parser.add_argument('--broadcasts', type=int, default=200)
+    parser.add_argument('--size', type=int, default=1024, help="broadcast content size in bytes")
+    parser.add_argument('--mode', choices=[MODE_THREAD, MODE_ASYNC], default=MODE_ASYNC)
+    parser.add_argument('--max-queue', type=int, default=1000, help="per-client outbound queue bound")
+    parser.add_argument('--policy', choices=POLICIES, default=POLICY_DROP_OLDEST)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    raise_file_limit()
+
+    server = start_server(args.mode, args.max_queue, args.policy)
+    subscribers = Subscribers(server.port, args.clients, args.slow)
+    publisher = MCPClient(port=server.port)
+    publisher.connect()
+    while len(server.clients) < args.clients + 1:
+        time.sleep(0.01)
+
+    content = 'x' * args.size
+    start = time.perf_counter()
+    for _ in range(args.broadcasts):
+        publisher.send_system_message(content, command='broadcast')
+    completed = subscribers.wait_for(args.broadcasts, args.timeout)
+    elapsed = time.perf_counter() - start
+
+    stats = server.fanout.stats()['clients']
+    slow_clients = {str(sock.getsockname()) for sock in subscribers.sockets[:args.slow]}
+    slow_stats = [client for address, client in stats.items() if address in slow_clients]
+    fast_stats = [client for address, client in stats.items() if address not in slow_clients]
+    readers = args.clients - args.slow
+    delivered = sum(subscribers.received.values())
+    print(f"mode={args.mode} clients={args.clients} slow={args.slow} policy={args.policy}")
+    print(f"broadcasts:         {args.broadcasts}{'' if completed else ' (incomplete)'}")
+    print(f"deliveries:         {delivered} to {readers} reading clients")
+    print(f"elapsed:            {elapsed:.3f} s")
+    print(f"deliveries/s:       {delivered / elapsed:,.0f}")
+    print(f"broadcasts/s:       {args.broadcasts / elapsed:,.0f}")
+    print(f"slow clients:       max depth {max((c['depth'] for c in slow_stats), default=0)}, "
+          f"dropped {sum(c['dropped'] for c in slow_stats)}, "
+          f"disconnected {sum(c['closed'] for c in slow_stats) + args.slow - len(slow_stats)}")
+    print(f"reading clients:    max depth {max((c['depth'] for c in fast_stats), default=0)}, "
+          f"dropped {sum(c['dropped'] for c in fast_stats)}")
+
+    # Unread data makes the closes below look like resets to the server
+    logging.disable(logging.ERROR)
+    publisher.disconnect()
+    subscribers.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import logging
+import time
+import app as chat_app
+from bench_chat_pool import stub_completion
+from bench_response_cache import DiscardOutbox, NoCache
+from fast_path import BankInfoAnswerer
+from load_generator import percentile
+
+# Questions labelled with the intent that should answer them, or None when
+# only the LLM can answer correctly
+LABELLED_QUERIES = [
+    ("What are your opening hours?", 'hours'),
+    ("When are you open?", 'hours'),
+    ("what are your business hours", 'hours'),
+    ("What time do you close?", 'hours'),
+    ("What are your Saturday hours?", 'hours.saturday'),
+    ("Are you open on Saturdays?", 'hours.saturday'),
+    ("Are you open on Sunday?", 'hours.sunday'),
+    ("What time do you open on Monday?", 'hours.weekdays'),
+    ("What are the weekday opening hours?", 'hours.weekdays'),
+    ("Are you open on the weekend?", 'hours.weekend'),
+    ("Where is the Brooklyn branch?", 'branch.brooklyn'),
+    ("Where's the Brooklyn branch located?", 'branch.brooklyn'),
+    ("What is the address of the Manhattan branch?", 'branch.manhattan'),
+    ("Do you have a branch in Queens?", 'branch.queens'),
+    ("Where are your branches?", 'branches'),
+    ("List your branch locations", 'branches'),
+    ("How many branches do you have?", 'branches'),
+    ("What services do you offer?", 'services'),
+    ("What products do you have?", 'services'),
+    ("Do you offer mortgage loans?", 'service.mortgage_loans'),
+    ("Do you offer mortgages?", 'service.mortgage_loans'),
+    ("Do you provide credit cards?", 'service.credit_cards'),
+    ("Do you have mobile banking?", 'service.online_mobile_banking'),
+    ("Do you offer business banking?", 'service.business_banking'),
+    ("Do you offer investment services?", 'service.investment_services'),
+    ("How do I report fraud?", 'support.fraud_reporting'),
+    ("Where do I report a stolen card?", 'support.fraud_reporting'),
+    ("What is the fraud reporting email?", 'support.fraud_reporting'),
+    ("How do I contact technical support?", 'support.technical_support'),
+    ("tech support email", None),
+    ("How can I reach customer service?", 'support.customer_service'),
+    ("customer care email address", None),
+    ("Who do I contact for online banking help?", 'support.online_banking'),
+    ("What is your phone number?", 'phone'),
+    ("Can I call you?", 'phone'),
+    ("What is your email?", 'email'),
+    ("What is your website?", 'website'),
+    ("Where is your headquarters?", 'headquarters'),
+    ("Where is the head office?", 'headquarters'),
+    ("What is my account balance?", None),
+    ("How do I transfer money to another account?", None),
+    ("Why was I charged a fee?", None),
+    ("What is the interest rate on savings accounts?", None),
+    ("My card was stolen, what should I do?", None),
+    ("How do I reset my online banking password?", None),
+    ("Can you explain how a mortgage works?", None),
+    ("What documents do I need to open an account?", None),
+    ("What time does the Queens branch open?", None),
+    ("Are you open on Saturday and Sunday?", None),
+    ("What is the difference between a credit card and a debit card?", None),
+    ("Tell me a joke", None),
+    ("Hello", None),
+    ("Thanks for your help!", None),
+    ("Is it safe to use public wifi for banking?", None),
+    ("How do I dispute a transaction?", None),
+    ("Can I get a loan for a car?", None),
+    ("What is a good way to save for retirement?", None),
+    ("What is the Brooklyn branch phone number?", None),
+    ("Should I invest in stocks or bonds?", None),
+    ("What are your ATM withdrawal limits?", None),
+    ("How do I close a credit card?", None),
+    ("When do mortgage applications close?", None),
+    ("Are you open on Christmas?", None),
+    ("Can I get a loan at the Queens branch?", None),
+    ("Does your website support dark mode?", None),
+    ("Where is the Boston branch?", None),
+    ("Is there a branch near Times Square?", None),
+    ("what services do you not offer", None),
+    ("What time do you close today?", None),
+    ("What is your card services phone number?", None),
+    ("Do you offer investment services to non-residents?", None),
+    ("Do you offer credit cards for students?", None),
+    ("Do you offer mortgage loans outside New York?", None),
+    ("Do you offer crypto services?", None),
+    ("Do you have insurance products?", None),
+    ("What wealth management services do you offer?", None),
+    ("What are your hours?", 'hours'),
+    ("What banking services do you offer?", 'services')
+]
+
+
+def evaluate(answerer, rounds):
+    """Accuracy over the labelled set plus per-query classification latency"""
+    answered = correct = wrong = missed = 0
+    mistakes = []
+    for query, label in LABELLED_QUERIES:
+        intent = answerer.classify(query)
+        name = intent.name if intent is not None else None
+        if name is not None:
+            answered += 1
+            if name == label:
+                correct += 1
+            else:
+                wrong += 1
+                mistakes.append((query, label, name))
+        elif label is not None:
+            missed += 1
+            mistakes.append((query, label, None))
+
+    timings = []
+    for _ in range(rounds):
+        for query, _ in LABELLED_QUERIES:
+            start = time.perf_counter()
+            answerer.answer(query)
+            timings.append((time.perf_counter() - start) * 1_000_000)
+    return answered, correct, wrong, missed, mistakes, timings
+
+
+def time_chat(messages):
+    """Mean /chat latency in milliseconds through the Flask test client"""
+    client = chat_app.app.test_client()
+    start = time.perf_counter()
+    for message in messages:
+        response = client.post('/chat', json={'message': message})
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat failed with {response.status_code}")
+    return (time.perf_counter() - start) * 1000 / len(messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BANK_INFO fast-path accuracy and latency benchmark")
+    parser.add_argument('--rounds', type=int, default=200, help="classification rounds over the query set")
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="stubbed LLM latency in seconds")
+    parser.add_argument('--verbose', action='store_true', help="list misclassified queries")
+    args = parser.parse_args()
+
+    answerer = BankInfoAnswerer(chat_app.BANK_INFO)
+    answered, correct, wrong, missed, mistakes, timings = evaluate(answerer, args.rounds)
+    labelled = sum(1 for _, label in LABELLED_QUERIES if label is not None)
+    print(f"{len(LABELLED_QUERIES)} queries, {labelled} answerable from BANK_INFO, {len(answerer.intents)} intents")
+    print(f"hit rate  {answered / len(LABELLED_QUERIES):>7.1%}")
+    print(f"precision {correct / answered if answered else 0.0:>7.1%}")
+    print(f"recall    {correct / labelled:>7.1%}")
+    print(f"classify  {sum(timings) / len(timings):>7.1f} us mean, {percentile(timings, 99):.1f} us p99")
+    if args.verbose:
+        for query, label, name in mistakes:
+            print(f"  {query!r}: expected {label}, got {name}")
+
+    logging.getLogger().setLevel(logging.WARNING)
+    chat_app.openai.ChatCompletion.create = stub_completion(args.llm_latency)
+    chat_app.audit_outbox = DiscardOutbox()
+    chat_app.response_cache = NoCache()
+    hits = [query for query, label in LABELLED_QUERIES if label is not None and answerer.classify(query)]
+    misses = [query for query, label in LABELLED_QUERIES if label is None]
+    print(f"/chat fast path {time_chat(hits):>8.2f} ms mean")
+    print(f"/chat LLM path  {time_chat(misses):>8.2f} ms mean (stubbed {args.llm_latency * 1000:.0f} ms LLM)")
+
+
+if __name__ == "__main__":
+    main()
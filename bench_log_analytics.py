@@ -0,0 +1,164 @@
+import argparse
+import heapq
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Process, Queue
+from audit_log import AuditLogWriter
+from log_analytics import analyze
+
+QUESTION = "Can you explain the fees on my savings account and how to avoid them? (request {})"
+ANSWER = ("Savings accounts have no monthly fee while the balance stays above 500 dollars. Below that a "
+          "5 dollar fee applies, which is waived for customers under 25 or with a linked checking account. "
+          "(request {})")
+
+
+def generate_logs(directory, megabytes, clients=200, seed=1):
+    """Write chat_history.log, client_messages.log, system.log and mcp_server.log until ``megabytes`` are written.
+
+    Each question is answered after a log-normal gap with a median of two
+    seconds; returns the number of pairs and the true median gap in ms.
+    """
+    rng = random.Random(seed)
+    chat = AuditLogWriter(os.path.join(directory, 'chat_history.log'), max_bytes=0)
+    client_log = AuditLogWriter(os.path.join(directory, 'client_messages.log'), max_bytes=0,
+                                timestamp_prefix=False)
+    system = AuditLogWriter(os.path.join(directory, 'system.log'), max_bytes=0)
+    server = open(os.path.join(directory, 'mcp_server.log'), 'w', encoding='utf-8')
+
+    now = datetime.now() - timedelta(days=1)
+    answers = []  # heap of (time, sequence, client, request)
+    last_answer = {}
+    gaps = []
+    written = 0
+    target = megabytes * 2 ** 20
+    request = 0
+    while written < target:
+        now += timedelta(milliseconds=rng.expovariate(1 / 20))
+        while answers and answers[0][0] <= now:
+            when, _, client, index = heapq.heappop(answers)
+            content = ANSWER.format(index)
+            chat.write({'timestamp': when.isoformat(), 'client': client, 'content': content, 'type': 'ai_response'})
+            client_log.write({'timestamp': when.isoformat(), 'direction': 'outgoing', 'type': 'chat',
+                              'sender': 'assistant', 'content': content})
+            written += 2 * len(content) + 220
+        client = f"('127.0.0.1', {50000 + rng.randrange(clients)})"
+        content = QUESTION.format(request)
+        chat.write({'timestamp': now.isoformat(), 'client': client, 'content': content, 'type': 'user_message'})
+        client_log.write({'timestamp': now.isoformat(), 'direction': 'outgoing', 'type': 'chat',
+                          'sender': 'user', 'content': content})
+        # Answers to one client come back in the order it asked
+        when = max(now + timedelta(milliseconds=rng.lognormvariate(0, 0.5) * 2000),
+                   last_answer.get(client, now) + timedelta(milliseconds=1))
+        last_answer[client] = when
+        gaps.append((when - now).total_seconds() * 1000)
+        heapq.heappush(answers, (when, request, client, request))
+        request += 1
+        written += 2 * len(content) + 220
+        if request % 100 == 0:
+            system.write({'timestamp': now.isoformat(), 'client': client, 'content': 'ping', 'command': 'status'})
+            server.write(f"{now.strftime('%Y-%m-%d %H:%M:%S')},000 - INFO - New client connected from {client}\n")
+        if request % 1000 == 0:
+            server.write(f"{now.strftime('%Y-%m-%d %H:%M:%S')},000 - ERROR - Error handling client {client}: "
+                         f"[Errno 104] Connection reset by peer\n")
+        if request % 50000 == 0:
+            chat.flush()
+            client_log.flush()
+    while answers:
+        when, _, client, index = heapq.heappop(answers)
+        chat.write({'timestamp': when.isoformat(), 'client': client, 'content': ANSWER.format(index),
+                    'type': 'ai_response'})
+    for writer in (chat, client_log, system):
+        writer.close()
+    server.close()
+    gaps.sort()
+    return request, gaps[len(gaps) // 2]
+
+
+def naive(directory):
+    """Read each log into memory and parse every line, as an ad hoc script would"""
+    counts = {}
+    for name in ('chat_history.log', 'client_messages.log', 'system.log', 'mcp_server.log'):
+        with open(os.path.join(directory, name), encoding='utf-8') as stream:
+            lines = stream.readlines()
+        for line in lines:
+            brace = line.find('{')
+            if brace >= 0:
+                record = json.loads(line[brace:])
+                minute = record['timestamp'][:16]
+                counts[minute] = counts.get(minute, 0) + 1
+    return counts
+
+
+def measure(results, name, fn, *args):
+    """Run fn in this child process, reporting elapsed seconds and peak RSS including worker processes"""
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    results.put((name, elapsed, peak / 1024))
+
+
+def run(name, fn, *args):
+    results = Queue()
+    process = Process(target=measure, args=(results, name, fn) + args)
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log analytics throughput, memory and incremental resume benchmark")
+    parser.add_argument('--mb', type=int, default=512, help="MB of chat logs to generate")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--skip-naive', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        pairs, median = generate_logs(directory, args.mb)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 2 ** 20
+        print(f"Generated {size:,.0f} MB of logs, {pairs:,} question/answer pairs, median gap {median:,.0f} ms "
+              f"({time.perf_counter() - start:.0f}s)")
+
+        aggregate, _ = analyze([directory], jobs=1)
+        report = aggregate.report()
+        gap = report['response_gap_ms']
+        print(f"Check: {report['totals']['user']:,} user and {report['totals']['ai']:,} AI messages, "
+              f"{gap['count']:,} pairs, p50 gap {gap['p50']:,.0f} ms, {gap['unmatched']} unmatched")
+
+        state = os.path.join(directory, 'analytics.json')
+        runs = [("log_analytics --jobs 1", analyze, [directory], None, 1)]
+        if args.jobs > 1:
+            runs.append((f"log_analytics --jobs {args.jobs}", analyze, [directory], None, args.jobs))
+        runs.append(("log_analytics --state (first run)", analyze, [directory], state, args.jobs))
+        print(f"\n{'run':<36} {'seconds':>8} {'MB/s':>8} {'peak RSS MB':>12}")
+        for name, fn, *fn_args in runs:
+            name, elapsed, peak = run(name, fn, *fn_args)
+            print(f"{name:<36} {elapsed:>8.2f} {size / elapsed:>8.1f} {peak:>12.1f}")
+
+        # Another 1% of traffic arrives, then the analysis resumes from the saved offsets
+        extra = os.path.join(directory, 'extra')
+        os.makedirs(extra)
+        generate_logs(extra, max(1, args.mb // 100), seed=2)
+        for name in os.listdir(extra):
+            with open(os.path.join(extra, name), 'rb') as source, open(os.path.join(directory, name), 'ab') as target:
+                target.write(source.read())
+            os.remove(os.path.join(extra, name))
+        os.rmdir(extra)
+        name, elapsed, peak = run("log_analytics --state (+1% appended)", analyze, [directory], state, args.jobs)
+        print(f"{name:<36} {elapsed:>8.2f} {'':>8} {peak:>12.1f}")
+
+        if not args.skip_naive:
+            name, elapsed, peak = run("readlines + json.loads", naive, directory)
+            print(f"{name:<36} {elapsed:>8.2f} {size / elapsed:>8.1f} {peak:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
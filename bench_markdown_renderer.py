@@ -0,0 +1,81 @@
+import argparse
+import time
+import markdown
+from markdown_renderer import EXTENSIONS, MarkdownRenderer
+
+PLAIN = ("Our branches are open from 9 AM to 5 PM on weekdays and from 10 AM to 2 PM on Saturday. "
+         "You can also reach customer service at any time through online banking.")
+
+SHORT = ("Sure! To reset your **online banking password**:\n\n"
+         "1. Go to *www.globaltrustbank.com* and select **Forgot password**.\n"
+         "2. Enter your user ID and the code we text you.\n"
+         "3. Choose a new password of at least 12 characters.\n")
+
+MEDIUM = SHORT + """
+### Fees at a glance
+
+| Account | Monthly fee | Waived when |
+|:--------|------------:|:------------|
+| Basic Checking | $5 | Balance above $500 |
+| Premier Checking | $25 | Balance above $10,000 |
+| Savings | $0 | - |
+
+Here are a few tips to avoid fees:
+
+- Set up a **direct deposit** of at least $250 a month.
+- Link your savings account for *overdraft protection*.
+- Use our ATMs, which are free for all customers.
+
+If you have questions, call us at 1-800-GTB-BANK or visit any branch. We're happy to help!
+"""
+
+LONG = MEDIUM + "\n".join(
+    f"\n#### Step {index}\n\nPlease make sure that the `account_{index}` settings are correct before you "
+    f"continue, and contact **support** if anything looks wrong. You can find more details in the "
+    f"[help center](https://www.globaltrustbank.com/help/{index}).\n\n> Note: changes take effect within one "
+    f"business day."
+    for index in range(1, 13)
+)
+
+SIZES = [('plain', PLAIN), ('short', SHORT), ('medium', MEDIUM), ('long', LONG)]
+
+
+def per_call(fn, texts):
+    """Microseconds per call over the given texts"""
+    start = time.perf_counter()
+    for text in texts:
+        fn(text)
+    return (time.perf_counter() - start) / len(texts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown rendering cost per AI response")
+    parser.add_argument('--count', type=int, default=500, help="renders per size and method")
+    args = parser.parse_args()
+
+    reused = markdown.Markdown(extensions=list(EXTENSIONS))
+    methods = [
+        ("markdown.markdown per call", lambda: lambda text: markdown.markdown(text, extensions=list(EXTENSIONS))),
+        ("reused Markdown, reset", lambda: lambda text: reused.reset().convert(text)),
+        ("MarkdownRenderer, cache miss", lambda: MarkdownRenderer(max_entries=0).render),
+        ("MarkdownRenderer, cache hit", lambda: MarkdownRenderer().render),
+    ]
+
+    print(f"{'method':<32}" + ''.join(f"{f'{name} ({len(text):,} ch)':>22}" for name, text in SIZES))
+    for label, factory in methods:
+        row = f"{label:<32}"
+        for name, text in SIZES:
+            render = factory()
+            if 'hit' in label:
+                render(text)
+                texts = [text] * args.count
+            else:
+                # A distinct text per call, so nothing is served from a cache
+                texts = [f"{text}\n\nReference {index}." for index in range(args.count)]
+            render(texts[0])  # Build the per-thread converter outside the timing
+            row += f"{per_call(render, texts):>19,.1f} us"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+from load_generator import free_port, rss_mb, start_server
+from mcp_client import MCPClient
+from mcp_protocol import PROTOCOL_COMPACT, PROTOCOL_FRAMED
+
+
+def wait_for_acks(client, timeout=60):
+    """Wait until nothing sent is still awaiting acknowledgment"""
+    deadline = time.time() + timeout
+    while client.in_flight():
+        if time.time() > deadline:
+            raise TimeoutError(f"{client.in_flight()} messages still unacknowledged")
+        time.sleep(0.01)
+
+
+def stop_and_wait(client, count):
+    """Messages per second waiting for each ack before sending the next message"""
+    start = time.perf_counter()
+    for index in range(count):
+        client.send_message_async('system', f'soak message {index}').result()
+    return count / (time.perf_counter() - start)
+
+
+def pipelined(client, count):
+    """Messages per second with up to ``max_in_flight`` sends awaiting their acks"""
+    start = time.perf_counter()
+    for index in range(count):
+        client.send_message_async('system', f'soak message {index}')
+    wait_for_acks(client)
+    return count / (time.perf_counter() - start)
+
+
+def soak(client, server, count, samples):
+    """Send ``count`` pipelined messages, printing this process's RSS as it goes"""
+    step = max(1, count // samples)
+    print(f"{'messages':>10} {'client RSS MB':>14} {'server RSS MB':>14} {'in flight':>10} {'inbox':>6} "
+          f"{'msg/s':>10}")
+    start = last = time.perf_counter()
+    for index in range(count):
+        client.send_message_async('system', f'soak message {index}')
+        if (index + 1) % step == 0:
+            now = time.perf_counter()
+            print(f"{index + 1:>10,} {rss_mb(os.getpid()) or 0:>14.1f} {rss_mb(server.pid) or 0:>14.1f} "
+                  f"{client.in_flight():>10} {client.message_queue.qsize():>6} {step / (now - last):>10,.0f}")
+            last = now
+    wait_for_acks(client)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCPClient memory over a long soak, and pipelined ack throughput")
+    parser.add_argument('--messages', type=int, default=1000000, help="messages sent during the soak")
+    parser.add_argument('--samples', type=int, default=10, help="RSS readings during the soak")
+    parser.add_argument('--compare', type=int, default=5000, help="messages per stop-and-wait/pipelined run")
+    parser.add_argument('--window', type=int, default=1000, help="max_in_flight for pipelined sends")
+    parser.add_argument('--protocol', choices=[PROTOCOL_FRAMED, PROTOCOL_COMPACT], default=PROTOCOL_COMPACT)
+    args = parser.parse_args()
+
+    # Keep per-message INFO logging out of the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        server = start_server('thread', port, 128, workdir)
+        client = MCPClient(port=port, protocol=args.protocol, max_in_flight=args.window)
+        try:
+            if not client.connect():
+                raise RuntimeError("Failed to connect to MCP server")
+            print(f"{args.protocol} protocol, window of {args.window} messages\n")
+            print(f"stop-and-wait {stop_and_wait(client, args.compare):>12,.0f} msg/s")
+            print(f"pipelined     {pipelined(client, args.compare):>12,.0f} msg/s\n")
+
+            rate = soak(client, server, args.messages, args.samples)
+            print(f"\n{args.messages:,} messages at {rate:,.0f} msg/s: {client.acks:,} acks, "
+                  f"{client.ack_timeouts} timed out, {client.inbox_dropped} dropped from the inbox")
+        finally:
+            client.disconnect()
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import time
+import tracemalloc
+from datetime import datetime
+from mcp_protocol import (MessageDecoder, MCPMessage, PROTOCOL_COMPACT, PROTOCOL_FRAMED, encode_batch,
+                          encode_message)
+
+CONTENT = ("Our branches are open from 9 AM to 5 PM on weekdays and from 10 AM to 2 PM on Saturday. "
+           "You can also reach customer service at any time through online banking.")
+ADDRESS = ('127.0.0.1', 50000)
+
+
+def chat_messages(count):
+    timestamp = datetime.now().isoformat()
+    return [{'type': 'chat', 'content': f"{CONTENT} ({index})", 'timestamp': timestamp, 'is_user': True}
+            for index in range(count)]
+
+
+def decode_dicts(data):
+    """The server's path before typed messages: dicts stamped by key"""
+    decoder = MessageDecoder()
+    decoder.feed(data)
+    messages = []
+    for message in decoder.messages():
+        message['timestamp'] = datetime.now().isoformat()
+        message['client_address'] = ADDRESS
+        messages.append(message)
+    return messages
+
+
+def decode_typed(data):
+    """The server's path now: MCPMessages stamped by attribute"""
+    decoder = MessageDecoder(typed=True)
+    decoder.feed(data)
+    messages = []
+    for message in decoder.messages():
+        message.timestamp = datetime.now().isoformat()
+        message.client_address = ADDRESS
+        messages.append(message)
+    return messages
+
+
+def rebroadcast_dicts(messages, protocol):
+    """Broadcast of each message as the server built it before, encoded for a client"""
+    for message in messages:
+        encode_message({'type': 'chat', 'sender': str(message['client_address']), 'content': message['content'],
+                        'timestamp': message['timestamp']}, protocol)
+
+
+def rebroadcast_typed(messages, protocol):
+    for message in messages:
+        MCPMessage('chat', sender=str(message.client_address), content=message.content,
+                   timestamp=message.timestamp).encode(protocol)
+
+
+def measure(label, protocol, decode, rebroadcast, messages, rounds):
+    """Throughput of encode, decode and rebroadcast, and memory held per decoded message"""
+    data = encode_batch(messages, protocol)
+    count = len(messages)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        encode_batch(messages, protocol)
+    encode_rate = count * rounds / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoded = decode(data)
+    decode_rate = count * rounds / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        rebroadcast(decoded, protocol)
+    broadcast_rate = count * rounds / (time.perf_counter() - start)
+
+    # What a full pipeline queue of these messages keeps alive, and the
+    # transient peak of decoding them
+    decoded = None
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    decoded = decode(data)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    held = [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0]
+    held_bytes = sum(stat.size_diff for stat in held)
+    held_blocks = sum(stat.count_diff for stat in held)
+
+    print(f"{label:<24} {len(data) / count:>8.0f} B {encode_rate:>12,.0f} {decode_rate:>12,.0f} "
+          f"{broadcast_rate:>12,.0f} {held_bytes / count:>10.0f} B {held_blocks / count:>8.1f} "
+          f"{peak / count:>10.0f} B")
+    return decoded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP message codec cost: JSON dicts vs typed compact messages")
+    parser.add_argument('--messages', type=int, default=1000, help="messages per batch")
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    messages = chat_messages(args.messages)
+    print(f"{args.messages} chat messages of about {len(CONTENT)} characters, rates in messages/s\n")
+    print(f"{'path':<24} {'wire/msg':>10} {'encode':>12} {'decode':>12} {'broadcast':>12} "
+          f"{'held/msg':>12} {'blocks':>8} {'peak/msg':>12}")
+    measure("dict, JSON frames", PROTOCOL_FRAMED, decode_dicts, rebroadcast_dicts, messages, args.rounds)
+    measure("MCPMessage, JSON frames", PROTOCOL_FRAMED, decode_typed, rebroadcast_typed, messages, args.rounds)
+    measure("MCPMessage, compact", PROTOCOL_COMPACT, decode_typed, rebroadcast_typed, messages, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import argparse
+import threading
+import time
+from metrics import MetricsRegistry
+from mcp_protocol import MessageDecoder, encode_message
+from mcp_server import MCPServer
+
+
+def per_op(fn, count):
+    """Nanoseconds per call of fn, less the cost of the loop itself"""
+    start = time.perf_counter()
+    for _ in range(count):
+        pass
+    loop = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return max(0.0, time.perf_counter() - start - loop) / count * 1e9
+
+
+def message_path(registry):
+    """The metric updates MCPServer and ShardedPipeline make for one received message"""
+    received = registry.counter('received', '', ('client',)).labels("('127.0.0.1', 50000)")
+    handled = registry.counter('handled', '', ('type',))
+    ack = registry.histogram('ack_seconds', '')
+    wait = registry.histogram('wait_seconds', '')
+    handler = registry.histogram('handler_seconds', '')
+    perf_counter = time.perf_counter
+
+    def record():
+        start = perf_counter()
+        received.inc(1)
+        ack.since(start)
+        dequeued = perf_counter()
+        handled.labels('chat').inc()
+        handled_at = perf_counter()
+        wait.observe(dequeued - start)
+        handler.observe(handled_at - dequeued)
+    return record
+
+
+def server_work(server):
+    """What the server does per message besides metrics: decode, stamp, acknowledge"""
+    data = encode_message({'type': 'chat', 'content': 'What are your opening hours?', 'is_user': True})
+    address = ('127.0.0.1', 50000)
+
+    def work():
+        decoder = MessageDecoder(typed=True)
+        decoder.feed(data)
+        messages = server.accept_messages(decoder, address)
+        server.encode_acks(decoder.protocol, server.build_acks(messages))
+    return work
+
+
+def contended(fn, threads, count):
+    """Nanoseconds per call with several threads calling fn at once"""
+    def run():
+        for _ in range(count):
+            fn()
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (threads * count) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of metric updates on the message path")
+    parser.add_argument('--count', type=int, default=500000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=500, help="labelled series rendered per scrape")
+    args = parser.parse_args()
+
+    registry = MetricsRegistry()
+    counter = registry.counter('counter', '')
+    family = registry.counter('labelled', '', ('client',))
+    family.labels('a')
+    gauge = registry.gauge('gauge', '')
+    histogram = registry.histogram('histogram_seconds', '')
+    record = message_path(registry)
+    server = MCPServer(port=0)
+    work = server_work(server)
+    server.socket.close()
+
+    print(f"{'operation':<44} {'ns/op':>10}")
+    for name, fn in [
+        ("Counter.inc", counter.inc),
+        ("labels('a').inc", lambda: family.labels('a').inc()),
+        ("Gauge.set", lambda: gauge.set(3)),
+        ("Histogram.observe", lambda: histogram.observe(0.0012)),
+        ("Histogram.since (with perf_counter)", lambda: histogram.since(time.perf_counter())),
+        ("metrics per received message", record),
+        ("server work per message, without metrics", work),
+    ]:
+        print(f"{name:<44} {per_op(fn, args.count):>10,.0f}")
+    print(f"{f'Histogram.observe, {args.threads} threads':<44} "
+          f"{contended(lambda: histogram.observe(0.0012), args.threads, args.count // args.threads):>10,.0f}")
+
+    scrape = MetricsRegistry()
+    clients = scrape.counter('messages', '', ('client',))
+    for client in range(args.clients):
+        clients.labels(f"('127.0.0.1', {50000 + client})").inc()
+    for name in ('ack_seconds', 'wait_seconds', 'handler_seconds', 'broadcast_seconds'):
+        scrape.histogram(name, '').observe(0.001)
+    start = time.perf_counter()
+    for _ in range(20):
+        text = scrape.render()
+    print(f"\nRender {len(text.splitlines()):,} lines ({args.clients} clients): "
+          f"{(time.perf_counter() - start) / 20 * 1000:.2f} ms per scrape")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import argparse
+import logging
+import threading
+import time
+from mcp_server import MCPServer
+from mcp_client import MCPClient
+from mcp_protocol import PROTOCOL_FRAMED, PROTOCOL_JSON
+
+
+def start_server():
+    """Start an MCP server on an ephemeral local port"""
+    server = MCPServer(port=0)
+    server_thread = threading.Thread(target=server.start)
+    server_thread.daemon = True
+    server_thread.start()
+    while not server.running:
+        time.sleep(0.01)
+    return server
+
+
+def wait_for_acks(client, expected, timeout=60):
+    """Wait until the server has acknowledged every message"""
+    deadline = time.time() + timeout
+    while client.acks < expected:
+        if time.time() > deadline:
+            raise TimeoutError(f"Only {client.acks} of {expected} acks received")
+        time.sleep(0.001)
+
+
+def run(server, protocol, count, size, batch):
+    """Send ``count`` messages of ``size`` bytes and report throughput"""
+    client = MCPClient(port=server.port, protocol=protocol)
+    if not client.connect():
+        raise RuntimeError("Failed to connect to MCP server")
+
+    content = 'x' * size
+    start = time.perf_counter()
+    if batch > 1:
+        for offset in range(0, count, batch):
+            client.send_batch([
+                client.build_message('system', content)
+                for _ in range(min(batch, count - offset))
+            ])
+    else:
+        for _ in range(count):
+            client.send_message('system', content)
+    wait_for_acks(client, count)
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+
+    label = f"{protocol} batch={batch}" if batch > 1 else protocol
+    print(f"{label:<20} {count / elapsed:>12,.0f} msg/s {count * size / elapsed / 1e6:>10.2f} MB/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP wire protocol throughput benchmark")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--size', type=int, default=256, help="content size in bytes")
+    parser.add_argument('--batch', type=int, default=100, help="messages per batch frame")
+    args = parser.parse_args()
+
+    # Keep per-message INFO logging out of the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = start_server()
+    print(f"{args.messages} messages of {args.size} bytes")
+    run(server, PROTOCOL_JSON, args.messages, args.size, 1)
+    run(server, PROTOCOL_FRAMED, args.messages, args.size, 1)
+    run(server, PROTOCOL_FRAMED, args.messages, args.size, args.batch)
+
+    print("\nshard  processed  wait avg ms  wait max ms  handler avg ms  handler max ms")
+    for shard in server.get_pipeline_stats():
+        print(f"{shard['shard']:>5} {shard['processed']:>10} {shard['wait_avg_ms']:>12.3f} "
+              f"{shard['wait_max_ms']:>12.3f} {shard['handler_avg_ms']:>15.3f} {shard['handler_max_ms']:>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import logging
+import random
+import time
+import app as chat_app
+from bench_chat_pool import stub_completion
+from load_generator import percentile
+from response_cache import ResponseCache
+
+# FAQ-style questions with the rewordings real users send
+QUESTIONS = [
+    ["What are your opening hours?", "what are your opening hours", "What are your opening hours??"],
+    ["Are you open on Saturday?", "are you open on saturday", "Are you open on Saturdays?"],
+    ["Where is the Brooklyn branch?", "where is the brooklyn branch", "Where's the Brooklyn branch located?"],
+    ["How do I report fraud?", "how do i report fraud", "How can I report fraud on my card?"],
+    ["What is the support email?", "what is the support email?", "What is your support email address?"],
+    ["Do you offer mortgage loans?", "do you offer mortgage loans", "Do you offer any mortgage loans?"]
+]
+
+
+class NoCache:
+    """Stand-in for the response cache that always misses"""
+
+    def set_namespace(self, namespace):
+        pass
+
+    def get(self, message):
+        return None
+
+    def put(self, message, response, latency=0.0):
+        pass
+
+    def stats(self):
+        return {'hit_rate': 0.0, 'saved_seconds': 0.0}
+
+
+class NoFastPath:
+    """Stand-in for the fast path that answers nothing, so every question reaches the cache"""
+
+    def rebuild(self, bank_info, version=None):
+        pass
+
+    def answer(self, message):
+        return None
+
+    def stats(self):
+        return {'intents': 0, 'hits': 0, 'misses': 0}
+
+
+class DiscardOutbox:
+    """Audit outbox that drops messages, so the MCP server is not needed"""
+
+    def emit(self, content, is_user=True, **fields):
+        return True
+
+
+def traffic(requests, unique, seed=1):
+    """Mostly repeated FAQ questions mixed with one-off ones"""
+    rng = random.Random(seed)
+    messages = []
+    for index in range(requests):
+        if rng.random() < unique:
+            messages.append(f"I have a question about my account number {index}")
+        else:
+            messages.append(rng.choice(rng.choice(QUESTIONS)))
+    return messages
+
+
+def run(label, cache, messages):
+    """Time sequential /chat requests through the Flask test client"""
+    chat_app.response_cache = cache
+    client = chat_app.app.test_client()
+    timings = []
+    for message in messages:
+        start = time.perf_counter()
+        response = client.post('/chat', json={'message': message})
+        timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f"/chat failed with {response.status_code}")
+    stats = cache.stats()
+    print(f"{label:<22} {sum(timings) / len(timings):>8.2f} {percentile(timings, 50):>8.2f} "
+          f"{percentile(timings, 99):>8.2f} {stats['hit_rate']:>8.1%} {stats['saved_seconds']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat response cache benchmark")
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--llm-latency', type=float, default=0.05, help="stubbed LLM latency in seconds")
+    parser.add_argument('--unique', type=float, default=0.2, help="fraction of one-off questions")
+    parser.add_argument('--similarity', type=float, default=0.5)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    chat_app.openai.ChatCompletion.create = stub_completion(args.llm_latency)
+    chat_app.audit_outbox = DiscardOutbox()
+    # The FAQ questions are what the fast path answers; measure the cache on its own
+    chat_app.fast_path = NoFastPath()
+    messages = traffic(args.requests, args.unique)
+    namespace = chat_app.cache_namespace()
+
+    print(f"{args.requests} requests, {args.unique:.0%} one-off, LLM latency {args.llm_latency * 1000:.0f} ms")
+    print(f"{'cache':<22} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'hits':>8} {'saved s':>8}")
+    run('none', NoCache(), messages)
+    run('exact', ResponseCache(namespace), messages)
+    run(f'near >= {args.similarity}', ResponseCache(namespace, similarity_threshold=args.similarity), messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import argparse
+import http.client
+import json
+import logging
+import threading
+import time
+from types import SimpleNamespace
+from werkzeug.serving import make_server
+import app as chat_app
+from bench_response_cache import DiscardOutbox, NoCache
+from load_generator import percentile
+
+ANSWER = (
+    "Thank you for reaching out to Global Trust Bank. Here is an overview of how we can help.\n\n"
+    "- **Personal Banking**: checking and savings accounts with online access\n"
+    "- **Business Banking**: accounts and payment services for companies\n"
+    "- **Mortgage Loans**: fixed and adjustable rate home loans\n\n"
+    "Our branches are open 9:00 AM - 5:00 PM EST on weekdays and 10:00 AM - 2:00 PM EST on Saturday. "
+    "For anything specific to your account, please contact customercare@globaltrust.com.\n\n"
+    "Is there anything else I can help you with today?"
+)
+
+
+def stub_streaming_completion(first_token, token_interval):
+    """Replacement for openai.ChatCompletion.create that emits ANSWER word by word.
+
+    The first token arrives after ``first_token`` seconds and every further
+    one after ``token_interval`` seconds, in both streaming and blocking mode.
+    """
+    tokens = [word + ' ' for word in ANSWER.split(' ')]
+
+    def chunks():
+        time.sleep(first_token)
+        for index, token in enumerate(tokens):
+            if index:
+                time.sleep(token_interval)
+            yield {'choices': [{'delta': {'content': token}}]}
+
+    def create(stream=False, **kwargs):
+        if stream:
+            return chunks()
+        time.sleep(first_token + token_interval * (len(tokens) - 1))
+        message = SimpleNamespace(content=''.join(tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    return create
+
+
+def measure(port, path, message):
+    """Milliseconds to the first body byte and to the end of the response"""
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    start = time.perf_counter()
+    connection.request('POST', path, body=json.dumps({'message': message}),
+                       headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response.read(1)
+    first_byte = time.perf_counter() - start
+    response.read()
+    total = time.perf_counter() - start
+    connection.close()
+    if response.status != 200:
+        raise RuntimeError(f"{path} failed with {response.status}")
+    return first_byte * 1000, total * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/chat vs /chat/stream time-to-first-byte benchmark")
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--first-token', type=float, default=0.3, help="stubbed LLM time to first token in seconds")
+    parser.add_argument('--token-interval', type=float, default=0.02, help="stubbed LLM time per further token")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    chat_app.openai.ChatCompletion.create = stub_streaming_completion(args.first_token, args.token_interval)
+    chat_app.audit_outbox = DiscardOutbox()
+    chat_app.response_cache = NoCache()
+
+    server = make_server('127.0.0.1', 0, chat_app.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    print(f"{args.requests} requests, first token {args.first_token * 1000:.0f} ms, "
+          f"{args.token_interval * 1000:.0f} ms per token")
+    print(f"{'endpoint':<14} {'ttfb p50':>10} {'ttfb p99':>10} {'total p50':>10}")
+    for path in ('/chat', '/chat/stream'):
+        results = [measure(server.server_port, path, f"How can you help me today? ({index})")
+                   for index in range(args.requests)]
+        first_bytes = [first_byte for first_byte, _ in results]
+        totals = [total for _, total in results]
+        print(f"{path:<14} {percentile(first_bytes, 50):>8.0f}ms {percentile(first_bytes, 99):>8.0f}ms "
+              f"{percentile(totals, 50):>8.0f}ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
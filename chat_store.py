@@ -0,0 +1,310 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from audit_log import AuditLogWriter, FSYNC_BATCH, FSYNC_NEVER, get_audit_log
+from log_retention import open_log
+
+DEFAULT_PATH = os.path.join('logs', 'chat_history.db')
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS messages ("
+    "id INTEGER PRIMARY KEY, ts REAL NOT NULL, client TEXT, type TEXT, content TEXT)",
+    "CREATE INDEX IF NOT EXISTS messages_ts ON messages (ts)",
+    "CREATE INDEX IF NOT EXISTS messages_client_ts ON messages (client, ts)",
+    "CREATE INDEX IF NOT EXISTS messages_type_ts ON messages (type, ts)",
+]
+
+# Full-text index over message content, kept in step with the table by triggers
+FULL_TEXT_SCHEMA = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+]
+
+
+def to_epoch(value, default=None):
+    """Seconds since the epoch for an ISO 8601 string, datetime or number"""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return default
+
+
+class ChatStore(AuditLogWriter):
+    """Indexed SQLite store of chat records.
+
+    Takes the records ``MCPServer.handle_chat_message`` writes to
+    chat_history.log and inserts them in batches from the same background
+    writer thread as ``AuditLogWriter``, one transaction per batch, into a
+    WAL-mode database. Messages are indexed by time, by client and time, and
+    by type and time, with an FTS5 index over their content when SQLite is
+    built with it. ``query`` can run from any thread while writes go on.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, flush_interval=0.2, fsync=FSYNC_NEVER, batch_size=5000):
+        self.full_text = True
+        db = sqlite3.connect(path)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                db.execute(statement)
+            try:
+                for statement in FULL_TEXT_SCHEMA:
+                    db.execute(statement)
+            except sqlite3.OperationalError:
+                # No FTS5 in this SQLite build; search falls back to LIKE
+                self.full_text = False
+            db.commit()
+        finally:
+            db.close()
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        super().__init__(path, flush_interval=flush_interval, fsync=fsync, max_bytes=0,
+                         timestamp_prefix=False, batch_size=batch_size)
+
+    def write_pending(self):
+        """Insert every queued record in one transaction"""
+        pending = self._pending
+        if not pending:
+            return
+        rows = []
+        try:
+            while True:
+                created, record = pending.popleft()
+                rows.append((to_epoch(record.get('timestamp'), created), record.get('client'),
+                             record.get('type'), record.get('content', '')))
+        except IndexError:
+            pass
+
+        db = self._open()
+        with db:
+            db.executemany("INSERT INTO messages (ts, client, type, content) VALUES (?, ?, ?, ?)", rows)
+        self.batches += 1
+
+        with self._flushed:
+            self.written += len(rows)
+            self._flushed.notify_all()
+
+    def _write_logged(self):
+        try:
+            self.write_pending()
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Error writing {self.path}: {e}")
+
+    def _open(self):
+        # The writer thread's connection; run() closes it when the store is closed
+        if self._stream is None:
+            self._stream = sqlite3.connect(self.path)
+            self._stream.execute(f"PRAGMA synchronous={'FULL' if self.fsync == FSYNC_BATCH else 'NORMAL'}")
+        return self._stream
+
+    def query(self, client=None, message_type=None, since=None, until=None, search=None,
+              limit=100, newest_first=False):
+        """Messages matching every filter given, oldest first unless ``newest_first``.
+
+        ``since`` and ``until`` take ISO 8601 strings, datetimes or epoch
+        seconds, ``until`` being exclusive. ``search`` is an FTS5 query such
+        as ``outage`` or ``"card payment" OR refund``. Results are always in
+        message time order: rows are not stored in time order, since senders
+        keep their own timestamps, journaled messages arrive late and
+        imported logs are older than what is already stored.
+        """
+        where, params = self._filters(client, message_type, since, until, search)
+        direction = 'DESC' if newest_first else 'ASC'
+        order = f"m.ts {direction}, m.id {direction}"
+        sql = (f"SELECT m.id, m.ts, m.client, m.type, m.content FROM {self._source(client, search)}{where} "
+               f"ORDER BY {order}")
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [
+            {'id': row[0], 'timestamp': datetime.fromtimestamp(row[1]).isoformat(),
+             'client': row[2], 'type': row[3], 'content': row[4]}
+            for row in self._read(sql, params)
+        ]
+
+    def count(self, client=None, message_type=None, since=None, until=None, search=None):
+        """Number of messages matching every filter given"""
+        where, params = self._filters(client, message_type, since, until, search)
+        return self._read(f"SELECT count(*) FROM {self._source(client, search)}{where}", params)[0][0]
+
+    def _source(self, client, search):
+        if not search or not self.full_text:
+            return "messages m"
+        if client is not None:
+            # A client has few messages next to a common term's matches, so
+            # walk the client index and look each row up in the full-text index
+            return "messages m CROSS JOIN messages_fts ON messages_fts.rowid = m.id"
+        return "messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+
+    def _filters(self, client, message_type, since, until, search):
+        clauses, params = [], []
+        if client is not None:
+            clauses.append("m.client = ?")
+            params.append(client)
+        if message_type is not None:
+            clauses.append("m.type = ?")
+            params.append(message_type)
+        if since is not None:
+            clauses.append("m.ts >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            clauses.append("m.ts < ?")
+            params.append(to_epoch(until))
+        if search:
+            if self.full_text:
+                clauses.append("messages_fts MATCH ?")
+                params.append(search)
+            else:
+                clauses.append("m.content LIKE ?")
+                params.append(f"%{search}%")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _read(self, sql, params):
+        with self._reader_lock:
+            if self._reader is None:
+                self._reader = sqlite3.connect(self.path, check_same_thread=False)
+            return self._reader.execute(sql, params).fetchall()
+
+    def close(self):
+        """Insert what is queued and stop the writer thread"""
+        super().close()
+        with self._reader_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def stats(self):
+        """Queue depth, insert counters and rows stored"""
+        stats = super().stats()
+        stats['rows'] = self._read("SELECT max(id) FROM messages", ())[0][0] or 0
+        stats['full_text'] = self.full_text
+        return stats
+
+
+def get_chat_store(path=DEFAULT_PATH, **kwargs):
+    """Return the process-wide store for ``path``, creating it on first use"""
+    return get_audit_log(path, writer_class=ChatStore, **kwargs)
+
+
+def parse_log_line(line):
+    """Record from a chat_history.log (``<asctime> - <json>``) or client_messages.log (bare JSON) line"""
+    line = line.strip()
+    if not line:
+        return None
+    prefix = None
+    if not line.startswith('{'):
+        prefix, _, line = line.partition(' - ')
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict):
+        return None
+    if not record.get('timestamp') and prefix:
+        # asctime is "YYYY-MM-DD HH:MM:SS,mmm"
+        record['timestamp'] = prefix.replace(' ', 'T').replace(',', '.')
+    if 'direction' in record:
+        # client_messages.log: outgoing chat from this client, incoming broadcasts from others
+        if record['direction'] == 'outgoing':
+            message_type = 'user_message' if record.get('sender') == 'user' else 'ai_response'
+            client = record.get('client', 'local')
+        else:
+            message_type = 'broadcast'
+            client = record.get('sender')
+        record = {'timestamp': record.get('timestamp'), 'client': client,
+                  'type': message_type, 'content': record.get('content', '')}
+    return record
+
+
+def import_logs(store, paths, chunk=50000):
+    """Insert the records of existing log files, plain or gzipped, into the store, returning how many were imported"""
+    imported = 0
+    for path in paths:
+        with open_log(path) as stream:
+            for line in stream:
+                record = parse_log_line(line)
+                if record is None:
+                    continue
+                store.write(record)
+                imported += 1
+                # Keep the queue from holding a whole file
+                if imported % chunk == 0:
+                    store.flush()
+    store.flush()
+    return imported
+
+
+def day_range(day):
+    """Start and end of a day given as YYYY-MM-DD, 'today' or 'yesterday'"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if day == 'today':
+        start = today
+    elif day == 'yesterday':
+        start = today - timedelta(days=1)
+    else:
+        start = datetime.fromisoformat(day)
+    return start, start + timedelta(days=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and import the indexed chat history store")
+    parser.add_argument('--db', default=DEFAULT_PATH, help="SQLite database path")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query = commands.add_parser('query', help="print matching messages as JSON lines")
+    query.add_argument('--client', help="client address, as in chat_history.log")
+    query.add_argument('--type', dest='message_type', help="user_message, ai_response or broadcast")
+    query.add_argument('--since', help="ISO 8601 start time")
+    query.add_argument('--until', help="ISO 8601 end time, exclusive")
+    query.add_argument('--day', help="YYYY-MM-DD, today or yesterday")
+    query.add_argument('--search', help="full-text query over message content")
+    query.add_argument('--limit', type=int, default=100, help="0 for no limit")
+    query.add_argument('--newest', action='store_true', help="newest messages first")
+    query.add_argument('--count', action='store_true', help="only print the number of matches")
+
+    importer = commands.add_parser('import', help="load existing chat_history.log or client_messages.log files")
+    importer.add_argument('paths', nargs='+')
+
+    commands.add_parser('stats', help="print row count and store settings")
+    args = parser.parse_args()
+
+    store = ChatStore(args.db)
+    try:
+        if args.command == 'import':
+            start = time.perf_counter()
+            imported = import_logs(store, args.paths)
+            print(f"Imported {imported} records in {time.perf_counter() - start:.1f}s")
+        elif args.command == 'stats':
+            print(json.dumps(store.stats()))
+        else:
+            since, until = args.since, args.until
+            if args.day:
+                since, until = day_range(args.day)
+            filters = dict(client=args.client, message_type=args.message_type, since=since,
+                           until=until, search=args.search)
+            if args.count:
+                print(store.count(**filters))
+            else:
+                for message in store.query(limit=args.limit, newest_first=args.newest, **filters):
+                    sys.stdout.write(json.dumps(message) + '\n')
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
-import os
+import argparse
+from log_retention import LogRetention
 
-def clear_logs():
-    log_dir = 'logs'
-    log_files = ['client_messages.log', 'mcp_client.log']
-    
-    for log_file in log_files:
-        file_path = os.path.join(log_dir, log_file)
-        try:
-            open(file_path, 'w').close()
-            print(f"Cleared {log_file}")
-        except Exception as e:
-            print(f"Error clearing {log_file}: {e}")
+def clear_logs(log_dir='logs', purge=False):
+    """Start every log afresh without losing what running servers write.
+
+    Files are rotated rather than truncated: each non-empty log is renamed
+    to a timestamped segment and its handler carries on in a new file. The
+    segments are compressed by the next retention pass, or deleted with
+    ``purge``.
+    """
+    retention = LogRetention(log_dir, max_age_days=None, max_total_bytes=0 if purge else None)
+    for segment in retention.rotate(force=True):
+        print(f"Rotated {segment}")
+    if purge:
+        for path in retention.enforce():
+            print(f"Deleted {path}")
 
 if __name__ == "__main__":
-    clear_logs() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Rotate every log in logs/ out of the way")
+    parser.add_argument('--dir', default='logs')
+    parser.add_argument('--purge', action='store_true', help="also delete every rotated segment and archive")
+    args = parser.parse_args()
+    clear_logs(args.dir, args.purge)
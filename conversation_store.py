@@ -0,0 +1,211 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    import tiktoken
+except ImportError:  # Token counts fall back to an estimate
+    tiktoken = None
+
+_encoding = tiktoken.get_encoding('cl100k_base') if tiktoken is not None else None
+_SENTENCE = re.compile(r"(?<=[.!?])\s")
+
+
+def count_tokens(text):
+    """Tokens in a text, estimated at four characters per token without tiktoken"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text, tokens):
+    """Cut a text down to at most ``tokens`` tokens"""
+    if _encoding is not None:
+        encoded = _encoding.encode(text)
+        return text if len(encoded) <= tokens else _encoding.decode(encoded[:tokens])
+    return text[:tokens * 4]
+
+
+class Turn:
+    __slots__ = ('role', 'content', 'tokens')
+
+    def __init__(self, role, content, tokens):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+
+class Session:
+    __slots__ = ('session_id', 'turns', 'tokens', 'summary', 'summary_tokens', 'last_used')
+
+    def __init__(self, session_id, max_turns):
+        self.session_id = session_id
+        self.turns = deque(maxlen=max_turns)
+        self.tokens = 0  # Tokens of the turns held
+        self.summary = deque()  # Short lines standing in for turns that no longer fit
+        self.summary_tokens = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationStore:
+    """Per-session chat memory with a bounded prompt.
+
+    Each session keeps its most recent turns in a ring buffer limited to
+    ``max_turns`` turns and ``token_budget`` tokens. Turns pushed out are
+    condensed into a short summary, itself limited to ``summary_budget``
+    tokens, so the history sent with a prompt, and the memory held for a
+    session, stop growing however long the conversation runs. At most
+    ``max_sessions`` sessions are kept; the least recently used, and any
+    idle for ``idle_ttl`` seconds, are evicted, or spilled to SQLite when
+    ``spill_path`` is set and loaded back on their next message.
+    """
+
+    def __init__(self, max_sessions=10000, max_turns=20, token_budget=1500, summary_budget=200,
+                 idle_ttl=1800.0, spill_path=None):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_budget = summary_budget
+        self.idle_ttl = idle_ttl
+        self.evicted = 0
+        self.spilled = 0
+        self.loaded = 0
+        self.summarized = 0
+        self._sessions = OrderedDict()  # session_id -> Session, least recently used first
+        self._lock = threading.Lock()
+        self._db = None
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, summary TEXT, turns TEXT, updated REAL)"
+            )
+            self._db.commit()
+
+    def history(self, session_id):
+        """Earlier turns of a session as chat completion messages, oldest first"""
+        with self._lock:
+            session = self._get(session_id, create=False)
+            if session is None:
+                return []
+            messages = []
+            if session.summary:
+                messages.append({
+                    'role': 'system',
+                    'content': "Summary of the earlier conversation:\n" + '\n'.join(session.summary)
+                })
+            messages.extend({'role': turn.role, 'content': turn.content} for turn in session.turns)
+            return messages
+
+    def add_turn(self, session_id, role, content):
+        """Append a turn, condensing the oldest ones once the session is over budget"""
+        tokens = count_tokens(content)
+        if tokens > self.token_budget:
+            content = truncate_tokens(content, self.token_budget)
+            tokens = count_tokens(content)
+        with self._lock:
+            session = self._get(session_id, create=True)
+            if len(session.turns) == self.max_turns:
+                self._condense(session, session.turns.popleft())
+            session.turns.append(Turn(role, content, tokens))
+            session.tokens += tokens
+            while session.tokens > self.token_budget:
+                self._condense(session, session.turns.popleft())
+            self._evict()
+
+    def add_exchange(self, session_id, user_message, ai_response):
+        """Record a question and its answer"""
+        self.add_turn(session_id, 'user', user_message)
+        self.add_turn(session_id, 'assistant', ai_response)
+
+    def _get(self, session_id, create):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id)
+            if session is None:
+                if not create:
+                    return None
+                session = Session(session_id, self.max_turns)
+            self._sessions[session_id] = session
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        return session
+
+    def _condense(self, session, turn):
+        """Fold a turn that no longer fits into the session summary"""
+        session.tokens -= turn.tokens
+        # The first sentence of each turn, cut to a line, is kept
+        text = _SENTENCE.split(turn.content.strip(), 1)[0]
+        line = f"{'Customer' if turn.role == 'user' else 'Assistant'}: {truncate_tokens(' '.join(text.split()), 40)}"
+        session.summary.append(line)
+        session.summary_tokens += count_tokens(line)
+        while session.summary_tokens > self.summary_budget and session.summary:
+            session.summary_tokens -= count_tokens(session.summary.popleft())
+        self.summarized += 1
+
+    def _evict(self):
+        """Drop the least recently used sessions beyond the limit and those left idle"""
+        deadline = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and session.last_used >= deadline:
+                break
+            del self._sessions[session_id]
+            self._spill(session)
+            self.evicted += 1
+
+    def _spill(self, session):
+        if self._db is None:
+            return
+        turns = [[turn.role, turn.content, turn.tokens] for turn in session.turns]
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+            (session.session_id, json.dumps(list(session.summary)), json.dumps(turns), time.time())
+        )
+        self._db.commit()
+        self.spilled += 1
+
+    def _load(self, session_id):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT summary, turns FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        session = Session(session_id, self.max_turns)
+        for line in json.loads(row[0]):
+            session.summary.append(line)
+            session.summary_tokens += count_tokens(line)
+        for role, content, tokens in json.loads(row[1]):
+            session.turns.append(Turn(role, content, tokens))
+            session.tokens += tokens
+        self.loaded += 1
+        return session
+
+    def close(self):
+        """Spill every session still in memory, if spilling is enabled"""
+        with self._lock:
+            if self._db is None:
+                return
+            for session in self._sessions.values():
+                self._spill(session)
+            self._sessions.clear()
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        """Session counts and eviction, spill and summary counters"""
+        return {
+            'sessions': len(self._sessions),
+            'evicted': self.evicted,
+            'spilled': self.spilled,
+            'loaded': self.loaded,
+            'summarized': self.summarized
+        }
@@ -0,0 +1,285 @@
+import re
+import markdown
+from response_cache import normalize_message
+
+# Questions longer than this, or about the customer's own account, always go to the LLM
+MAX_WORDS = 20
+DECLINE = re.compile(r"\b(?:my|accounts?|balance|transfer|dispute|refund|why|rates?|interest|fees?|charged?)\b")
+
+HOURS = re.compile(r"\b(?:hours?|open|opens|opening|close|closes|closed|closing|timings?)\b")
+DAYS = {
+    'weekdays': r"weekdays?|monday|tuesday|wednesday|thursday|friday|mon|fri",
+    'saturday': r"saturdays?|sat",
+    'sunday': r"sundays?|sun"
+}
+WEEKEND = re.compile(r"\bweekends?\b")
+BRANCHES = re.compile(r"\b(?:branch|branches|locations?)\b")
+PLACE = re.compile(r"\b(?:branch|branches|locations?|where|where's|address|located)\b")
+SERVICES = re.compile(r"\b(?<!customer )(?:services?|products?)\b")
+OFFER = re.compile(r"\b(?:offer|offers|offering|provide|provides|available|have)\b")
+CONTACT = re.compile(r"\b(?:email|contact|reach|support|help|address)\b")
+CHANNELS = {
+    'online_banking': r"online banking",
+    'technical_support': r"technical support|tech support|technical",
+    'customer_service': r"customer service|customer care|customer support",
+    'fraud_reporting': r"fraud|fraudulent|scam|stolen"
+}
+PHONE = re.compile(r"\b(?:phone|call|telephone|hotline)\b")
+EMAIL = re.compile(r"\b(?:email|e mail)\b")
+WEBSITE = re.compile(r"\b(?:website|web site|url)\b")
+HEADQUARTERS = re.compile(r"\b(?:headquarters|head office|hq|main office)\b")
+
+# Words that back up an intent's keywords; an intent needs two distinct cues
+HOURS_CUES = re.compile(r"\b(?:when|time|business|days?|what are|what's|what is)\b")
+BRANCHES_CUES = re.compile(r"\b(?:where|where's|how many|list|located|address|addresses)\b")
+FRAUD_CUES = re.compile(r"\b(?:report|reporting|contact|email|who|where)\b")
+PHONE_CUES = re.compile(r"\b(?:number|what is|what's|can i|how do i|how can i)\b")
+EMAIL_CUES = re.compile(r"\b(?:what is|what's|address|send|write)\b")
+WEBSITE_CUES = re.compile(r"\b(?:what is|what's|link|address)\b")
+HEADQUARTERS_CUES = re.compile(r"\b(?:where|where's|address|located|what is|what's)\b")
+
+# Only questions are answered: a question mark, or a question or request word first
+QUESTION = re.compile(r"^(?:what|what's|whats|when|where|where's|how|do|does|are|is|can|could|who|which|"
+                      r"list|tell|show|give)\b")
+# A negation, a date or a number changes what is being asked
+QUALIFIED = re.compile(r"\b(?:not|no|don't|doesn't|never|without|except|today|tonight|tomorrow|yesterday|"
+                       r"holidays?|christmas|thanksgiving|easter|new year's|memorial|labor|independence|"
+                       r"january|february|march|april|may|june|july|august|september|october|november|"
+                       r"december|\w*\d\w*)\b")
+# A product turns a question about hours, places or contact details into one about that product
+PRODUCT = re.compile(r"\b(?:loans?|mortgages?|cards?|credit|debit|accounts?|applications?|checking|savings|"
+                     r"atms?|deposits?|checks?|cheques?|safe deposit)\b")
+# Whom or where a service is for: BANK_INFO only says whether it is offered at all
+RESTRICTED = re.compile(r"\b(?:to|for|in|at|with|via|outside|abroad|overseas|international|internationally|"
+                        r"residents?|foreign|foreigners?|citizens?|students?|minors?|kids|children|seniors?|"
+                        r"only|free|cheap|cheapest|best)\b")
+SERVICES_QUALIFIED = re.compile(f"{PRODUCT.pattern}|{RESTRICTED.pattern}")
+# Words in front of "services" or "products" that do not name one
+GENERIC_PRODUCTS = {'what', 'which', 'your', 'the', 'all', 'any', 'other', 'of', 'you', 'some', 'main', 'banking',
+                    'financial', 'bank', 'these', 'those', 'more', 'customer'}
+PRODUCT_NAME = re.compile(r"\b([\w']+) (?:services?|products?)\b")
+# Proximity questions and places next to "branch" that are not one of ours go to the LLM
+NEARBY = re.compile(r"\b(?:near|nearest|closest|around|close to|next to)\b")
+BRANCH_PLACE = re.compile(r"\b(\w+) branch(?:es)?\b|\bbranch(?:es)? (?:in|at|on) (?:the )?(\w+)")
+GENERIC_PLACES = {'the', 'your', 'a', 'any', 'each', 'every', 'which', 'what', 'many', 'main', 'local', 'one',
+                  'another', 'other', 'new', 'york', 'ny', 'of', 'this', 'that'}
+
+
+def _words(pattern):
+    return re.compile(rf"\b(?:{pattern})\b")
+
+
+def _singular(word):
+    return word[:-1] if word.endswith('s') and not word.endswith('ss') else word
+
+
+def _service_pattern(name):
+    """Match a service by its name, e.g. "Online & Mobile Banking" also matches "mobile banking\""""
+    parts = [normalize_message(part).split() for part in name.split('&')]
+    head = parts[-1][-1:] if len(parts[-1]) > 1 else []
+    phrases = [' '.join(words + head) if index < len(parts) - 1 else ' '.join(words)
+               for index, words in enumerate(parts)]
+    # Generic trailing words such as "services" are optional, plurals are tolerated
+    alternatives = []
+    for phrase in phrases:
+        words = phrase.split()
+        if len(words) > 1 and words[-1] in ('services', 'loans'):
+            words = words[:-1]
+        alternatives.append(r"\s".join(rf"{re.escape(_singular(word))}s?" for word in words))
+    return _words('|'.join(alternatives))
+
+
+class FastPathAnswer:
+    __slots__ = ('intent', 'text', 'html')
+
+    def __init__(self, intent, text):
+        self.intent = intent
+        self.text = text
+        self.html = markdown.markdown(text, extensions=['extra', 'smarty', 'tables'])
+
+
+class Intent:
+    __slots__ = ('name', 'family', 'patterns', 'cues', 'qualifiers', 'covers', 'answer')
+
+    def __init__(self, name, family, patterns, text, covers=(), cues=None, qualifiers=PRODUCT):
+        self.name = name
+        self.family = family
+        self.patterns = patterns
+        self.cues = cues  # Optional words that count towards the two cues a match needs
+        self.qualifiers = qualifiers  # Words that make the canned answer the wrong one
+        self.covers = covers  # Other families this intent's answer also settles
+        self.answer = FastPathAnswer(name, text)
+
+    def matches(self, normalized):
+        """Every pattern matches, with at least two distinct cue words and no qualifier"""
+        cues = set()
+        for pattern in self.patterns:
+            found = [match.group(0) for match in pattern.finditer(normalized)]
+            if not found:
+                return False
+            cues.update(found)
+        if self.cues is not None:
+            cues.update(match.group(0) for match in self.cues.finditer(normalized))
+        if len(cues) < 2:
+            return False
+        return self.qualifiers is None or self.qualifiers.search(normalized) is None
+
+
+class BankInfoAnswerer:
+    """Answers simple questions about the bank straight from ``BANK_INFO``.
+
+    Intents for hours, branches, services, support channels and contact
+    details are compiled once from the bank information, each with its
+    answer already rendered to HTML. A message is answered only when it is
+    phrased as a question, an intent matches it with at least two distinct
+    cue words, that intent is the most specific match and no unrelated
+    intent matches as well. Anything ambiguous, long, about the customer's
+    own account, negated, about a date, a product or a place we have no
+    branch in, about services we do not list or about whom or where a
+    service is for returns None so the caller can fall through to the LLM.
+    """
+
+    def __init__(self, bank_info, version=None):
+        self.hits = 0
+        self.misses = 0
+        self.rebuild(bank_info, version)
+
+    def rebuild(self, bank_info, version=None):
+        """Recompile the intents, skipped when ``version`` has not changed"""
+        if version is not None and version == getattr(self, 'version', None):
+            return
+        self.version = version
+        self.intents = self.compile(bank_info)
+        # Words naming our branches, e.g. "queens" from "Queens Branch: 321 Queens Blvd, ..."
+        self.places = {word for branch in bank_info.get('branches', [])
+                       for word in normalize_message(branch.partition(':')[0]).split()}
+        # Words naming our services, e.g. "investment" from "Investment Services"
+        self.products = {word for service in bank_info.get('services', [])
+                         for word in normalize_message(service).split()}
+
+    def compile(self, info):
+        """Build the intents for one version of the bank information"""
+        name = info['name']
+        intents = []
+
+        hours = info.get('hours', {})
+        if hours:
+            lines = '\n'.join(f"- **{day.title()}**: {value}" for day, value in hours.items())
+            intents.append(Intent('hours', 'hours', [HOURS], f"Opening hours for {name}:\n\n{lines}",
+                                  cues=HOURS_CUES))
+            for day, value in hours.items():
+                day_pattern = _words(DAYS.get(day, re.escape(day)))
+                intents.append(Intent(f'hours.{day}', 'hours', [HOURS, day_pattern], self.hours_text(day, value)))
+            weekend = [day for day in ('saturday', 'sunday') if day in hours]
+            if weekend:
+                text = ' '.join(self.hours_text(day, hours[day]) for day in weekend)
+                intents.append(Intent('hours.weekend', 'hours', [HOURS, WEEKEND], text))
+
+        branches = info.get('branches', [])
+        if branches:
+            lines = '\n'.join(f"- {branch}" for branch in branches)
+            intents.append(Intent('branches', 'branch', [BRANCHES], f"{name} has {len(branches)} branches:\n\n{lines}",
+                                  cues=BRANCHES_CUES))
+            for branch in branches:
+                label, _, address = branch.partition(':')
+                place = normalize_message(label.replace('Branch', ''))
+                intents.append(Intent(f'branch.{place.replace(" ", "_")}', 'branch', [PLACE, _words(re.escape(place))],
+                                      f"Our **{label.strip()}** is at {address.strip()}."))
+
+        services = info.get('services', [])
+        if services:
+            lines = '\n'.join(f"- {service}" for service in services)
+            intents.append(Intent('services', 'service', [SERVICES], f"{name} offers:\n\n{lines}", cues=OFFER,
+                                  qualifiers=SERVICES_QUALIFIED))
+            for service in services:
+                key = normalize_message(service).replace(' ', '_')
+                # The product is what is asked about, so only whom or where it is for qualifies it
+                intents.append(Intent(f'service.{key}', 'service', [OFFER, _service_pattern(service)],
+                                      f"Yes, {name} offers **{service}**.", qualifiers=RESTRICTED))
+
+        for channel, email in info.get('support_channels', {}).items():
+            label = channel.replace('_', ' ')
+            patterns = [_words(CHANNELS.get(channel, re.escape(label)))]
+            if channel != 'fraud_reporting':
+                patterns.append(CONTACT)
+            # Support questions are often about a card or an account
+            intents.append(Intent(f'support.{channel}', 'support', patterns,
+                                  f"For {label}, email [{email}](mailto:{email}).", covers=('email',),
+                                  cues=FRAUD_CUES if channel == 'fraud_reporting' else None, qualifiers=None))
+
+        if 'phone' in info:
+            intents.append(Intent('phone', 'phone', [PHONE], f"You can call {name} at **{info['phone']}**.",
+                                  cues=PHONE_CUES))
+        if 'email' in info:
+            intents.append(Intent('email', 'email', [EMAIL],
+                                  f"You can email us at [{info['email']}](mailto:{info['email']}).", cues=EMAIL_CUES))
+        if 'website' in info:
+            intents.append(Intent('website', 'website', [WEBSITE], f"Our website is {info['website']}.",
+                                  cues=WEBSITE_CUES))
+        if 'headquarters' in info:
+            intents.append(Intent('headquarters', 'headquarters', [HEADQUARTERS],
+                                  f"{name} is headquartered at {info['headquarters']}.", cues=HEADQUARTERS_CUES))
+        return intents
+
+    @staticmethod
+    def hours_text(day, value):
+        label = 'on weekdays' if day == 'weekdays' else f"on {day.title()}s"
+        if value.strip().lower() == 'closed':
+            return f"We are closed {label}."
+        return f"We are open {label} from {value}."
+
+    def unknown_place(self, normalized):
+        """Whether the question asks about a place that is not one of our branches"""
+        if NEARBY.search(normalized):
+            return True
+        for match in BRANCH_PLACE.finditer(normalized):
+            word = match.group(1) or match.group(2)
+            if word not in self.places and word not in GENERIC_PLACES:
+                return True
+        return False
+
+    def unknown_product(self, normalized):
+        """Whether the question names services or products that are not among ours, such as "crypto services\""""
+        for match in PRODUCT_NAME.finditer(normalized):
+            word = match.group(1)
+            if word not in self.products and _singular(word) not in self.products and word not in GENERIC_PRODUCTS:
+                return True
+        return False
+
+    def classify(self, message):
+        """The single best matching intent, or None"""
+        normalized = normalize_message(message)
+        if not normalized or normalized.count(' ') >= MAX_WORDS or DECLINE.search(normalized):
+            return None
+        if not (message.rstrip().endswith('?') or QUESTION.search(normalized)):
+            return None
+        if QUALIFIED.search(normalized) or self.unknown_place(normalized) or self.unknown_product(normalized):
+            return None
+        matches = [intent for intent in self.intents if intent.matches(normalized)]
+        covered = {family for intent in matches for family in intent.covers}
+        matches = [intent for intent in matches if intent.family not in covered]
+        if not matches:
+            return None
+        # The intent with the most patterns matched is the most specific
+        top = max(len(intent.patterns) for intent in matches)
+        best = [intent for intent in matches if len(intent.patterns) == top]
+        if len(best) != 1:
+            return None
+        best = best[0]
+        for intent in matches:
+            if intent.family != best.family:
+                return None
+        return best
+
+    def answer(self, message):
+        """Pre-rendered answer for a high-confidence match, or None to fall through to the LLM"""
+        intent = self.classify(message)
+        if intent is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return intent.answer
+
+    def stats(self):
+        """Answered and fall-through counts"""
+        return {'intents': len(self.intents), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,147 @@
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from mcp_client import MCPClient
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def raise_file_limit():
+    """Allow this process and the server it spawns to hold thousands of sockets"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def rss_mb(pid):
+    """Resident set size of a process in MB, read from /proc"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, pct):
+    """Return the given percentile of a list of values"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def free_port():
+    """Ask the OS for a currently unused local port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('localhost', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(mode, port, backlog, workdir):
+    """Launch mcp_server.py in a subprocess and wait until it accepts connections"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcp_server.py')
+    process = subprocess.Popen(
+        [sys.executable, script, '--mode', mode, '--port', str(port), '--backlog', str(backlog)],
+        cwd=workdir,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    for _ in range(100):
+        try:
+            socket.create_connection(('localhost', port)).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"MCP server ({mode} mode) did not start")
+
+
+def exercise(client, messages, timeout):
+    """Send messages one at a time and return the ack latency of each, in ms"""
+    latencies = []
+    for index in range(messages):
+        start = time.perf_counter()
+        try:
+            client.send_message_async('system', f'load test message {index}', timeout).result()
+        except (TimeoutError, ConnectionError):
+            break
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def run(mode, args, workdir):
+    """Hold ``args.clients`` connections against one server mode and collect statistics"""
+    port = free_port()
+    server = start_server(mode, port, args.backlog, workdir)
+    clients = [MCPClient(port=port) for _ in range(args.clients)]
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            connected = sum(pool.map(lambda client: client.connect(), clients))
+            idle_rss = rss_mb(server.pid)
+
+            start = time.perf_counter()
+            live = [client for client in clients if client.connected]
+            results = pool.map(lambda client: exercise(client, args.messages, args.timeout), live)
+            latencies = [latency for result in results for latency in result]
+            elapsed = time.perf_counter() - start
+
+        held = sum(1 for client in clients if client.connected)
+        return {
+            'mode': mode,
+            'connected': connected,
+            'held': held,
+            'acks': len(latencies),
+            'ack_rate': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 50),
+            'p99_ms': percentile(latencies, 99),
+            'idle_rss_mb': idle_rss,
+            'rss_mb': rss_mb(server.pid)
+        }
+    finally:
+        for client in clients:
+            client.disconnect()
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare MCP server engines under many concurrent clients")
+    parser.add_argument('--clients', type=int, default=1000, help="concurrent MCPClient connections")
+    parser.add_argument('--messages', type=int, default=10, help="messages each client sends")
+    parser.add_argument('--workers', type=int, default=200, help="threads driving the clients")
+    parser.add_argument('--modes', nargs='+', default=['thread', 'async'])
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds to wait for each ack")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    raise_file_limit()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'mode':<8} {'connected':>9} {'held':>6} {'acks/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'idle RSS':>9} {'RSS MB':>8}")
+        for mode in args.modes:
+            result = run(mode, args, workdir)
+            print(
+                f"{result['mode']:<8} {result['connected']:>9} {result['held']:>6} "
+                f"{result['ack_rate']:>10,.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+                f"{result['idle_rss_mb'] or 0:>9.1f} {result['rss_mb'] or 0:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
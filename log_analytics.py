@@ -0,0 +1,501 @@
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import mmap
+import os
+import re
+import time
+from array import array
+from collections import Counter, deque
+from datetime import datetime
+from multiprocessing import Pool
+from log_retention import base_log_name
+
+# Line formats, told apart by file name
+KIND_SERVER = 'server'    # mcp_server.log, mcp_client.log: "<asctime> - <level> - <message>"
+KIND_CHAT = 'chat'        # chat_history.log: "<asctime> - <json>"
+KIND_SYSTEM = 'system'    # system.log: "<asctime> - <json>"
+KIND_CLIENT = 'client'    # client_messages.log: bare JSON
+
+CHUNK_SIZE = 32 * 1024 * 1024
+MAX_PENDING = 1000  # Unanswered user messages remembered per client
+MAX_ERRORS = 1000   # Distinct error messages kept
+GAP_GROWTH = 1.1    # Ratio between gap histogram buckets, about 5% error
+
+_NUMBERS = re.compile(r"\d+")
+
+
+def kind_of(path):
+    """Line format of a log file, or None for files this tool does not read"""
+    name = os.path.basename(path)
+    if name.endswith('.tmp'):
+        return None
+    # Cluster workers write "<name>.worker-<n>.log" in the same format
+    name = base_log_name(name)
+    for prefix, kind in (('chat_history.log', KIND_CHAT), ('system.log', KIND_SYSTEM),
+                         ('client_messages.log', KIND_CLIENT), ('mcp_server.log', KIND_SERVER),
+                         ('mcp_client.log', KIND_SERVER)):
+        if name.startswith(prefix):
+            return kind
+    return None
+
+
+def file_key(path):
+    """Identity of a log file's contents: a hash of its first line.
+
+    It survives the renames and gzip compression of log rotation, and
+    changes when a file is replaced. None until the first line is complete.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as stream:
+        first = stream.readline(4096)
+    if not first.endswith(b'\n'):
+        return None
+    return hashlib.blake2b(first, digest_size=16).hexdigest()
+
+
+def iter_lines(path, start, end):
+    """Yield the lines between two byte offsets from a memory map of the file"""
+    if end <= start:
+        return
+    with open(path, 'rb') as stream, mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        find = mapped.find
+        position = start
+        while position < end:
+            newline = find(b'\n', position, end)
+            if newline < 0:
+                newline = end
+            yield mapped[position:newline]
+            position = newline + 1
+
+
+def plan_chunks(path, start, chunk_size=CHUNK_SIZE):
+    """Split a file from ``start`` into line-aligned ranges, returns them and the offset after the last full line"""
+    size = os.path.getsize(path)
+    if size <= start:
+        return [], start
+    with open(path, 'rb') as stream, mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        # A line still being written is left for the next run
+        end = mapped.rfind(b'\n', start, size) + 1
+        if end <= start:
+            return [], start
+        chunks = []
+        position = start
+        while position < end:
+            boundary = position + chunk_size
+            if boundary >= end:
+                boundary = end
+            else:
+                boundary = mapped.find(b'\n', boundary, end) + 1 or end
+            chunks.append((position, boundary))
+            position = boundary
+    return chunks, end
+
+
+_minute_starts = {}
+
+
+def to_seconds(timestamp):
+    """Epoch seconds of an ISO 8601 timestamp, parsing each minute only once"""
+    try:
+        start = _minute_starts.get(timestamp[:16])
+        if start is None:
+            if len(_minute_starts) > 100000:
+                _minute_starts.clear()
+            start = _minute_starts[timestamp[:16]] = datetime.fromisoformat(timestamp[:16]).timestamp()
+        return start + float(timestamp[17:] or 0)
+    except (TypeError, ValueError):
+        # Time zone offsets and other variants
+        try:
+            return datetime.fromisoformat(timestamp).timestamp()
+        except (TypeError, ValueError):
+            return None
+
+
+class GapHistogram:
+    """Fixed-size log-scale histogram of response gaps in milliseconds"""
+
+    def __init__(self, counts=None):
+        self.counts = counts or {}  # bucket -> count, bucket n covers GAP_GROWTH**n .. GAP_GROWTH**(n+1) ms
+        self.count = sum(self.counts.values())
+        self.max = 0.0
+
+    def add(self, milliseconds):
+        bucket = int(math.log(milliseconds, GAP_GROWTH)) if milliseconds >= 1 else 0
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    def merge(self, other):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                # Geometric middle of the bucket
+                return min(GAP_GROWTH ** (bucket + 0.5), self.max)
+        return self.max
+
+
+class Aggregate:
+    """Mergeable counters over a run of log lines.
+
+    Chunks of the logs are parsed into one Aggregate each, in any process,
+    and merged in file order. Memory depends on the number of minutes,
+    clients and distinct errors seen, not on the size of the logs. A user
+    message is paired with the next ``ai_response`` from the same client.
+    Questions can still be waiting from earlier chunks, so a chunk only
+    records each client's question and answer times, and they are paired
+    when it is merged.
+    """
+
+    def __init__(self):
+        self.lines = 0
+        self.bytes = 0
+        self.bad_lines = 0
+        self.minutes = {}  # 'YYYY-MM-DD HH:MM' -> Counter of events
+        self.clients = {}  # client -> [user messages, AI responses, content characters]
+        self.levels = Counter()
+        self.errors = Counter()  # ERROR and WARNING messages with numbers masked
+        self.commands = Counter()
+        self.gaps = GapHistogram()
+        self.events = {}  # client -> array of question (+) and answer (-) times, until merged
+        self.pending = {}  # client -> deque of unanswered user message times
+        self.unanswered = 0  # Questions dropped past MAX_PENDING
+        self.unmatched = 0  # Answers with no earlier question
+
+    def count(self, minute, event):
+        bucket = self.minutes.get(minute)
+        if bucket is None:
+            bucket = self.minutes[minute] = Counter()
+        bucket[event] += 1
+
+    def add_chat(self, record):
+        timestamp = record.get('timestamp') or ''
+        client = str(record.get('client'))
+        is_user = record.get('type') != 'ai_response'
+        self.count(timestamp[:16].replace('T', ' '), 'user' if is_user else 'ai')
+        volume = self.clients.get(client)
+        if volume is None:
+            volume = self.clients[client] = [0, 0, 0]
+        volume[0 if is_user else 1] += 1
+        volume[2] += len(record.get('content') or '')
+
+        seconds = to_seconds(timestamp)
+        if seconds is None:
+            return
+        events = self.events.get(client)
+        if events is None:
+            events = self.events[client] = array('d')
+        events.append(seconds if is_user else -seconds)
+
+    def add_system(self, record):
+        self.count((record.get('timestamp') or '')[:16].replace('T', ' '), 'system')
+        self.commands[record.get('command') or '-'] += 1
+
+    def add_client(self, record):
+        if record.get('direction') == 'outgoing':
+            event = 'sent_user' if record.get('sender') == 'user' else 'sent_ai'
+        else:
+            event = 'received'
+        self.count((record.get('timestamp') or '')[:16].replace('T', ' '), event)
+
+    def add_server(self, line):
+        parts = line.split(' - ', 2)
+        if len(parts) < 3 or len(parts[0]) < 16 or parts[0][4:5] != '-':
+            # Traceback and other continuation lines
+            return
+        level = parts[1]
+        self.levels[level] += 1
+        if level in ('ERROR', 'WARNING', 'CRITICAL'):
+            self.count(parts[0][:16], 'error' if level != 'WARNING' else 'warning')
+            self.errors[_NUMBERS.sub('N', parts[2])[:200]] += 1
+        elif parts[2].startswith('New client connected'):
+            self.count(parts[0][:16], 'connect')
+
+    def merge(self, other):
+        """Add the counters of the lines that follow this aggregate's"""
+        self.lines += other.lines
+        self.bytes += other.bytes
+        self.bad_lines += other.bad_lines
+        for minute, events in other.minutes.items():
+            bucket = self.minutes.get(minute)
+            if bucket is None:
+                self.minutes[minute] = events
+            else:
+                bucket.update(events)
+        for client, volume in other.clients.items():
+            mine = self.clients.get(client)
+            if mine is None:
+                self.clients[client] = volume
+            else:
+                for index, value in enumerate(volume):
+                    mine[index] += value
+        self.levels.update(other.levels)
+        self.errors.update(other.errors)
+        if len(self.errors) > MAX_ERRORS:
+            self.errors = Counter(dict(self.errors.most_common(MAX_ERRORS)))
+        self.commands.update(other.commands)
+        self.gaps.merge(other.gaps)
+
+        self.unanswered += other.unanswered
+        self.unmatched += other.unmatched
+        for client, events in other.events.items():
+            self.pair(client, events)
+
+    def pair(self, client, events):
+        """Pair answers with the oldest questions still waiting from the same client"""
+        pending = self.pending.get(client)
+        if pending is None:
+            pending = self.pending[client] = deque()
+        add_gap = self.gaps.add
+        for seconds in events:
+            if seconds > 0:
+                pending.append(seconds)
+                if len(pending) > MAX_PENDING:
+                    pending.popleft()
+                    self.unanswered += 1
+            elif pending:
+                add_gap((-seconds - pending.popleft()) * 1000)
+            else:
+                self.unmatched += 1
+
+    def to_dict(self):
+        """JSON-serializable state, for resuming later"""
+        return {
+            'lines': self.lines, 'bytes': self.bytes, 'bad_lines': self.bad_lines,
+            'minutes': self.minutes, 'clients': self.clients,
+            'levels': self.levels, 'errors': self.errors, 'commands': self.commands,
+            'gaps': self.gaps.counts, 'gap_max': self.gaps.max,
+            'pending': {client: list(times) for client, times in self.pending.items() if times},
+            'unanswered': self.unanswered, 'unmatched': self.unmatched
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.lines = data['lines']
+        aggregate.bytes = data['bytes']
+        aggregate.bad_lines = data['bad_lines']
+        aggregate.minutes = {minute: Counter(events) for minute, events in data['minutes'].items()}
+        aggregate.clients = data['clients']
+        aggregate.levels = Counter(data['levels'])
+        aggregate.errors = Counter(data['errors'])
+        aggregate.commands = Counter(data['commands'])
+        aggregate.gaps = GapHistogram({int(bucket): count for bucket, count in data['gaps'].items()})
+        aggregate.gaps.max = data['gap_max']
+        aggregate.pending = {client: deque(times) for client, times in data['pending'].items()}
+        aggregate.unanswered = data['unanswered']
+        aggregate.unmatched = data['unmatched']
+        return aggregate
+
+    def report(self, minutes=15, top=10):
+        """Dashboard figures: totals, recent per-minute rates, top clients, response gaps and errors"""
+        totals = Counter()
+        for events in self.minutes.values():
+            totals.update(events)
+        busiest = max(self.minutes, key=lambda minute: sum(self.minutes[minute].values()), default=None)
+        clients = sorted(self.clients.items(), key=lambda item: item[1][0] + item[1][1], reverse=True)
+        return {
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'bad_lines': self.bad_lines,
+            'totals': dict(totals),
+            'user_ai_ratio': round(totals['user'] / totals['ai'], 3) if totals['ai'] else None,
+            'busiest_minute': busiest and {'minute': busiest, **self.minutes[busiest]},
+            'per_minute': {minute: dict(self.minutes[minute]) for minute in sorted(self.minutes)[-minutes:]},
+            'clients': [
+                {'client': client, 'user': volume[0], 'ai': volume[1], 'characters': volume[2]}
+                for client, volume in clients[:top]
+            ],
+            'client_count': len(self.clients),
+            'response_gap_ms': {
+                'count': self.gaps.count,
+                'p50': round(self.gaps.percentile(50), 1),
+                'p90': round(self.gaps.percentile(90), 1),
+                'p99': round(self.gaps.percentile(99), 1),
+                'max': round(self.gaps.max, 1),
+                'waiting': sum(len(times) for times in self.pending.values()),
+                'unanswered': self.unanswered,
+                'unmatched': self.unmatched
+            },
+            'levels': dict(self.levels),
+            'top_errors': self.errors.most_common(top),
+            'commands': dict(self.commands)
+        }
+
+
+def parse_chunk(task):
+    """Aggregate of one byte range of a log file, or of a compressed one from ``start`` to its end"""
+    path, kind, start, end = task
+    aggregate = Aggregate()
+    if end is None:
+        # Offsets into a compressed file count decompressed bytes, as in the file it was made from
+        with gzip.open(path, 'rb') as stream:
+            stream.seek(start)
+            parse_lines(aggregate, kind, (line.rstrip(b'\n') for line in stream))
+            aggregate.bytes = stream.tell() - start
+    else:
+        parse_lines(aggregate, kind, iter_lines(path, start, end))
+        aggregate.bytes = end - start
+    return aggregate
+
+
+def parse_lines(aggregate, kind, lines):
+    raw_decode = json.JSONDecoder().raw_decode
+    add = {KIND_CHAT: aggregate.add_chat, KIND_SYSTEM: aggregate.add_system,
+           KIND_CLIENT: aggregate.add_client}.get(kind)
+    for line in lines:
+        aggregate.lines += 1
+        line = line.decode('utf-8', 'replace')
+        if kind == KIND_SERVER:
+            aggregate.add_server(line)
+            continue
+        # JSON records follow the asctime prefix, which has no brace
+        brace = line.find('{')
+        try:
+            record = raw_decode(line, brace)[0] if brace >= 0 else None
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            aggregate.bad_lines += 1
+            continue
+        add(record)
+
+
+def find_logs(paths):
+    """Log files under the given files and directories, least recently written first"""
+    found = []
+    for path in paths:
+        names = [os.path.join(path, name) for name in os.listdir(path)] if os.path.isdir(path) else [path]
+        found.extend(name for name in names if os.path.isfile(name) and kind_of(name))
+    # Rotation keeps modification times, so this is the order the lines were written in
+    return sorted(set(found), key=lambda name: (kind_of(name), os.path.getmtime(name), name))
+
+
+def analyze(paths, state_path=None, jobs=None, chunk_size=CHUNK_SIZE):
+    """Aggregate every log line not yet seen, resuming from ``state_path`` when it exists.
+
+    Offsets are kept per file contents (see ``file_key``), so a file rotated
+    or compressed since the last run is read on from where it was left
+    rather than again from the start. Returns the aggregate and the number
+    of bytes read in this run.
+    """
+    state = {'files': {}, 'aggregate': None}
+    if state_path and os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as stream:
+            state = json.load(stream)
+    aggregate = Aggregate.from_dict(state['aggregate']) if state['aggregate'] else Aggregate()
+
+    tasks = []
+    offsets = {}
+    for path in find_logs(paths):
+        key = file_key(path)
+        if key is None or key in offsets:
+            continue  # Empty so far, or a copy of a file already listed
+        seen = state['files'].get(key, {})
+        offset = seen.get('offset', 0)
+        if path.endswith('.gz'):
+            # Compressed segments no longer change and are read once past the offset;
+            # daily archives from log_retention --archive can still gain gzip members
+            if not seen.get('done'):
+                tasks.append((path, kind_of(path), offset, None))
+            offsets[key] = {'path': path, 'offset': offset, 'done': not path.endswith('.jsonl.gz')}
+            continue
+        chunks, end = plan_chunks(path, offset, chunk_size)
+        tasks.extend((path, kind_of(path), start, stop) for start, stop in chunks)
+        offsets[key] = {'path': path, 'offset': end}
+
+    read = 0
+    if jobs == 1 or len(tasks) < 2:
+        results = map(parse_chunk, tasks)
+        pool = None
+    else:
+        pool = Pool(min(jobs or os.cpu_count() or 1, len(tasks)))
+        results = pool.imap(parse_chunk, tasks)
+    try:
+        # Merged in file order as they complete, so only a few chunk results are held at once
+        for (path, _, start, end), result in zip(tasks, results):
+            read += result.bytes
+            aggregate.merge(result)
+            if end is None:
+                offsets[file_key(path)]['offset'] = start + result.bytes
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if state_path:
+        temporary = f"{state_path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as stream:
+            json.dump({'files': offsets, 'aggregate': aggregate.to_dict()}, stream)
+        os.replace(temporary, state_path)
+    return aggregate, read
+
+
+def print_report(report, elapsed, read):
+    gap = report['response_gap_ms']
+    totals = report['totals']
+    print(f"Read {read / 2 ** 20:,.1f} MB in {elapsed:.2f}s ({read / 2 ** 20 / elapsed if elapsed else 0:,.1f} MB/s), "
+          f"{report['lines']:,} lines in total, {report['bad_lines']:,} unparsable")
+    print(f"Messages: {totals.get('user', 0):,} user, {totals.get('ai', 0):,} AI "
+          f"(ratio {report['user_ai_ratio']}), {totals.get('system', 0):,} system, "
+          f"{totals.get('sent_user', 0) + totals.get('sent_ai', 0):,} sent and "
+          f"{totals.get('received', 0):,} received by clients")
+    print(f"Response gap: {gap['count']:,} pairs, p50 {gap['p50']:,.0f} ms, p90 {gap['p90']:,.0f} ms, "
+          f"p99 {gap['p99']:,.0f} ms, max {gap['max']:,.0f} ms; {gap['waiting']} waiting, "
+          f"{gap['unanswered']} unanswered, {gap['unmatched']} unmatched")
+    if report['busiest_minute']:
+        busiest = dict(report['busiest_minute'])
+        minute = busiest.pop('minute')
+        print(f"Busiest minute: {minute} ({sum(busiest.values()):,} events)")
+
+    columns = ['user', 'ai', 'system', 'sent_user', 'sent_ai', 'received', 'connect', 'warning', 'error']
+    print(f"\n{'minute':<17}" + ''.join(f"{column:>10}" for column in columns))
+    for minute, events in report['per_minute'].items():
+        print(f"{minute:<17}" + ''.join(f"{events.get(column, 0):>10,}" for column in columns))
+
+    print(f"\n{'client':<28} {'user':>9} {'ai':>9} {'chars':>12}   ({report['client_count']:,} clients)")
+    for client in report['clients']:
+        print(f"{str(client['client']):<28} {client['user']:>9,} {client['ai']:>9,} {client['characters']:>12,}")
+
+    print("\nLevels: " + (', '.join(f"{level} {count:,}" for level, count in report['levels'].items()) or '-'))
+    for message, count in report['top_errors']:
+        print(f"{count:>9,}  {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rates, ratios, client volume and response gaps from the MCP logs")
+    parser.add_argument('paths', nargs='*', default=['logs'], help="log files or directories, logs/ by default; rotated and compressed segments "
+                             "are included, archives only when logs/archive is given")
+    parser.add_argument('--state', help="resume from and save offsets and totals to this file")
+    parser.add_argument('--jobs', type=int, help="parser processes, one per CPU by default")
+    parser.add_argument('--chunk-mb', type=int, default=CHUNK_SIZE // 2 ** 20, help="MB of log per task")
+    parser.add_argument('--minutes', type=int, default=15, help="most recent minutes to list")
+    parser.add_argument('--top', type=int, default=10, help="clients and errors to list")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    aggregate, read = analyze(args.paths, args.state, args.jobs, args.chunk_mb * 2 ** 20)
+    elapsed = time.perf_counter() - start
+    report = aggregate.report(args.minutes, args.top)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print_report(report, elapsed, read)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import argparse
+import gzip
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from operator import itemgetter
+
+SEGMENT_TIME = '%Y%m%d-%H%M%S'
+ARCHIVE_DIR = 'archive'
+
+# Rotated copies of a log: "<name>.log.<n>" from AuditLogWriter, "<name>.log.<YYYYmmdd-HHMMSS>"
+# from retention, either of them compressed to ".gz"
+_SEGMENT = re.compile(r"^(?P<log>.+\.log)\.(?P<suffix>\d+|\d{8}-\d{6}(?:-\d+)?)(?P<gz>\.gz)?$")
+
+# Logs holding one JSON record per line, which compaction can archive
+JSON_LOGS = ('chat_history.log', 'system.log', 'client_messages.log')
+
+# Per-process copy of a log written by a cluster worker: "<name>.worker-<n>.log"
+_WORKER_LOG = re.compile(r"^(?P<stem>.+)\.worker-\d+\.log$")
+_WORKER_INFIX = re.compile(r"\.worker-\d+(?=\.log)")
+
+# "<asctime> - ..." prefix of lines written by logging and AuditLogWriter
+_LINE_TIME = re.compile(r"^(\d{4}-\d\d-\d\d)[ T](\d\d:\d\d:\d\d)(?:[,.](\d+))?")
+
+
+def open_log(path):
+    """Text stream over a log file, plain or gzip-compressed"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, encoding='utf-8', errors='replace')
+
+
+def worker_log_path(path, worker):
+    """Path a cluster worker writes its share of a log to"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.worker-{worker}{extension}"
+
+
+def base_log_name(name):
+    """Name of the shared log a file belongs to, without any worker part"""
+    return _WORKER_INFIX.sub('', name, count=1)
+
+
+def line_time(line):
+    """ISO time of a log line: its asctime prefix, or a bare JSON record's ``start`` or ``timestamp``"""
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        value = (record.get('start') or record.get('timestamp')) if isinstance(record, dict) else None
+        return value if isinstance(value, str) else None
+    match = _LINE_TIME.match(line)
+    if match is None:
+        return None
+    date, clock, fraction = match.groups()
+    return f"{date}T{clock}.{fraction}" if fraction else f"{date}T{clock}"
+
+
+def timed_lines(stream):
+    """(time, line) for every line of a log; lines without a time, such as tracebacks, take the one before"""
+    last = ''
+    for line in stream:
+        last = line_time(line) or last
+        yield last, line
+
+
+def merge_worker_logs(directory='logs'):
+    """Append each log's per-worker files to the shared log in timestamp order, then delete them.
+
+    Lines are merged on the time parsed from them, the asctime prefix or
+    the ``start`` / ``timestamp`` of a bare JSON record, so text logs, audit
+    logs and trace logs all come out in time order as long as each worker
+    file is. Only run it while no worker is writing. Returns the number of
+    lines merged.
+    """
+    groups = {}
+    for name in sorted(os.listdir(directory)):
+        match = _WORKER_LOG.match(name)
+        if match:
+            groups.setdefault(f"{match.group('stem')}.log", []).append(os.path.join(directory, name))
+    merged = 0
+    for log, paths in groups.items():
+        streams = [open_log(path) for path in paths]
+        try:
+            with open(os.path.join(directory, log), 'a', encoding='utf-8') as output:
+                for _, line in heapq.merge(*(timed_lines(stream) for stream in streams), key=itemgetter(0)):
+                    output.write(line if line.endswith('\n') else line + '\n')
+                    merged += 1
+                output.flush()
+                os.fsync(output.fileno())
+        finally:
+            for stream in streams:
+                stream.close()
+        for path in paths:
+            os.remove(path)
+    return merged
+
+
+class LogRetention:
+    """Keeps the logs directory within age and size limits while servers write to it.
+
+    ``rotate`` renames active logs that reached ``rotate_bytes`` to
+    ``<name>.<YYYYmmdd-HHMMSS>``. Nothing is truncated: WatchedFileHandler and
+    AuditLogWriter notice the rename and reopen the path, and whatever they
+    still write to the old file stays in the segment. Segments are gzipped
+    once they have not been written for ``settle`` seconds. ``enforce``
+    deletes segments older than ``max_age_days``, then the oldest ones until
+    the directory fits in ``max_total_bytes``; active logs are never
+    deleted. With ``archive=True`` the JSON segments are instead compacted
+    into one gzipped JSONL file per log and day under ``archive/``. A
+    background thread runs all of it every ``interval`` seconds.
+    """
+
+    def __init__(self, directory='logs', rotate_bytes=32 * 1024 * 1024, max_age_days=30,
+                 max_total_bytes=1024 * 1024 * 1024, compress=True, compresslevel=6, archive=False,
+                 settle=5.0, interval=60.0):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self.archive = archive
+        self.settle = settle
+        self.interval = interval
+        self.rotated = 0
+        self.compressed = 0
+        self.archived = 0
+        self.deleted = 0
+        self.freed_bytes = 0
+        self.running = False
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def archive_directory(self):
+        return os.path.join(self.directory, ARCHIVE_DIR)
+
+    def active_logs(self):
+        """Paths of the logs being written"""
+        return sorted(
+            os.path.join(self.directory, name) for name in os.listdir(self.directory)
+            if name.endswith('.log') and os.path.isfile(os.path.join(self.directory, name))
+        )
+
+    def segments(self):
+        """Rotated segments and archives as (mtime, size, path), oldest first"""
+        found = []
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if _SEGMENT.match(name)]
+        if os.path.isdir(self.archive_directory):
+            paths.extend(os.path.join(self.archive_directory, name) for name in os.listdir(self.archive_directory)
+                         if name.endswith('.jsonl.gz'))
+        for path in paths:
+            try:
+                info = os.stat(path)
+            except FileNotFoundError:
+                continue  # Compressed or deleted meanwhile
+            found.append((info.st_mtime, info.st_size, path))
+        return sorted(found)
+
+    def segment_path(self, path, when):
+        """Unused segment name for a log rotated at ``when``"""
+        stamp = time.strftime(SEGMENT_TIME, time.localtime(when))
+        candidate = f"{path}.{stamp}"
+        index = 1
+        while os.path.exists(candidate) or os.path.exists(candidate + '.gz'):
+            candidate = f"{path}.{stamp}-{index}"
+            index += 1
+        return candidate
+
+    def rotate(self, force=False):
+        """Rename active logs past ``rotate_bytes``, or every non-empty one with ``force``"""
+        rotated = []
+        for path in self.active_logs():
+            try:
+                size = os.path.getsize(path)
+                if size == 0 or (size < self.rotate_bytes and not force):
+                    continue
+                segment = self.segment_path(path, time.time())
+                os.rename(path, segment)
+            except OSError as e:
+                # Windows refuses to rename files that are open
+                logging.warning(f"Could not rotate {path}: {e}")
+                continue
+            rotated.append(segment)
+        self.rotated += len(rotated)
+        return rotated
+
+    def adopt(self):
+        """Rename AuditLogWriter's numbered backups to timestamped segments so they are never shifted again"""
+        for name in os.listdir(self.directory):
+            match = _SEGMENT.match(name)
+            if not match or not match.group('suffix').isdigit() or match.group('gz'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                os.rename(path, self.segment_path(os.path.join(self.directory, match.group('log')),
+                                                  os.path.getmtime(path)))
+            except OSError:
+                pass  # Shifted by its writer meanwhile; picked up next time
+
+    def settled(self):
+        """Uncompressed segments nothing has written to for ``settle`` seconds"""
+        deadline = time.time() - self.settle
+        return [path for mtime, _, path in self.segments()
+                if not path.endswith('.gz') and mtime <= deadline]
+
+    def compress_segment(self, path):
+        """Gzip a segment, keeping its modification time"""
+        mtime = os.path.getmtime(path)
+        temporary = path + '.gz.tmp'
+        with open(path, 'rb') as source, gzip.open(temporary, 'wb', compresslevel=self.compresslevel) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.utime(temporary, (mtime, mtime))
+        os.replace(temporary, path + '.gz')
+        os.remove(path)
+        self.compressed += 1
+
+    def compact(self, paths):
+        """Append the records of JSON log segments to per-day archives, then delete the segments"""
+        os.makedirs(self.archive_directory, exist_ok=True)
+        for path in sorted(paths, key=os.path.getmtime):
+            # Worker segments go to the same archive as the shared log
+            log = base_log_name(_SEGMENT.match(os.path.basename(path)).group('log'))
+            temporaries = {}  # day -> (temporary path, gzip stream)
+            try:
+                with open_log(path) as stream:
+                    for line in stream:
+                        record = self.parse_record(line)
+                        if record is None:
+                            continue
+                        day = (record.get('timestamp') or '')[:10] or 'unknown'
+                        if day not in temporaries:
+                            temporary = os.path.join(self.archive_directory, f"{log}.{day}.jsonl.gz.tmp")
+                            temporaries[day] = (temporary, gzip.open(temporary, 'wt', encoding='utf-8',
+                                                                     compresslevel=9))
+                        temporaries[day][1].write(json.dumps(record) + '\n')
+                for day, (temporary, output) in temporaries.items():
+                    output.close()
+                    # gzip members can be concatenated, so each run appends one per day
+                    with open(temporary, 'rb') as member, \
+                            open(os.path.join(self.archive_directory, f"{log}.{day}.jsonl.gz"), 'ab') as archive:
+                        shutil.copyfileobj(member, archive, 1024 * 1024)
+                        archive.flush()
+                        os.fsync(archive.fileno())
+            finally:
+                for temporary, output in temporaries.values():
+                    output.close()
+                    if os.path.exists(temporary):
+                        os.remove(temporary)
+            os.remove(path)
+            self.archived += 1
+
+    @staticmethod
+    def parse_record(line):
+        """Record of a ``<asctime> - <json>`` or bare JSON line, with its time filled in from the prefix"""
+        brace = line.find('{')
+        if brace < 0:
+            return None
+        try:
+            record = json.loads(line[brace:])
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        if not record.get('timestamp') and brace:
+            record['timestamp'] = line[:brace].split(' - ')[0].replace(' ', 'T').replace(',', '.')
+        return record
+
+    def enforce(self):
+        """Delete segments past the age limit, then the oldest ones past the size quota"""
+        deleted = []
+        segments = self.segments()
+        if self.max_age_days is not None:
+            deadline = time.time() - self.max_age_days * 86400
+            for mtime, size, path in segments:
+                if mtime < deadline:
+                    deleted.append((size, path))
+            segments = [segment for segment in segments if segment[0] >= deadline]
+        if self.max_total_bytes is not None:
+            total = sum(size for _, size, _ in segments) + sum(
+                os.path.getsize(path) for path in self.active_logs())
+            for _, size, path in segments:
+                if total <= self.max_total_bytes:
+                    break
+                deleted.append((size, path))
+                total -= size
+        for size, path in deleted:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.deleted += 1
+            self.freed_bytes += size
+        return [path for _, path in deleted]
+
+    def run_once(self, force_rotate=False):
+        """One retention pass: rotate, compress or compact, then apply the quotas"""
+        with self._lock:
+            self.adopt()
+            self.rotate(force_rotate)
+            settled = self.settled()
+            if self.archive:
+                json_logs = [path for path in self.segments_of(JSON_LOGS) if path.endswith('.gz') or path in settled]
+                self._logged(self.compact, json_logs)
+                settled = [path for path in settled if path not in json_logs]
+            if self.compress:
+                for path in settled:
+                    self._logged(self.compress_segment, path)
+            self.enforce()
+
+    def segments_of(self, logs):
+        """Rotated segments of the given logs"""
+        paths = []
+        for _, _, path in self.segments():
+            match = _SEGMENT.match(os.path.basename(path))
+            if match and base_log_name(match.group('log')) in logs:
+                paths.append(path)
+        return paths
+
+    def _logged(self, fn, *args):
+        try:
+            fn(*args)
+        except OSError as e:
+            logging.error(f"Log retention error: {e}")
+
+    def start(self):
+        """Run retention passes in a background thread"""
+        self.running = True
+        self._thread = threading.Thread(target=self.run, name='log-retention')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        while self.running:
+            try:
+                self.run_once()
+            except Exception as e:
+                logging.error(f"Log retention error: {e}")
+            self._wakeup.wait(self.interval)
+
+    def stats(self):
+        """Disk usage and retention counters"""
+        segments = self.segments()
+        return {
+            'active_bytes': sum(os.path.getsize(path) for path in self.active_logs()),
+            'segments': len(segments),
+            'segment_bytes': sum(size for _, size, _ in segments),
+            'oldest_segment': datetime.fromtimestamp(segments[0][0]).isoformat() if segments else None,
+            'rotated': self.rotated,
+            'compressed': self.compressed,
+            'archived': self.archived,
+            'deleted': self.deleted,
+            'freed_bytes': self.freed_bytes
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotate, compress, compact and expire the MCP logs")
+    parser.add_argument('--dir', default='logs')
+    parser.add_argument('--rotate-mb', type=float, default=32, help="rotate active logs past this size")
+    parser.add_argument('--force-rotate', action='store_true', help="rotate every non-empty active log now")
+    parser.add_argument('--max-age-days', type=float, default=30)
+    parser.add_argument('--max-total-mb', type=float, default=1024, help="quota for the whole directory")
+    parser.add_argument('--no-compress', action='store_true')
+    parser.add_argument('--archive', action='store_true', help="compact JSON logs into daily JSONL.gz archives")
+    parser.add_argument('--settle', type=float, default=5.0, help="seconds a segment must be idle before compression")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="keep running a pass every SECONDS")
+    args = parser.parse_args()
+
+    retention = LogRetention(
+        args.dir, rotate_bytes=int(args.rotate_mb * 1024 * 1024), max_age_days=args.max_age_days,
+        max_total_bytes=int(args.max_total_mb * 1024 * 1024), compress=not args.no_compress,
+        archive=args.archive, settle=args.settle, interval=args.watch or 60.0
+    )
+    if args.watch:
+        retention.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            retention.stop()
+    else:
+        retention.run_once(force_rotate=args.force_rotate)
+    print(json.dumps(retention.stats()))
+
+
+if __name__ == "__main__":
+    main()
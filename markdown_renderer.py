@@ -0,0 +1,173 @@
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+import markdown
+from markdown.treeprocessors import Treeprocessor
+
+EXTENSIONS = ('extra', 'smarty', 'tables')
+
+# Text without any of these renders as bare paragraphs. Besides markup
+# characters this rules out what smarty rewrites (quotes, dashes, ellipses),
+# lines that could start a list, heading, code block or definition, and hard
+# line breaks.
+_MARKUP = re.compile(
+    r"[\\`*_{}\[\]<>#+|~&!'\"=\t\r\x00-\x08\x0b-\x1f]|--|\.\.|^[ ]*[-:]|^[ ]*\d+[.)]|^ {4}| {2,}\n",
+    re.MULTILINE
+)
+_SPACE_LINES = re.compile(r"^ +$", re.MULTILINE)
+_BLANK_LINES = re.compile(r"\n{2,}")
+
+# Attributes and URL schemes kept by sanitization; everything else is dropped
+SAFE_ATTRIBUTES = {'href', 'src', 'alt', 'title', 'class', 'id', 'colspan', 'rowspan', 'start', 'rel'}
+SAFE_SCHEMES = ('http', 'https', 'mailto', 'tel')
+_SCHEME = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*):")
+_IGNORED_IN_URLS = re.compile(r"[\x00-\x20\x7f-\x9f\s]")  # Browsers skip these when reading a scheme
+_ALIGN = re.compile(r"^text-align: (?:left|right|center);$")
+
+
+def url_scheme(value):
+    """Scheme a browser would read from an attribute value, or None for a relative URL.
+
+    Entities are decoded until nothing changes, since ``&#58;`` and
+    ``&#x6A;`` in the serialized attribute are read as ``:`` and ``j``.
+    """
+    decoded = html.unescape(value)
+    while decoded != value:
+        value, decoded = decoded, html.unescape(decoded)
+    match = _SCHEME.match(_IGNORED_IN_URLS.sub('', value))
+    return match.group(1).lower() if match else None
+
+
+class SanitizeTreeprocessor(Treeprocessor):
+    """Drops event handlers, styles and script URLs from the rendered tree.
+
+    Raw HTML never reaches the tree because its preprocessor and inline
+    pattern are removed, so what is left to check are the attributes
+    markdown itself writes, including any set with ``{: ...}`` attribute
+    lists.
+    """
+
+    def run(self, root):
+        for element in root.iter():
+            if not element.attrib:
+                continue
+            for name, value in list(element.attrib.items()):
+                if name in ('href', 'src'):
+                    scheme = url_scheme(value)
+                    if scheme is not None and scheme not in SAFE_SCHEMES:
+                        del element.attrib[name]
+                elif name == 'style':
+                    # Table cells are aligned with an inline style
+                    if not _ALIGN.match(value):
+                        del element.attrib[name]
+                elif name not in SAFE_ATTRIBUTES:
+                    del element.attrib[name]
+
+
+def create_markdown(extensions=EXTENSIONS, sanitize=True):
+    """Markdown converter for AI responses; with ``sanitize`` raw HTML is shown as text"""
+    md = markdown.Markdown(extensions=list(extensions))
+    if sanitize:
+        md.preprocessors.deregister('html_block', strict=False)
+        md.inlinePatterns.deregister('html', strict=False)
+        # After attr_list has set attributes, before smarty and serialization
+        md.treeprocessors.register(SanitizeTreeprocessor(md), 'sanitize', 5)
+    return md
+
+
+def render_plain(text):
+    """HTML of text that ``is_plain`` accepted, identical to what markdown produces"""
+    # Lines of spaces count as blank
+    text = _SPACE_LINES.sub('', text).strip('\n')
+    return '\n'.join(f"<p>{paragraph.lstrip(' ')}</p>" for paragraph in _BLANK_LINES.split(text)
+                     if paragraph.strip())
+
+
+def is_plain(text):
+    """Whether text has nothing markdown would treat as markup"""
+    return _MARKUP.search(text) is None
+
+
+class MarkdownRenderer:
+    """Renders AI responses to sanitized HTML, reusing converters and results.
+
+    Each thread keeps one ``markdown.Markdown`` instance and resets it
+    between documents instead of building a new one, with its extensions,
+    per call. Rendered HTML is cached by a hash of the text in an LRU
+    bounded by both entries and characters. Text without any markup skips
+    the parser altogether.
+    """
+
+    def __init__(self, extensions=EXTENSIONS, sanitize=True, max_entries=1024, max_chars=4 * 1024 * 1024):
+        self.extensions = tuple(extensions)
+        self.sanitize = sanitize
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self.plain = 0
+        self.evictions = 0
+        self.chars = 0
+        self._cache = OrderedDict()  # Text hash -> HTML
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def md(self):
+        """This thread's converter"""
+        md = getattr(self._local, 'md', None)
+        if md is None:
+            md = self._local.md = create_markdown(self.extensions, self.sanitize)
+        return md
+
+    def render(self, text):
+        """HTML of a markdown text"""
+        if self.max_entries <= 0:
+            return self.convert(text)
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        with self._lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = self.convert(text)
+        if len(html) <= self.max_chars // 4:
+            with self._lock:
+                if key not in self._cache:
+                    self._cache[key] = html
+                    self.chars += len(html)
+                    while len(self._cache) > self.max_entries or self.chars > self.max_chars:
+                        _, evicted = self._cache.popitem(last=False)
+                        self.chars -= len(evicted)
+                        self.evictions += 1
+        return html
+
+    def convert(self, text):
+        """Render without the cache"""
+        if is_plain(text):
+            self.plain += 1
+            return render_plain(text)
+        return self.md.reset().convert(text)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.chars = 0
+
+    def stats(self):
+        """Cache hit rate and size, and how many texts took the plain-text path"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._cache),
+            'chars': self.chars,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'plain': self.plain
+        }
@@ -0,0 +1,69 @@
+import re
+from markdown_renderer import MarkdownRenderer
+
+FENCE = re.compile(r"^\s*(?:```|~~~)")
+LIST_ITEM = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+
+
+class MarkdownStream:
+    """Renders markdown that arrives in pieces, one finished block at a time.
+
+    Text is held back until a block boundary is certain: a blank line
+    outside a code fence followed by a line that does not continue a list
+    or an indented block. Only the finished blocks are converted, so the
+    cost stays proportional to the new text instead of re-rendering
+    everything streamed so far. Blocks are converted by ``renderer``'s
+    per-thread converter, bypassing its cache.
+    """
+
+    def __init__(self, renderer=None):
+        self.renderer = renderer or MarkdownRenderer(max_entries=0)
+        self.pending = ''  # Text received but not rendered yet
+        self._parts = []
+        self._scan = 0  # Start of the first line of pending not examined yet
+        self._fence = False
+        self._after_blank = False
+
+    @property
+    def text(self):
+        """Everything fed so far"""
+        return ''.join(self._parts)
+
+    def feed(self, text):
+        """Add streamed text, returns the HTML of any blocks it completed"""
+        self._parts.append(text)
+        self.pending += text
+        cut = 0
+        while True:
+            end = self.pending.find('\n', self._scan)
+            line = self.pending[self._scan:] if end == -1 else self.pending[self._scan:end]
+            if self._after_blank and line.strip():
+                # The first characters decide whether the line continues the previous block
+                if end == -1 and len(line) < 3:
+                    break
+                if not line[0].isspace() and not LIST_ITEM.match(line):
+                    cut = self._scan
+                self._after_blank = False
+            if end == -1:
+                break
+            if FENCE.match(line):
+                self._fence = not self._fence
+            elif not self._fence and not line.strip():
+                self._after_blank = True
+            self._scan = end + 1
+
+        if not cut:
+            return ''
+        block, self.pending = self.pending[:cut], self.pending[cut:]
+        self._scan -= cut
+        return self.render(block)
+
+    def close(self):
+        """Render whatever is left once the stream has ended"""
+        block, self.pending = self.pending, ''
+        self._scan = 0
+        self._fence = self._after_blank = False
+        return self.render(block) if block.strip() else ''
+
+    def render(self, text):
+        return self.renderer.convert(text)
@@ -1,142 +1,474 @@
 import socket
-import json
 import threading
 import logging
+from logging.handlers import WatchedFileHandler
 import os
-from queue import Queue
+import time
+import heapq
+import itertools
+from concurrent.futures import Future
+from queue import Queue, Empty, Full
 from datetime import datetime
+from mcp_protocol import (MessageDecoder, ProtocolError, CODEC_COMPACT, PROTOCOL_COMPACT, PROTOCOL_FRAMED, PROTOCOL_JSON,
+                          encode_message, encode_batch, encode_hello)
+from mcp_fanout import POLICY_DROP_OLDEST, POLICY_DROP_NEWEST
+from audit_log import get_audit_log
+from metrics import REGISTRY
+from admission import Overloaded
 
 # Create logs directory if it doesn't exist
 if not os.path.exists('logs'):
     os.makedirs('logs')
 
-# Configure logging to both file and console
+# Configure logging to both file and console; the file is reopened when
+# log retention rotates it
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(os.path.join('logs', 'mcp_client.log')),
+        WatchedFileHandler(os.path.join('logs', 'mcp_client.log')),
         logging.StreamHandler()
     ]
 )
 
+MESSAGES_SENT = REGISTRY.counter('mcp_client_messages_sent', "Messages sent to the MCP server")
+SEND_ERRORS = REGISTRY.counter('mcp_client_send_errors', "Sends that failed and dropped the connection")
+SEND_TIME = REGISTRY.histogram('mcp_client_send_seconds', "Time to encode and send a message or batch")
+ACK_TIME = REGISTRY.histogram('mcp_client_ack_seconds', "Time from sending a tracked message to its acknowledgment")
+ACK_TIMEOUTS = REGISTRY.counter('mcp_client_ack_timeouts', "Tracked messages not acknowledged in time")
+INBOX_DROPPED = REGISTRY.counter('mcp_client_inbox_dropped', "Unsolicited messages dropped from a full inbox")
+
+CLIENT_MESSAGE_LOG = os.path.join('logs', 'client_messages.log')
+
+
+def outgoing_chat_entry(content, is_user, timestamp):
+    """client_messages.log record of a chat message sent to the server"""
+    return {
+        'timestamp': timestamp,
+        'direction': 'outgoing',
+        'type': 'chat',
+        'sender': 'user' if is_user else 'assistant',
+        'content': content
+    }
+
+
+class AckTimeout(TimeoutError):
+    """Raised by a send future when the server did not acknowledge the message in time"""
+
+
 class MCPClient:
-    def __init__(self, host='localhost', port=5555):
+    """Connection to the MCP server.
+
+    Messages sent with ``send_message_async`` carry an ID and return a
+    Future resolved by the server's matching acknowledgment, so many sends
+    can be in flight on one connection; at most ``max_in_flight`` at a
+    time, further sends wait for a slot. A message the server sheds is
+    acknowledged 'busy' and its Future fails with Overloaded. Acknowledgments
+    are never queued.
+    Unsolicited messages without a registered handler go to a bounded
+    inbox read by ``get_next_message``; when it is full ``inbox_policy``
+    drops the oldest or the newest message.
+    """
+
+    def __init__(self, host='localhost', port=5555, protocol=PROTOCOL_FRAMED, handshake_timeout=2.0,
+                 max_in_flight=1000, ack_timeout=30.0, inbox_size=1000, inbox_policy=POLICY_DROP_OLDEST,
+                 connect_timeout=5.0):
+        if inbox_policy not in (POLICY_DROP_OLDEST, POLICY_DROP_NEWEST):
+            raise ValueError(f"Unknown inbox policy: {inbox_policy}")
         self.host = host
         self.port = port
+        # PROTOCOL_JSON talks to servers expecting bare JSON; PROTOCOL_COMPACT
+        # offers the compact codec on connect and falls back to JSON frames
+        self.protocol = protocol
+        self.handshake_timeout = handshake_timeout
+        # An unreachable server fails the connect after this long rather than the OS timeout
+        self.connect_timeout = connect_timeout
+        # Protocol used to send on the current connection
+        self.wire_protocol = PROTOCOL_FRAMED if protocol == PROTOCOL_COMPACT else protocol
         self.socket = None
         self.connected = False
-        self.message_queue = Queue()
+        self.inbox_policy = inbox_policy
+        self.message_queue = Queue(maxsize=inbox_size)
         self.response_handlers = {}
+        self.subscriptions = set()  # Broadcast topics, subscribed to again on every connect
         self.running = False
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.acks = 0
+        self.unmatched_acks = 0  # Acks of untracked sends, or that arrived after their timeout
+        self.busy = 0  # Messages the server shed
+        self.ack_timeouts = 0
+        self.inbox_dropped = 0
+        self._send_lock = threading.Lock()  # Keeps concurrent sends from interleaving on the socket
+        self._state_lock = threading.RLock()  # Serializes connect and disconnect
+        self._ids = itertools.count(1)
+        self._pending = {}  # Message ID -> (future, sent time, deadline)
+        self._deadlines = []  # Heap of (deadline, message ID), including some already settled
+        self._pending_lock = threading.Condition()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._expiry_thread = None
         
-        # Create a separate log file for message history with JSON formatting
-        self.message_logger = logging.getLogger('messages')
-        self.message_logger.setLevel(logging.INFO)
-        message_handler = logging.FileHandler(os.path.join('logs', 'client_messages.log'))
-        formatter = logging.Formatter('%(message)s')
-        message_handler.setFormatter(formatter)
-        self.message_logger.addHandler(message_handler)
-        # Prevent duplicate logging
-        self.message_logger.propagate = False
+        # Message history is written as bare JSON lines by a background writer
+        # shared by every client in the process
+        self.message_log = get_audit_log(CLIENT_MESSAGE_LOG, timestamp_prefix=False)
 
     def connect(self):
         """Connect to the MCP server"""
         try:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
-            self.connected = True
-            self.running = True
+            with self._state_lock:
+                sock = self.open_socket()
+                decoder = MessageDecoder(PROTOCOL_JSON if self.protocol == PROTOCOL_JSON else PROTOCOL_FRAMED)
+                wire_protocol, pending = self.wire_protocol, []
+                if self.protocol == PROTOCOL_COMPACT:
+                    wire_protocol, pending = self.handshake(sock, decoder)
+                    if wire_protocol is None:
+                        busy = [message for message in pending if message.get('command') == 'busy']
+                        if busy:
+                            # At its connection limit rather than without the handshake
+                            sock.close()
+                            raise Overloaded(busy[0].get('reason', 'connections'), busy[0].get('retry_after', 1.0))
+                        # Servers without the handshake drop the connection on the hello frame
+                        logging.info("MCP server does not negotiate codecs, reconnecting with JSON frames")
+                        sock.close()
+                        sock = self.open_socket()
+                        decoder = MessageDecoder(PROTOCOL_FRAMED)
+                        wire_protocol, pending = PROTOCOL_FRAMED, []
+                self.socket = sock
+                self.wire_protocol = wire_protocol
+                self.connected = True
+                self.running = True
 
-            # Start receiver thread
-            receiver_thread = threading.Thread(target=self.receive_messages)
-            receiver_thread.daemon = True
-            receiver_thread.start()
+                # Start receiver thread
+                receiver_thread = threading.Thread(target=self.receive_messages, args=(sock, decoder, pending))
+                receiver_thread.daemon = True
+                receiver_thread.start()
 
-            logging.info(f"Connected to MCP server at {self.host}:{self.port}")
+            logging.info(f"Connected to MCP server at {self.host}:{self.port} ({self.wire_protocol})")
+            for topic in sorted(self.subscriptions):
+                self.send_system_message(topic, command='subscribe')
             return True
 
         except Exception as e:
             logging.error(f"Connection error: {e}")
             return False
 
+    def open_socket(self):
+        """TCP connection to the server, blocking once established"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.settimeout(None)
+        return sock
+
+    def ping(self, timeout=2.0):
+        """Whether the server acknowledges a message within ``timeout`` seconds, catching half-open connections"""
+        if not self.connected:
+            return False
+        try:
+            self.send_message_async('system', '', timeout, command='ping').result(timeout + 1.0)
+        except Overloaded:
+            pass  # Shedding load, but alive
+        except Exception:
+            return False
+        return True
+
+    def handshake(self, sock, decoder):
+        """Offer the compact codec to the server.
+
+        Returns the protocol to send with, or None if the server closed the
+        connection, and any messages that arrived ahead of its answer.
+        """
+        sock.sendall(encode_hello([CODEC_COMPACT]))
+        sock.settimeout(self.handshake_timeout)
+        messages = []
+        try:
+            while decoder.hello is None:
+                if not decoder.recv_from(sock):
+                    return None, messages
+                messages.extend(decoder.messages())
+        except socket.timeout:
+            logging.warning("No codec answer from MCP server, sending JSON frames")
+            return PROTOCOL_FRAMED, messages
+        except ProtocolError:
+            return None, messages
+        finally:
+            sock.settimeout(None)
+        codecs = decoder.hello.get('codecs', []) if isinstance(decoder.hello, dict) else []
+        return (PROTOCOL_COMPACT if CODEC_COMPACT in codecs else PROTOCOL_FRAMED), messages
+
     def disconnect(self):
         """Disconnect from the MCP server"""
-        self.running = False
-        self.connected = False
-        if self.socket:
-            try:
-                self.socket.close()
-            except:
-                pass
+        with self._state_lock:
+            self.running = False
+            self.connected = False
+            self.fail_pending(ConnectionError("Disconnected from MCP server"))
+            if self.socket:
+                try:
+                    # Shutdown first so the server sees the disconnect even while
+                    # the receiver thread is still blocked reading the socket
+                    self.socket.shutdown(socket.SHUT_RDWR)
+                except:
+                    pass
+                try:
+                    self.socket.close()
+                except:
+                    pass
         logging.info("Disconnected from MCP server")
 
+    def build_message(self, message_type, content, **kwargs):
+        """Build a message dictionary ready to be sent"""
+        return {
+            'type': message_type,
+            'content': content,
+            'timestamp': datetime.now().isoformat(),
+            **kwargs
+        }
+
     def send_message(self, message_type, content, **kwargs):
         """Send a message to the MCP server"""
+        return self.send_prepared(self.build_message(message_type, content, **kwargs))
+
+    def send_prepared(self, message):
+        """Send a message built by ``build_message``"""
         if not self.connected:
             logging.error("Not connected to MCP server")
             return False
 
         try:
-            message = {
-                'type': message_type,
-                'content': content,
-                'timestamp': datetime.now().isoformat(),
-                **kwargs
-            }
-
+            start = time.perf_counter()
             # Only log in send_chat_message, not here
-            self.socket.send(json.dumps(message).encode('utf-8'))
-            logging.info(f"Sent {message_type} message to server")
+            data = encode_message(message, self.wire_protocol)
+            with self._send_lock:
+                self.socket.sendall(data)
+            SEND_TIME.since(start)
+            MESSAGES_SENT.inc()
+            logging.debug("Sent %s message to server", message.get('type'))
             return True
 
         except Exception as e:
+            SEND_ERRORS.inc()
             logging.error(f"Error sending message: {e}")
             self.disconnect()
             return False
 
+    def send_batch(self, messages):
+        """Send several prepared messages to the MCP server with a single send"""
+        if not self.connected:
+            logging.error("Not connected to MCP server")
+            return False
+        if not messages:
+            return True
+
+        try:
+            start = time.perf_counter()
+            data = encode_batch(messages, self.wire_protocol)
+            with self._send_lock:
+                self.socket.sendall(data)
+            SEND_TIME.since(start)
+            MESSAGES_SENT.inc(len(messages))
+            logging.debug("Sent batch of %d messages to server", len(messages))
+            return True
+
+        except Exception as e:
+            SEND_ERRORS.inc()
+            logging.error(f"Error sending batch: {e}")
+            self.disconnect()
+            return False
+
+    def send_message_async(self, message_type, content, timeout=None, **kwargs):
+        """Send a message and return a Future resolved with its acknowledgment.
+
+        The Future fails with AckTimeout when no acknowledgment arrives
+        within ``timeout`` seconds (``ack_timeout`` by default), and with
+        ConnectionError if the connection is lost first.
+        """
+        return self.send_batch_async([self.build_message(message_type, content, **kwargs)], timeout)[0]
+
+    def send_batch_async(self, messages, timeout=None):
+        """Send prepared messages with one send and return a Future per message"""
+        if len(messages) > self.max_in_flight:
+            raise ValueError(f"A batch of {len(messages)} messages exceeds max_in_flight={self.max_in_flight}")
+        timeout = self.ack_timeout if timeout is None else timeout
+        futures = []
+        try:
+            for message in messages:
+                futures.append(self.track(message, timeout))
+        except AckTimeout as e:
+            for message in messages[:len(futures)]:
+                self.settle(message['id'], error=e)
+            raise
+        sent = self.send_prepared(messages[0]) if len(messages) == 1 else self.send_batch(messages)
+        if not sent:
+            error = ConnectionError("Not connected to MCP server")
+            for message in messages:
+                self.settle(message['id'], error=error)
+        return futures
+
+    def track(self, message, timeout):
+        """Give a message an ID and register the Future its acknowledgment resolves"""
+        # Wait for a free slot so a stalled server bounds what is held here
+        deadline = time.monotonic() + timeout
+        while not self._slots.acquire(timeout=max(0.0, min(deadline - time.monotonic(), 1.0))):
+            if time.monotonic() >= deadline:
+                raise AckTimeout(f"{self.max_in_flight} messages still awaiting acknowledgment after {timeout}s")
+        message['id'] = message_id = next(self._ids)
+        future = Future()
+        with self._pending_lock:
+            expires = time.monotonic() + timeout
+            self._pending[message_id] = (future, time.perf_counter(), expires)
+            heapq.heappush(self._deadlines, (expires, message_id))
+            if self._expiry_thread is None:
+                self._expiry_thread = threading.Thread(target=self.expire_pending, name='mcp-ack-expiry')
+                self._expiry_thread.daemon = True
+                self._expiry_thread.start()
+            elif self._deadlines[0][1] == message_id:
+                # Expires before whatever the expiry thread is waiting for
+                self._pending_lock.notify()
+        return future
+
+    def settle(self, message_id, ack=None, error=None):
+        """Resolve or fail the Future of a tracked message; returns False if it was not pending"""
+        with self._pending_lock:
+            entry = self._pending.pop(message_id, None)
+        if entry is None:
+            return False
+        self._slots.release()
+        future, sent, _ = entry
+        if not future.set_running_or_notify_cancel():
+            return True  # Cancelled by the caller, nobody is waiting for it
+        if error is not None:
+            future.set_exception(error)
+        else:
+            ACK_TIME.since(sent)
+            future.set_result(ack)
+        return True
+
+    def fail_pending(self, error):
+        """Fail every message still awaiting acknowledgment"""
+        with self._pending_lock:
+            pending = list(self._pending)
+        for message_id in pending:
+            self.settle(message_id, error=error)
+
+    def expire_pending(self):
+        """Fail tracked messages whose acknowledgment is overdue, earliest deadline first"""
+        while True:
+            expired = []
+            with self._pending_lock:
+                while not self._pending:
+                    self._deadlines.clear()
+                    self._pending_lock.wait()
+                if len(self._deadlines) > 2 * len(self._pending) + 64:
+                    # Settled messages leave their deadline behind; drop them once they dominate
+                    self._deadlines = [entry for entry in self._deadlines if entry[1] in self._pending]
+                    heapq.heapify(self._deadlines)
+                now = time.monotonic()
+                while self._deadlines and self._deadlines[0][0] <= now:
+                    _, message_id = heapq.heappop(self._deadlines)
+                    if message_id in self._pending:
+                        expired.append(message_id)
+                if not expired:
+                    # Woken early by track when a sooner deadline arrives
+                    self._pending_lock.wait(self._deadlines[0][0] - now if self._deadlines else None)
+            for message_id in expired:
+                if self.settle(message_id, error=AckTimeout(f"Message {message_id} was not acknowledged in time")):
+                    self.ack_timeouts += 1
+                    ACK_TIMEOUTS.inc()
+
+    def in_flight(self):
+        """Number of sent messages awaiting acknowledgment"""
+        return len(self._pending)
+
+    def log_chat_message(self, content, is_user, timestamp):
+        """Record an outgoing chat message in client_messages.log"""
+        self.message_log.write(outgoing_chat_entry(content, is_user, timestamp))
+
     def send_chat_message(self, content, is_user=True):
         """Send a chat message"""
         timestamp = datetime.now().isoformat()
         
         # Log the chat message before sending
-        log_entry = {
-            'timestamp': timestamp,
-            'direction': 'outgoing',
-            'type': 'chat',
-            'sender': 'user' if is_user else 'assistant',
-            'content': content
-        }
-        self.message_logger.info(json.dumps(log_entry))
+        self.log_chat_message(content, is_user, timestamp)
         
         return self.send_message('chat', content, is_user=is_user, timestamp=timestamp)
 
+    def send_chat_message_async(self, content, is_user=True, timeout=None):
+        """Send a chat message and return a Future resolved with its acknowledgment"""
+        timestamp = datetime.now().isoformat()
+        self.log_chat_message(content, is_user, timestamp)
+        return self.send_message_async('chat', content, timeout, is_user=is_user, timestamp=timestamp)
+
+    def send_chat_messages(self, contents, is_user=True):
+        """Send many chat messages in one batch"""
+        return self.send_chat_batch([
+            self.build_message('chat', content, is_user=is_user) for content in contents
+        ])
+
+    def send_chat_batch(self, messages):
+        """Log and send prepared chat messages in one batch"""
+        for message in messages:
+            self.log_chat_message(message['content'], message.get('is_user', True), message['timestamp'])
+        return self.send_batch(messages)
+
     def send_system_message(self, content, command=None):
         """Send a system message"""
         return self.send_message('system', content, command=command)
 
-    def receive_messages(self):
+    def subscribe(self, topic='chat'):
+        """Ask the server for copies of other clients' messages on ``topic``; none are sent otherwise"""
+        self.subscriptions.add(topic)
+        return self.send_system_message(topic, command='subscribe') if self.connected else True
+
+    def unsubscribe(self, topic='chat'):
+        """Stop receiving copies of messages on ``topic``"""
+        self.subscriptions.discard(topic)
+        return self.send_system_message(topic, command='unsubscribe') if self.connected else True
+
+    def receive_messages(self, sock=None, decoder=None, pending=()):
         """Receive messages from the server"""
-        while self.running:
+        sock = sock or self.socket
+        decoder = decoder or MessageDecoder(self.wire_protocol)
+        for message in pending:
+            self.handle_message(message)
+        while self.running and sock is self.socket:
             try:
-                data = self.socket.recv(4096)
-                if not data:
+                if not decoder.recv_from(sock):
                     break
 
-                message = json.loads(data.decode('utf-8'))
-                self.handle_message(message)
+                for message in decoder.messages():
+                    self.handle_message(message)
 
-            except json.JSONDecodeError:
-                logging.error("Received invalid JSON data")
+            except ProtocolError as e:
+                logging.error(f"Received invalid data: {e}")
+                if self.wire_protocol != PROTOCOL_JSON:
+                    break
             except Exception as e:
-                logging.error(f"Error receiving message: {e}")
+                # The socket is closed under us on a local disconnect
+                if self.running and sock is self.socket:
+                    logging.error(f"Error receiving message: {e}")
                 break
 
-        self.disconnect()
+        # A reconnect may already have replaced this socket
+        with self._state_lock:
+            if sock is self.socket:
+                self.disconnect()
 
     def handle_message(self, message):
         """Handle received messages"""
         try:
+            if message.get('status') == 'received':
+                # Acknowledgments only settle the send they belong to
+                self.acks += 1
+                message_id = message.get('id')
+                if message_id is None or not self.settle(message_id, message):
+                    self.unmatched_acks += 1
+                return
+            if message.get('status') == 'busy':
+                self.busy += 1
+                message_id = message.get('id')
+                error = Overloaded(message.get('reason', 'unknown'), message.get('retry_after', 1.0))
+                if message_id is None or not self.settle(message_id, error=error):
+                    self.unmatched_acks += 1
+                return
+
             timestamp = datetime.now().isoformat()
             message_type = message.get('type')
             
@@ -151,18 +483,38 @@ class MCPClient:
             
             # Only log chat messages to client_messages.log
             if message_type == 'chat':
-                self.message_logger.info(json.dumps(log_entry))
+                self.message_log.write(log_entry)
             
             # Process message handlers
             if message_type in self.response_handlers:
                 self.response_handlers[message_type](message)
             else:
-                self.message_queue.put(message)
-                logging.info(f"Received message: {message}")
+                self.deliver(message)
+                logging.debug("Received message: %s", message)
 
         except Exception as e:
             logging.error(f"Error handling message: {e}")
 
+    def deliver(self, message):
+        """Put a message in the inbox, dropping one by the inbox policy when it is full"""
+        try:
+            self.message_queue.put_nowait(message)
+            return
+        except Full:
+            pass
+        self.inbox_dropped += 1
+        INBOX_DROPPED.inc()
+        if self.inbox_policy == POLICY_DROP_NEWEST:
+            return
+        try:
+            self.message_queue.get_nowait()
+        except Empty:
+            pass
+        try:
+            self.message_queue.put_nowait(message)
+        except Full:
+            pass
+
     def register_handler(self, message_type, handler):
         """Register a message handler for a specific message type"""
         self.response_handlers[message_type] = handler
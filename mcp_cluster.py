@@ -0,0 +1,342 @@
+import argparse
+import logging
+import multiprocessing
+import os
+import selectors
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+from audit_log import close_all
+from log_retention import LogRetention, merge_worker_logs, worker_log_path
+from mcp_protocol import FRAME_HEADER, MessageDecoder, PROTOCOL_COMPACT, PROTOCOL_FRAMED, RECV_SIZE, encode_message
+from mcp_server import MCPServer, MODE_ASYNC, MODE_THREAD
+from tracing import Tracer, SERVER_TRACE_PATH
+
+# Where the kernel can spread connections among several listening sockets
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+
+class BusRelay:
+    """Relays broadcasts between cluster workers over a Unix socket.
+
+    Every worker connects once. Each complete frame a worker publishes is
+    written unchanged to every other worker, so a broadcast is encoded only
+    by the worker it started on.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.frames = 0
+        self.running = False
+        self._peers = {}  # Worker connection -> bytes received but not yet relayed
+        self._selector = selectors.DefaultSelector()
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(path)
+        self._listener.listen()
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._selector.register(self._listener, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self.run, name='mcp-bus-relay')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self):
+        while self.running:
+            for key, _ in self._selector.select(timeout=0.5):
+                if key.fileobj is self._listener:
+                    peer, _ = self._listener.accept()
+                    self._peers[peer] = bytearray()
+                    self._selector.register(peer, selectors.EVENT_READ)
+                else:
+                    self.relay(key.fileobj)
+
+    def relay(self, peer):
+        """Forward the complete frames received from one worker to the others"""
+        try:
+            data = peer.recv(RECV_SIZE)
+        except OSError:
+            data = b''
+        if not data:
+            self.drop(peer)
+            return
+        pending = self._peers[peer]
+        pending += data
+        pos = 0
+        while len(pending) - pos >= FRAME_HEADER.size:
+            _, length = FRAME_HEADER.unpack_from(pending, pos)
+            if len(pending) - pos - FRAME_HEADER.size < length:
+                break
+            pos += FRAME_HEADER.size + length
+            self.frames += 1
+        if not pos:
+            return
+        frames = bytes(pending[:pos])
+        del pending[:pos]
+        for other in list(self._peers):
+            if other is not peer:
+                try:
+                    other.sendall(frames)
+                except OSError:
+                    self.drop(other)
+
+    def drop(self, peer):
+        if self._peers.pop(peer, None) is not None:
+            self._selector.unregister(peer)
+            peer.close()
+
+    def stop(self):
+        self.running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        for peer in list(self._peers):
+            self.drop(peer)
+        self._listener.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class ClusterBus:
+    """A worker's connection to the BusRelay, used by MCPServer to broadcast across workers"""
+
+    def __init__(self, path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.published = 0
+        self.received = 0
+        self._lock = threading.Lock()
+
+    def start(self, deliver):
+        """Hand every message published by another worker to ``deliver``"""
+        receiver_thread = threading.Thread(target=self.receive, args=(deliver,), name='mcp-bus')
+        receiver_thread.daemon = True
+        receiver_thread.start()
+
+    def publish(self, message):
+        # An MCPMessage keeps this encoding for its compact clients
+        data = encode_message(message, PROTOCOL_COMPACT)
+        try:
+            with self._lock:
+                self.socket.sendall(data)
+            self.published += 1
+        except OSError as e:
+            logging.error(f"Cluster bus send failed: {e}")
+
+    def receive(self, deliver):
+        decoder = MessageDecoder(PROTOCOL_FRAMED, typed=True)
+        try:
+            while decoder.recv_from(self.socket):
+                for message in decoder.messages():
+                    self.received += 1
+                    deliver(message)
+        except OSError:
+            pass  # Closed on shutdown
+
+    def close(self):
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+
+
+def listen(host, port, backlog, reuse_port):
+    """TCP socket listening on the cluster's port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def run_worker(index, host, port, listener, bus_path, ready, server_options, trace_options):
+    """Entry point of a worker process: one MCPServer with its own logs, broadcasting through the bus"""
+    def terminate(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent stops the workers on Ctrl+C
+    if listener is None:
+        listener = listen(host, port, server_options.get('backlog', 128), reuse_port=True)
+    tracer = None
+    if trace_options is not None:
+        tracer = Tracer('mcp_server', worker_log_path(SERVER_TRACE_PATH, index), **trace_options)
+    bus = ClusterBus(bus_path)
+    server = MCPServer(host, port, listen_socket=listener, worker=index, bus=bus, tracer=tracer, **server_options)
+    # Messages already accepted are handled before the worker exits
+    server.drain_on_stop = True
+    bus.start(server.deliver_remote)
+    ready.release()
+    logging.info(f"Cluster worker {index} serving on {host}:{port} (pid {os.getpid()})")
+    try:
+        server.start()
+    finally:
+        server.pipeline.join(timeout=10.0)
+        bus.close()
+        # Forked processes skip atexit handlers
+        close_all()
+
+
+class MCPCluster:
+    """Runs MCPServer in several worker processes sharing one port.
+
+    With SO_REUSEPORT each worker listens on the port itself and the kernel
+    spreads connections among them; elsewhere the workers accept from one
+    socket inherited from the parent. A client's messages are handled by
+    its worker's pipeline. Broadcasts reach the clients of the other workers
+    through a BusRelay on a Unix socket in the parent. Each worker writes
+    its own ``<log>.worker-<n>.log`` audit logs, which are merged into the
+    shared logs when the cluster stops. Workers that die are restarted.
+    """
+
+    def __init__(self, host='localhost', port=5555, processes=None, backlog=128, retention=None, trace_options=None,
+                 **server_options):
+        if 'fork' not in multiprocessing.get_all_start_methods() or not hasattr(socket, 'AF_UNIX'):
+            raise RuntimeError("Cluster mode needs fork and Unix sockets")
+        self.host = host
+        self.port = port
+        self.processes = processes or os.cpu_count() or 1
+        self.backlog = backlog
+        self.retention = retention
+        self.trace_options = trace_options
+        self.server_options = dict(server_options, backlog=backlog)
+        self.restarts = 0
+        self.running = False
+        self.worker_processes = {}  # Worker index -> Process
+        self.relay = None
+        self.socket = None
+        self._context = multiprocessing.get_context('fork')
+        self._ready = self._context.Semaphore(0)
+        self._bus_dir = None
+        self._stop_lock = threading.Lock()
+
+    def start(self):
+        """Start the workers and supervise them until ``stop``"""
+        try:
+            self._bus_dir = tempfile.mkdtemp(prefix='mcp-bus-')
+            self.relay = BusRelay(os.path.join(self._bus_dir, 'bus.sock'))
+            self.relay.start()
+            if REUSE_PORT:
+                # Bound but not listening: holds the port, and picks it when 0, without taking connections
+                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                self.socket.bind((self.host, self.port))
+            else:
+                self.socket = listen(self.host, self.port, self.backlog, reuse_port=False)
+            self.port = self.socket.getsockname()[1]
+            self.running = True
+            for index in range(self.processes):
+                self.spawn(index)
+            logging.info(f"MCP cluster of {self.processes} workers on {self.host}:{self.port}"
+                         f"{' (SO_REUSEPORT)' if REUSE_PORT else ''}")
+            if self.retention is not None:
+                self.retention.start()
+
+            while self.running:
+                time.sleep(0.5)
+                for index, process in list(self.worker_processes.items()):
+                    if not process.is_alive() and self.running:
+                        logging.warning(f"Cluster worker {index} exited with {process.exitcode}, restarting")
+                        self.restarts += 1
+                        self.spawn(index)
+        except Exception as e:
+            logging.error(f"Cluster error: {e}")
+        finally:
+            self.stop()
+
+    def spawn(self, index):
+        listener = None if REUSE_PORT else self.socket
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self.host, self.port, listener, self.relay.path, self._ready, self.server_options,
+                  self.trace_options),
+            name=f'mcp-worker-{index}'
+        )
+        process.start()
+        self.worker_processes[index] = process
+
+    def wait_ready(self, timeout=30.0):
+        """Block until every worker accepts connections, returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        for _ in range(self.processes):
+            if not self._ready.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def stop(self):
+        """Stop the workers, letting them handle what they accepted, then merge their logs"""
+        with self._stop_lock:
+            if self._bus_dir is None:
+                return
+            self.running = False
+            for process in self.worker_processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for process in self.worker_processes.values():
+                process.join(timeout=15.0)
+                if process.is_alive():
+                    process.kill()
+            if self.retention is not None:
+                self.retention.stop()
+            self.relay.stop()
+            if self.socket is not None:
+                self.socket.close()
+            shutil.rmtree(self._bus_dir, ignore_errors=True)
+            self._bus_dir = None
+            try:
+                merged = merge_worker_logs('logs')
+                logging.info(f"MCP cluster stopped, merged {merged} worker log lines")
+            except OSError as e:
+                logging.error(f"Could not merge worker logs: {e}")
+
+    def stats(self):
+        return {
+            'workers': self.processes,
+            'alive': sum(1 for process in self.worker_processes.values() if process.is_alive()),
+            'restarts': self.restarts,
+            'bus_frames': self.relay.frames if self.relay is not None else 0
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MCP server as a cluster of worker processes")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="worker processes")
+    parser.add_argument('--mode', choices=[MODE_THREAD, MODE_ASYNC], default=MODE_THREAD)
+    parser.add_argument('--backlog', type=int, default=128)
+    parser.add_argument('--shards', type=int, default=4, help="message processing shards per worker")
+    parser.add_argument('--max-pending', type=int, default=1000, help="queued messages per shard")
+    parser.add_argument('--chat-store', metavar='PATH', help="also index chat records in this SQLite database")
+    parser.add_argument('--retention', action='store_true', help="rotate, compress and expire logs/ while running")
+    parser.add_argument('--retain-days', type=float, default=30)
+    parser.add_argument('--retain-mb', type=float, default=1024, help="disk quota for logs/")
+    parser.add_argument('--trace-sample-rate', type=float, default=0.01)
+    parser.add_argument('--trace-slow-ms', type=float, default=100)
+    parser.add_argument('--merge-logs', action='store_true',
+                        help="only merge worker logs left by a cluster that did not stop cleanly")
+    args = parser.parse_args()
+
+    if args.merge_logs:
+        print(f"Merged {merge_worker_logs('logs')} lines")
+    else:
+        retention = None
+        if args.retention:
+            retention = LogRetention('logs', max_age_days=args.retain_days,
+                                     max_total_bytes=int(args.retain_mb * 1024 * 1024))
+        cluster = MCPCluster(args.host, args.port, processes=args.processes, backlog=args.backlog, retention=retention,
+                             trace_options={'sample_rate': args.trace_sample_rate, 'slow_ms': args.trace_slow_ms},
+                             mode=args.mode, workers=args.shards, max_pending=args.max_pending,
+                             chat_store=args.chat_store)
+        try:
+            cluster.start()
+        except KeyboardInterrupt:
+            cluster.stop()
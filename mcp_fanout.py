@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import socket
+import threading
+from collections import deque
+from mcp_protocol import PROTOCOL_FRAMED, encode_message
+
+# What to do when a client's outbound queue is full
+POLICY_DROP_OLDEST = 'drop_oldest'    # Discard the oldest queued message
+POLICY_DROP_NEWEST = 'drop_newest'    # Discard the message being offered
+POLICY_DISCONNECT = 'disconnect'      # Drop the slow client altogether
+POLICIES = (POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_DISCONNECT)
+
+
+class ClientChannel:
+    """Bounded outbound queue for one connected client.
+
+    Everything written to a client (acks and broadcasts) goes through its
+    channel, so a slow reader only ever backs up its own queue. Broadcasts
+    are ``offer``ed and subject to the slow consumer policy. Replies to the
+    client's own messages (acks, the codec hello, command results) go
+    through ``reply`` on a queue of their own that the policy never drops
+    from, and are written first; a client that lets ``max_queue`` replies
+    pile up is not reading and is disconnected. Subclasses provide the
+    writer that drains the queues onto the connection.
+    """
+
+    def __init__(self, address, max_queue=1000, policy=POLICY_DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.address = address
+        self.max_queue = max_queue
+        self.policy = policy
+        self.protocol = None  # Wire protocol, known once the client has sent data
+        self.subscriptions = set()  # Topics the client asked to receive broadcasts of
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        self._queue = deque()
+        self._replies = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self):
+        """Number of messages waiting to be written"""
+        return len(self._queue) + len(self._replies)
+
+    def offer(self, data):
+        """Queue encoded bytes for the client, returns False if they were not queued"""
+        with self._lock:
+            if self.closed:
+                return False
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                if self.policy == POLICY_DROP_NEWEST:
+                    return False
+                if self.policy == POLICY_DISCONNECT:
+                    logging.warning(f"Disconnecting slow client {self.address}")
+                    self._close_locked(abort=True)
+                    return False
+                self._queue.popleft()
+            self._queue.append(data)
+            self._wake()
+        return True
+
+    def reply(self, data):
+        """Queue encoded bytes answering the client, never dropped by the slow consumer policy"""
+        with self._lock:
+            if self.closed:
+                return False
+            if len(self._replies) >= self.max_queue:
+                logging.warning(f"Disconnecting client {self.address} that does not read its acknowledgments")
+                self._close_locked(abort=True)
+                return False
+            self._replies.append(data)
+            self._wake()
+        return True
+
+    def take_pending(self):
+        """Remove and return everything queued as one buffer, replies first"""
+        with self._lock:
+            if not self._queue and not self._replies:
+                return None
+            count = len(self._queue) + len(self._replies)
+            data = b''.join(self._replies) + b''.join(self._queue)
+            self._replies.clear()
+            self._queue.clear()
+        self.sent += count
+        return data
+
+    def close(self):
+        """Stop writing and shut the connection down"""
+        with self._lock:
+            self._close_locked(abort=False)
+
+    def _close_locked(self, abort):
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._replies.clear()
+        self._shutdown(abort)
+        self._wake()
+
+    def stats(self):
+        """Queue depth and delivery counters for this client"""
+        return {
+            'protocol': self.protocol,
+            'subscriptions': sorted(self.subscriptions),
+            'depth': self.depth,
+            'sent': self.sent,
+            'dropped': self.dropped,
+            'closed': self.closed
+        }
+
+    def _wake(self):
+        # Called with the channel lock held
+        raise NotImplementedError
+
+    def _shutdown(self, abort):
+        raise NotImplementedError
+
+
+class ThreadChannel(ClientChannel):
+    """Channel drained by a dedicated writer thread over a blocking socket"""
+
+    def __init__(self, client_socket, address, **kwargs):
+        super().__init__(address, **kwargs)
+        self.socket = client_socket
+        self._ready = threading.Condition(self._lock)
+        writer_thread = threading.Thread(target=self.run)
+        writer_thread.daemon = True
+        writer_thread.start()
+
+    def run(self):
+        """Write queued data until the channel is closed"""
+        while True:
+            with self._ready:
+                while not self._queue and not self._replies and not self.closed:
+                    self._ready.wait()
+                if self.closed:
+                    return
+            data = self.take_pending()
+            if data is None:
+                continue
+            try:
+                self.socket.sendall(data)
+            except OSError as e:
+                if not self.closed:
+                    logging.error(f"Error writing to client {self.address}: {e}")
+                self.close()
+                return
+
+    def _wake(self):
+        self._ready.notify_all()
+
+    def _shutdown(self, abort):
+        try:
+            # Unblocks the reader thread as well as this channel's writer
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class AsyncChannel(ClientChannel):
+    """Channel drained by a task on the server's event loop"""
+
+    def __init__(self, writer, address, loop, **kwargs):
+        super().__init__(address, **kwargs)
+        self.writer = writer
+        self.loop = loop
+        self._ready = asyncio.Event()
+
+    async def run(self):
+        """Write queued data until the channel is closed"""
+        while not self.closed:
+            await self._ready.wait()
+            self._ready.clear()
+            data = self.take_pending()
+            if data is None:
+                continue
+            try:
+                self.writer.write(data)
+                # Waits only while the transport buffer is above its limit
+                await self.writer.drain()
+            except (OSError, ConnectionError) as e:
+                if not self.closed:
+                    logging.error(f"Error writing to client {self.address}: {e}")
+                self.close()
+
+    def _wake(self):
+        try:
+            self.loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _shutdown(self, abort):
+        transport = self.writer.transport
+        try:
+            if abort:
+                self.loop.call_soon_threadsafe(transport.abort)
+            else:
+                self.loop.call_soon_threadsafe(transport.close)
+        except RuntimeError:
+            pass
+
+
+class FanoutHub:
+    """Registry of client channels used to publish messages to every client"""
+
+    def __init__(self, max_queue=1000, policy=POLICY_DROP_OLDEST):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.max_queue = max_queue
+        self.policy = policy
+        self.channels = {}  # Client address -> ClientChannel
+        self.broadcasts = 0
+        self.dropped = 0  # Messages dropped for clients that have since disconnected
+        self._lock = threading.Lock()
+
+    def register_socket(self, client_socket, address):
+        """Register a thread-mode client connection"""
+        channel = ThreadChannel(client_socket, address, max_queue=self.max_queue, policy=self.policy)
+        self.channels[address] = channel
+        return channel
+
+    def register_stream(self, writer, address, loop):
+        """Register an async-mode client connection"""
+        channel = AsyncChannel(writer, address, loop, max_queue=self.max_queue, policy=self.policy)
+        self.channels[address] = channel
+        return channel
+
+    def unregister(self, address):
+        """Forget a client and stop its writer"""
+        channel = self.channels.pop(address, None)
+        if channel is not None:
+            channel.close()
+            # A closed channel drops nothing more, so its count is final
+            with self._lock:
+                self.dropped += channel.dropped
+
+    def broadcast(self, message, exclude=None, topic=None):
+        """Queue a message for every client, or only those subscribed to ``topic``; returns how many accepted it"""
+        self.broadcasts += 1
+        # Serialize once per wire protocol rather than once per client
+        encoded = {}
+        delivered = 0
+        for address, channel in list(self.channels.items()):
+            if address == exclude or (topic is not None and topic not in channel.subscriptions):
+                continue
+            protocol = channel.protocol or PROTOCOL_FRAMED
+            data = encoded.get(protocol)
+            if data is None:
+                data = encoded[protocol] = encode_message(message, protocol)
+            if channel.offer(data):
+                delivered += 1
+        return delivered
+
+    def stats(self):
+        """Per-client queue depth and drop counters plus totals, ``dropped`` counting disconnected clients too"""
+        clients = {str(address): channel.stats() for address, channel in list(self.channels.items())}
+        return {
+            'clients': clients,
+            'broadcasts': self.broadcasts,
+            'queued': sum(client['depth'] for client in clients.values()),
+            'dropped': self.dropped + sum(client['dropped'] for client in clients.values())
+        }
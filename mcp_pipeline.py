@@ -0,0 +1,162 @@
+import logging
+import queue
+import threading
+import time
+from metrics import REGISTRY
+
+# Placed on a shard queue to stop its worker
+_STOP = object()
+
+QUEUE_WAIT = REGISTRY.histogram('mcp_pipeline_wait_seconds', "Time messages wait in a shard queue")
+HANDLER_TIME = REGISTRY.histogram('mcp_pipeline_handler_seconds', "Time to handle one message")
+
+
+class StageStats:
+    """Running timing totals for one pipeline shard"""
+
+    __slots__ = ('processed', 'wait_total', 'wait_max', 'handler_total', 'handler_max')
+
+    def __init__(self):
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.handler_total = 0.0
+        self.handler_max = 0.0
+
+    def record(self, wait, handler):
+        self.processed += 1
+        self.wait_total += wait
+        self.handler_total += handler
+        if wait > self.wait_max:
+            self.wait_max = wait
+        if handler > self.handler_max:
+            self.handler_max = handler
+
+    def as_dict(self):
+        processed = self.processed or 1
+        return {
+            'processed': self.processed,
+            'wait_avg_ms': self.wait_total / processed * 1000,
+            'wait_max_ms': self.wait_max * 1000,
+            'handler_avg_ms': self.handler_total / processed * 1000,
+            'handler_max_ms': self.handler_max * 1000
+        }
+
+
+class ShardedPipeline:
+    """Pool of worker threads, each draining its own bounded queue.
+
+    Messages are routed to a shard by key (the client address), so messages
+    from one client are handled in order while different clients are
+    handled in parallel. A full shard queue blocks the producer, pushing
+    back on the connection that is sending too fast. An optional
+    ``observer`` is called with each message and the seconds from queuing
+    it to finishing its handler. Messages still queued when a worker exits
+    without draining are never handled; ``on_drop`` is called with each of
+    them instead, so whatever was reserved for them can be given back.
+    """
+
+    def __init__(self, handler, shards=4, max_queue=1000, observer=None, on_drop=None):
+        if shards < 1:
+            raise ValueError("A pipeline needs at least one shard")
+        self.handler = handler
+        self.observer = observer
+        self.on_drop = on_drop
+        self.dropped = 0
+        self.queues = [queue.Queue(maxsize=max_queue) for _ in range(shards)]
+        self.shard_stats = [StageStats() for _ in range(shards)]
+        self.running = False
+        self.draining = False
+        self._threads = []
+
+    def start(self):
+        """Start one worker thread per shard"""
+        self.running = True
+        for shard in range(len(self.queues)):
+            worker_thread = threading.Thread(target=self.process_shard, args=(shard,))
+            worker_thread.daemon = True
+            worker_thread.start()
+            self._threads.append(worker_thread)
+
+    def stop(self, drain=False):
+        """Ask every worker to exit, with ``drain`` after handling what is already queued"""
+        self.draining = drain
+        self.running = False
+        for shard_queue in self.queues:
+            try:
+                # Draining workers free room as they go
+                shard_queue.put(_STOP, timeout=5.0) if drain else shard_queue.put_nowait(_STOP)
+            except queue.Full:
+                pass  # The worker notices running is False after its current message
+
+    def join(self, timeout=None):
+        """Wait for the workers to exit"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        for worker_thread in self._threads:
+            worker_thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def shard_for(self, key):
+        """Index of the shard that handles messages for ``key``"""
+        return hash(key) % len(self.queues)
+
+    def put(self, key, message, timeout=None):
+        """Queue a message, blocking while its shard is full"""
+        self.queues[self.shard_for(key)].put((time.perf_counter(), message), timeout=timeout)
+
+    def try_put(self, key, message):
+        """Queue a message without blocking, returns False if its shard is full"""
+        try:
+            self.queues[self.shard_for(key)].put_nowait((time.perf_counter(), message))
+            return True
+        except queue.Full:
+            return False
+
+    def process_shard(self, shard):
+        """Handle messages from one shard queue until stopped"""
+        shard_queue = self.queues[shard]
+        stats = self.shard_stats[shard]
+        while self.running or self.draining:
+            # Block without a timeout so an idle shard never wakes up
+            item = shard_queue.get()
+            if item is _STOP:
+                break
+            enqueued, message = item
+            dequeued = time.perf_counter()
+            try:
+                self.handler(message)
+            except Exception as e:
+                logging.error(f"Error processing message: {e}")
+            handled = time.perf_counter()
+            stats.record(dequeued - enqueued, handled - dequeued)
+            QUEUE_WAIT.observe(dequeued - enqueued)
+            HANDLER_TIME.observe(handled - dequeued)
+            if self.observer is not None:
+                self.observer(message, handled - enqueued)
+        self.discard(shard_queue)
+
+    def discard(self, shard_queue):
+        """Empty a shard queue whose worker has exited, passing each message to ``on_drop``"""
+        while True:
+            try:
+                item = shard_queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is _STOP:
+                continue
+            self.dropped += 1
+            if self.on_drop is not None:
+                try:
+                    self.on_drop(item[1])
+                except Exception as e:
+                    logging.error(f"Error dropping message: {e}")
+
+    def depth(self):
+        """Messages waiting across all shards"""
+        return sum(shard_queue.qsize() for shard_queue in self.queues)
+
+    def stats(self):
+        """Queue depth and enqueue-to-dequeue wait / handler timings per shard"""
+        return [
+            {'shard': shard, 'depth': self.queues[shard].qsize(), **stats.as_dict()}
+            for shard, stats in enumerate(self.shard_stats)
+        ]
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from mcp_client import MCPClient
+from mcp_protocol import PROTOCOL_FRAMED
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class MCPClientPool:
+    """Fixed-size pool of persistent MCP client connections.
+
+    Connections are checked out for exclusive use and checked back in
+    afterwards, so the pool can be shared by every Flask worker thread.
+    Broken connections are reconnected on checkout and by a background
+    health check, backing off exponentially while the server is down. The
+    health check takes one idle connection at a time and pings it, so a
+    half-open connection is found without holding up checkouts of the
+    others; connects give up after ``connect_timeout`` seconds.
+    """
+
+    def __init__(self, size=4, host='localhost', port=5555, protocol=PROTOCOL_FRAMED,
+                 health_check_interval=10.0, backoff_initial=0.5, backoff_max=30.0, setup=None,
+                 connect_timeout=2.0, ping_timeout=2.0):
+        if size < 1:
+            raise ValueError("A pool needs at least one connection")
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.ping_timeout = ping_timeout
+        self.reconnects = 0
+        self.failures = 0
+        self.checkouts = 0
+        self.probe_failures = 0
+        self.running = True
+        self._clients = []
+        self._backoff = {}  # id(client) -> (next attempt time, current delay)
+        self._idle = deque()  # Checked in on the right, most recently used first keeps warm connections busy
+        self._available = threading.Condition()
+        for _ in range(size):
+            client = MCPClient(host, port, protocol=protocol, connect_timeout=connect_timeout)
+            if setup is not None:
+                setup(client)
+            self._clients.append(client)
+            self._backoff[id(client)] = (0.0, backoff_initial)
+            self._idle.append(client)
+
+        health_thread = threading.Thread(target=self.health_check)
+        health_thread.daemon = True
+        health_thread.start()
+
+    def checkout(self, timeout=None):
+        """Take a connection for exclusive use, reconnecting it if needed"""
+        with self._available:
+            if not self._available.wait_for(lambda: self._idle, timeout):
+                raise PoolTimeout(f"No MCP connection free after {timeout}s")
+            client = self._idle.pop()
+        self.checkouts += 1
+        if not client.connected:
+            self.ensure_connected(client)
+        return client
+
+    def checkin(self, client):
+        """Return a connection to the pool"""
+        with self._available:
+            self._idle.append(client)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager wrapping checkout and checkin"""
+        client = self.checkout(timeout)
+        try:
+            yield client
+        finally:
+            self.checkin(client)
+
+    def ensure_connected(self, client):
+        """Reconnect a client unless it is still backing off, returns whether it is connected"""
+        if client.connected:
+            return True
+        next_attempt, delay = self._backoff[id(client)]
+        if time.monotonic() < next_attempt:
+            return False
+        if client.connect():
+            self.reconnects += 1
+            self._backoff[id(client)] = (0.0, self.backoff_initial)
+            return True
+        self.failures += 1
+        self._backoff[id(client)] = (time.monotonic() + delay, min(delay * 2, self.backoff_max))
+        return False
+
+    def health_check(self):
+        """Periodically probe idle connections and reconnect those that are broken"""
+        while self.running:
+            time.sleep(self.health_check_interval)
+            for client in self._clients:
+                # Only idle connections are checked; checked out ones are repaired on their next checkout
+                with self._available:
+                    if client not in self._idle:
+                        continue
+                    self._idle.remove(client)
+                try:
+                    self.probe(client)
+                except Exception as e:
+                    logging.error(f"MCP pool health check failed: {e}")
+                finally:
+                    # Back as the least recently used, so checkouts keep preferring warm connections
+                    with self._available:
+                        self._idle.appendleft(client)
+                        self._available.notify()
+
+    def probe(self, client):
+        """Ping a connected client, dropping it if the server does not answer, then reconnect if needed"""
+        if client.connected and not client.ping(self.ping_timeout):
+            self.probe_failures += 1
+            logging.warning(f"MCP connection to {client.host}:{client.port} did not answer a ping, reconnecting")
+            client.disconnect()
+        return self.ensure_connected(client)
+
+    def close(self):
+        """Disconnect every pooled connection"""
+        self.running = False
+        for client in self._clients:
+            client.disconnect()
+
+    def stats(self):
+        """Pool occupancy and reconnect counters"""
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'connected': sum(1 for client in self._clients if client.connected),
+            'checkouts': self.checkouts,
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'probe_failures': self.probe_failures
+        }
@@ -0,0 +1,402 @@
+import json
+import re
+import struct
+import codecs
+
+# Wire protocols understood by the MCP server and client
+PROTOCOL_FRAMED = 'framed'
+PROTOCOL_JSON = 'json'  # Legacy bare JSON documents written straight to the socket
+PROTOCOL_COMPACT = 'compact'  # Framed, with messages in compact binary frames once negotiated
+
+# Every frame starts with a 1-byte frame type and a 4-byte big-endian payload length
+FRAME_HEADER = struct.Struct('!BI')
+FRAME_JSON = 0x01     # Payload is a single UTF-8 JSON document
+FRAME_BATCH = 0x02    # Payload is a sequence of complete inner frames
+FRAME_COMPACT = 0x03  # Payload is one message in the compact layout below
+FRAME_HELLO = 0x04    # Payload is a JSON object listing the codecs the sender accepts
+
+FRAME_TYPES = (FRAME_JSON, FRAME_BATCH, FRAME_COMPACT, FRAME_HELLO)
+MESSAGE_FRAMES = (FRAME_JSON, FRAME_COMPACT)  # Frame types allowed inside a batch
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+RECV_SIZE = 64 * 1024
+
+# Characters that open, close or escape structure in a JSON document
+_JSON_STRUCTURE = re.compile(r'[\[\]{}"\\]')
+# The start of a JSON number, which more digits may still complete
+_NUMBER_PREFIX = re.compile(r'-?(?:\d+(?:\.\d*)?(?:[eE][+-]?\d*)?)?')
+
+
+# Compact frames: message kind, flags, then the byte lengths of the timestamp,
+# the sender, the content and a JSON object with any other fields, followed
+# by the message ID when it has one and those bytes
+COMPACT_HEADER = struct.Struct('!BBHHII')
+COMPACT_ID = struct.Struct('!Q')
+COMPACT_KINDS = (None, 'chat', 'system')  # Kind 0 keeps the type, if any, among the other fields
+FLAG_HAS_IS_USER = 0x01
+FLAG_IS_USER = 0x02
+FLAG_HAS_ID = 0x04
+CODEC_COMPACT = 'compact'
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends data that cannot be decoded"""
+
+
+class MCPMessage:
+    """One MCP message with its well-known fields in slots.
+
+    Fields outside ``FIELDS`` are kept in ``extra``. ``get``, ``[]`` and
+    ``in`` work as on the dicts handlers used to receive, so handlers can
+    treat both alike. ``encode`` keeps each wire encoding it produces, so
+    a message fanned out to many clients is serialized once per protocol;
+    assigning a field through ``[]`` discards them.
+    """
+
+    FIELDS = ('type', 'content', 'timestamp', 'is_user', 'command', 'sender', 'client_address', 'id')
+    __slots__ = FIELDS + ('extra', '_encoded', 'received')
+    _FIELD_SET = frozenset(FIELDS)
+
+    def __init__(self, type=None, content=None, timestamp=None, is_user=None, command=None, sender=None,
+                 client_address=None, extra=None, id=None):
+        self.type = type
+        self.content = content
+        self.timestamp = timestamp
+        self.is_user = is_user
+        self.command = command
+        self.sender = sender
+        self.client_address = client_address
+        self.id = id  # Set by senders that want the acknowledgment matched to the message
+        self.extra = extra
+        self._encoded = None
+        self.received = None  # perf_counter() when the server read the message, never sent
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ProtocolError(f"Expected a JSON object, got {type(data).__name__}")
+        get = data.get
+        message = cls(get('type'), get('content'), get('timestamp'), get('is_user'), get('command'), get('sender'),
+                      get('client_address'), id=get('id'))
+        others = data.keys() - cls._FIELD_SET
+        if others:
+            message.extra = {key: data[key] for key in others}
+        return message
+
+    def to_dict(self):
+        """Fields that are set, as the JSON protocols send them"""
+        data = {}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                data[name] = value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        self._encoded = None
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __repr__(self):
+        return f"MCPMessage({self.to_dict()!r})"
+
+    def encode(self, protocol=PROTOCOL_FRAMED):
+        """Wire encoding for a protocol, computed once"""
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = {}
+        data = encoded.get(protocol)
+        if data is None:
+            if protocol == PROTOCOL_COMPACT:
+                data = encode_frame(encode_compact(self), FRAME_COMPACT)
+            else:
+                data = json.dumps(self.to_dict()).encode('utf-8')
+                if protocol != PROTOCOL_JSON:
+                    data = encode_frame(data)
+            encoded[protocol] = data
+        return data
+
+
+def encode_frame(payload, frame_type=FRAME_JSON):
+    """Prefix a payload with its frame header"""
+    return FRAME_HEADER.pack(frame_type, len(payload)) + payload
+
+
+def encode_compact(message):
+    """Compact frame payload of an MCPMessage"""
+    kind = COMPACT_KINDS.index(message.type) if message.type in COMPACT_KINDS else 0
+    flags = 0
+    if message.is_user is not None:
+        flags = FLAG_HAS_IS_USER | (FLAG_IS_USER if message.is_user else 0)
+    message_id = b''
+    if message.id is not None:
+        if type(message.id) is int and 0 <= message.id < 1 << 64:
+            flags |= FLAG_HAS_ID
+            message_id = COMPACT_ID.pack(message.id)
+    timestamp = message.timestamp.encode('utf-8') if isinstance(message.timestamp, str) else b''
+    sender = message.sender.encode('utf-8') if isinstance(message.sender, str) else b''
+    content = message.content.encode('utf-8') if isinstance(message.content, str) else b''
+    rest = {}
+    if not kind and message.type is not None:
+        rest['type'] = message.type
+    if message.content is not None and not isinstance(message.content, str):
+        rest['content'] = message.content
+    if message.timestamp is not None and not isinstance(message.timestamp, str):
+        rest['timestamp'] = message.timestamp
+    if message.sender is not None and not isinstance(message.sender, str):
+        rest['sender'] = message.sender
+    for name in ('command', 'client_address'):
+        value = getattr(message, name)
+        if value is not None:
+            rest[name] = value
+    if message.id is not None and not message_id:
+        rest['id'] = message.id
+    if message.extra:
+        rest.update(message.extra)
+    rest = json.dumps(rest).encode('utf-8') if rest else b''
+    return b''.join((COMPACT_HEADER.pack(kind, flags, len(timestamp), len(sender), len(content), len(rest)),
+                     message_id, timestamp, sender, content, rest))
+
+
+def decode_compact(payload):
+    """MCPMessage from a compact frame payload, decoding text straight from the receive buffer"""
+    kind, flags, timestamp_length, sender_length, content_length, rest_length = COMPACT_HEADER.unpack_from(payload, 0)
+    if kind >= len(COMPACT_KINDS):
+        raise ProtocolError(f"Unknown compact message kind {kind}")
+    pos = COMPACT_HEADER.size
+    if flags & FLAG_HAS_ID:
+        pos += COMPACT_ID.size
+    end = pos + timestamp_length + sender_length + content_length + rest_length
+    if end != len(payload):
+        raise ProtocolError("Compact frame lengths do not match its size")
+    message = MCPMessage(COMPACT_KINDS[kind])
+    if flags & FLAG_HAS_ID:
+        message.id = COMPACT_ID.unpack_from(payload, COMPACT_HEADER.size)[0]
+    if flags & FLAG_HAS_IS_USER:
+        message.is_user = bool(flags & FLAG_IS_USER)
+    if timestamp_length:
+        message.timestamp = str(payload[pos:pos + timestamp_length], 'utf-8')
+    pos += timestamp_length
+    if sender_length:
+        message.sender = str(payload[pos:pos + sender_length], 'utf-8')
+    pos += sender_length
+    if content_length:
+        message.content = str(payload[pos:pos + content_length], 'utf-8')
+    elif kind:
+        message.content = ''
+    pos += content_length
+    if rest_length:
+        rest = json.loads(str(payload[pos:end], 'utf-8'))
+        for key, value in rest.items():
+            message[key] = value
+        message._encoded = None
+    return message
+
+
+def encode_hello(codecs):
+    """Frame announcing the codecs the sender accepts, or the one it picked in a reply"""
+    return encode_frame(json.dumps({'codecs': list(codecs)}).encode('utf-8'), FRAME_HELLO)
+
+
+def encode_message(message, protocol=PROTOCOL_FRAMED):
+    """Encode a single message, a dict or an MCPMessage, for the given wire protocol"""
+    if isinstance(message, MCPMessage):
+        return message.encode(protocol)
+    if protocol == PROTOCOL_COMPACT:
+        return encode_frame(encode_compact(MCPMessage.from_dict(message)), FRAME_COMPACT)
+    data = json.dumps(message).encode('utf-8')
+    if protocol == PROTOCOL_JSON:
+        return data
+    return encode_frame(data)
+
+
+def encode_batch(messages, protocol=PROTOCOL_FRAMED):
+    """Encode several messages so they can be written with one send"""
+    if protocol == PROTOCOL_JSON:
+        # Legacy peers get back-to-back JSON documents
+        return b''.join(encode_message(message, PROTOCOL_JSON) for message in messages)
+    inner = b''.join(encode_message(message, protocol) for message in messages)
+    return encode_frame(inner, FRAME_BATCH)
+
+
+class MessageDecoder:
+    """Streaming decoder turning received bytes into messages.
+
+    The decoder keeps one growing buffer per connection and only compacts it
+    once the consumed prefix gets large, so partial frames are never copied
+    more than necessary. When ``protocol`` is None the wire protocol is
+    detected from the first byte received, which lets framed and legacy
+    bare-JSON clients talk to the same server. With ``typed`` every message
+    is an MCPMessage; otherwise every message is a dict. A hello frame is
+    not a message: its payload is left in ``hello`` for the connection to
+    answer.
+    """
+
+    def __init__(self, protocol=None, max_frame_size=MAX_FRAME_SIZE, recv_size=RECV_SIZE, typed=False):
+        self.protocol = protocol
+        self.typed = typed
+        self.hello = None
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self._pos = 0
+        self._chunk = bytearray(recv_size)
+        self._chunk_view = memoryview(self._chunk)
+        # Legacy JSON state
+        self._text = ''
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+
+    def recv_from(self, sock):
+        """Read available bytes from a socket into the buffer, returns the byte count"""
+        count = sock.recv_into(self._chunk)
+        if count:
+            self.feed(self._chunk_view[:count])
+        return count
+
+    def feed(self, data):
+        """Append received bytes to the buffer"""
+        if self.protocol is None and data:
+            self.protocol = PROTOCOL_FRAMED if data[0] in FRAME_TYPES else PROTOCOL_JSON
+        if self.protocol == PROTOCOL_JSON:
+            self._text += self._utf8.decode(data)
+        else:
+            self._buffer += data
+
+    def messages(self):
+        """Yield every complete message currently buffered"""
+        if self.protocol == PROTOCOL_JSON:
+            yield from self._json_messages()
+        elif self.protocol is not None:
+            yield from self._framed_messages()
+
+    def _framed_messages(self):
+        buffer = self._buffer
+        header_size = FRAME_HEADER.size
+        while len(buffer) - self._pos >= header_size:
+            frame_type, length = FRAME_HEADER.unpack_from(buffer, self._pos)
+            if frame_type not in FRAME_TYPES:
+                raise ProtocolError(f"Unknown frame type {frame_type:#04x}")
+            if length > self.max_frame_size:
+                raise ProtocolError(f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+            start = self._pos + header_size
+            end = start + length
+            if end > len(buffer):
+                break
+            self._pos = end
+            yield from self._decode_frame(frame_type, memoryview(buffer)[start:end])
+        self._compact()
+
+    def _decode_frame(self, frame_type, payload):
+        try:
+            if frame_type == FRAME_HELLO:
+                self.hello = json.loads(bytes(payload))
+                return
+            if frame_type != FRAME_BATCH:
+                yield self._decode_message(frame_type, payload)
+                return
+            # Batch frames carry complete inner frames back to back
+            pos = 0
+            while pos < len(payload):
+                inner_type, length = FRAME_HEADER.unpack_from(payload, pos)
+                start = pos + FRAME_HEADER.size
+                pos = start + length
+                if inner_type not in MESSAGE_FRAMES or pos > len(payload):
+                    raise ProtocolError("Malformed batch frame")
+                with payload[start:pos] as inner:
+                    yield self._decode_message(inner_type, inner)
+        except (ValueError, struct.error) as e:
+            raise ProtocolError(f"Invalid frame payload: {e}") from e
+        finally:
+            payload.release()
+
+    def _decode_message(self, frame_type, payload):
+        if frame_type == FRAME_COMPACT:
+            message = decode_compact(payload)
+            return message if self.typed else message.to_dict()
+        message = json.loads(bytes(payload))
+        return MCPMessage.from_dict(message) if self.typed else message
+
+    def _compact(self):
+        # Drop consumed bytes once they dominate the buffer
+        if self._pos and (self._pos == len(self._buffer) or self._pos > RECV_SIZE):
+            del self._buffer[:self._pos]
+            self._pos = 0
+
+    def _json_messages(self):
+        text = self._text
+        pos = 0
+        length = len(text)
+        try:
+            while pos < length:
+                # Skip whitespace between documents
+                while pos < length and text[pos].isspace():
+                    pos += 1
+                if pos == length:
+                    break
+                try:
+                    message, pos = self._json.raw_decode(text, pos)
+                except json.JSONDecodeError as e:
+                    if self._is_incomplete(e, text, pos) and length - pos <= self.max_frame_size:
+                        break
+                    pos = length
+                    raise ProtocolError(f"Invalid JSON received: {e}") from e
+                yield MCPMessage.from_dict(message) if self.typed else message
+        finally:
+            self._text = text[pos:]
+
+    @staticmethod
+    def _is_incomplete(error, text, pos):
+        """Whether the document at ``pos`` may only be missing bytes that have not arrived yet.
+
+        A read can end anywhere: inside a string, an escape, a number or a
+        literal such as ``true``. An object or array is only known to be
+        invalid once its closing bracket has arrived; a bare scalar once
+        what has arrived can no longer start a valid one.
+        """
+        if error.pos >= len(text):
+            return True
+        if text[pos] not in '{[':
+            rest = text[pos:].rstrip()
+            return (any(literal.startswith(rest) for literal in ('true', 'false', 'null'))
+                    or _NUMBER_PREFIX.fullmatch(rest) is not None)
+        depth = 0
+        in_string = False
+        escaped = -1  # Position of the character a backslash escapes
+        for match in _JSON_STRUCTURE.finditer(text, pos):
+            char = match.group()
+            if match.start() == escaped:
+                continue
+            if in_string:
+                if char == '\\':
+                    escaped = match.start() + 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '{[':
+                depth += 1
+            elif char in '}]':
+                depth -= 1
+                if depth == 0:
+                    return False
+        return True
@@ -1,65 +1,148 @@
 import socket
-import json
 import threading
-import queue
+import asyncio
+import argparse
 import logging
+from logging.handlers import WatchedFileHandler
 import os
+import time
 from datetime import datetime
+from mcp_protocol import (MessageDecoder, MCPMessage, ProtocolError, CODEC_COMPACT, PROTOCOL_COMPACT, PROTOCOL_FRAMED,
+                          PROTOCOL_JSON, RECV_SIZE, encode_message, encode_batch, encode_hello)
+from mcp_fanout import FanoutHub, POLICY_DROP_OLDEST
+from mcp_pipeline import ShardedPipeline
+from audit_log import get_audit_log
+from chat_store import get_chat_store
+from log_retention import LogRetention, worker_log_path
+from metrics import REGISTRY
+from tracing import Tracer, SERVER_TRACE_PATH
+from admission import AdmissionController, AdaptiveLimiter, Overloaded
+
+# Server engines: one thread per connection, or a single asyncio event loop
+MODE_THREAD = 'thread'
+MODE_ASYNC = 'async'
+
+# Copies of chat messages only go to clients that sent a 'subscribe' command for this topic
+TOPIC_CHAT = 'chat'
+
+MESSAGES_RECEIVED = REGISTRY.counter('mcp_server_messages_received', "Messages received, per client", ('client',))
+MESSAGES_HANDLED = REGISTRY.counter('mcp_server_messages_handled', "Messages handled, per message type", ('type',))
+ACK_LATENCY = REGISTRY.histogram('mcp_server_ack_seconds',
+                                 "Time from reading messages to queuing their acknowledgment, including backpressure")
+BROADCAST_TIME = REGISTRY.histogram('mcp_server_broadcast_seconds', "Time to queue a broadcast for every client")
+BROADCAST_DELIVERIES = REGISTRY.counter('mcp_server_broadcast_deliveries', "Broadcast messages queued for a client")
 
 # Create logs directory if it doesn't exist
 if not os.path.exists('logs'):
     os.makedirs('logs')
 
-# Configure logging to both file and console
+# Configure logging to both file and console; the file is reopened when
+# log retention rotates it
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler(os.path.join('logs', 'mcp_server.log')),
+        WatchedFileHandler(os.path.join('logs', 'mcp_server.log')),
         logging.StreamHandler()
     ]
 )
 
 class MCPServer:
-    def __init__(self, host='localhost', port=5555):
+    def __init__(self, host='localhost', port=5555, mode=MODE_THREAD, backlog=128,
+                 write_buffer_limit=64 * 1024, max_client_queue=1000,
+                 slow_client_policy=POLICY_DROP_OLDEST, workers=4, max_pending=1000,
+                 chat_store=None, retention=None, tracer=None, compact=True, listen_socket=None,
+                 worker=None, bus=None, admission=None):
+        if mode not in (MODE_THREAD, MODE_ASYNC):
+            raise ValueError(f"Unknown server mode: {mode}")
         self.host = host
         self.port = port
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.clients = {}  # Dictionary to store client connections
-        self.message_queue = queue.Queue()
+        self.mode = mode
+        self.backlog = backlog  # Pending connections the kernel queues before refusing
+        self.write_buffer_limit = write_buffer_limit  # Per-connection outgoing bytes in async mode
+        # Cluster workers are handed a socket that is already listening
+        self.listen_socket = listen_socket
+        self.socket = listen_socket or socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name != 'nt' and listen_socket is None:
+            # Allow quick restarts while old connections sit in TIME_WAIT
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        # Outbound queue per connected client, keyed by client address
+        self.fanout = FanoutHub(max_queue=max_client_queue, policy=slow_client_policy)
+        self.clients = self.fanout.channels
+        # Optional AdmissionController limiting connections and the rate and
+        # number of messages in flight; shed messages are acked 'busy'
+        self.admission = admission
+        # Worker shards keyed by client address; full shards push back on the sender
+        self.pipeline = ShardedPipeline(self.handle_message, shards=workers, max_queue=max_pending,
+                                        observer=self.message_done if admission is not None else None,
+                                        on_drop=self.message_dropped if admission is not None else None)
         self.running = False
+        self._loop = None  # Event loop driving async mode
+        self._stopped = None
         
-        # Create a separate log file for chat messages
-        self.chat_logger = logging.getLogger('chat')
-        self.chat_logger.setLevel(logging.INFO)
-        chat_handler = logging.FileHandler(os.path.join('logs', 'chat_history.log'))
-        chat_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-        self.chat_logger.addHandler(chat_handler)
-        
-        # Create a separate log file for system messages
-        self.system_logger = logging.getLogger('system')
-        self.system_logger.setLevel(logging.INFO)
-        system_handler = logging.FileHandler(os.path.join('logs', 'system.log'))
-        system_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
-        self.system_logger.addHandler(system_handler)
+        # Chat and system records skip the logging stack and are written in
+        # batches by background audit writers; cluster workers write their
+        # own files, merged when the cluster stops
+        self.worker = worker
+        self.chat_log = get_audit_log(self.log_path('chat_history.log'))
+        self.system_log = get_audit_log(self.log_path('system.log'))
+        # Optional indexed SQLite copy of the chat records, for querying
+        self.chat_store = get_chat_store(chat_store) if chat_store else None
+        # Optional LogRetention run in the background while the server is up
+        self.retention = retention
+        # Optional Tracer recording how chat messages from traced web requests were handled
+        self.tracer = tracer
+        # Whether clients that offer the compact binary codec get it
+        self.compact = compact
+        # Optional ClusterBus relaying broadcasts to the other worker processes
+        self.bus = bus
+        # Whether stopping handles the messages already queued instead of dropping them
+        self.drain_on_stop = False
+
+        # Queue depths are read when metrics are collected
+        REGISTRY.gauge_function('mcp_server_clients', "Connected clients", lambda: len(self.clients))
+        REGISTRY.gauge_function('mcp_pipeline_depth', "Messages waiting across all shards", self.pipeline.depth)
+        REGISTRY.gauge_function('mcp_fanout_queued', "Outgoing messages queued for clients",
+                                lambda: self.fanout.stats()['queued'])
+        REGISTRY.counter_function('mcp_fanout_dropped', "Outgoing messages dropped for slow clients",
+                                  lambda: self.fanout.stats()['dropped'])
+
+    def log_path(self, name):
+        """Path of an audit log, per worker in cluster mode"""
+        path = os.path.join('logs', name)
+        return worker_log_path(path, self.worker) if self.worker is not None else path
 
     def start(self):
         """Start the MCP server"""
         try:
-            self.socket.bind((self.host, self.port))
-            self.socket.listen(5)
+            if self.listen_socket is None:
+                self.socket.bind((self.host, self.port))
+                # Pick up the real port when bound to an ephemeral one
+                self.port = self.socket.getsockname()[1]
+                self.socket.listen(self.backlog)
             self.running = True
-            logging.info(f"MCP Server started on {self.host}:{self.port}")
+            logging.info(f"MCP Server started on {self.host}:{self.port} ({self.mode} mode)")
 
-            # Start message processor thread
-            processor_thread = threading.Thread(target=self.process_messages)
-            processor_thread.daemon = True
-            processor_thread.start()
+            # Start message processor threads
+            self.pipeline.start()
+            if self.retention is not None:
+                self.retention.start()
+
+            if self.mode == MODE_ASYNC:
+                asyncio.run(self.serve_async())
+                return
 
             # Accept client connections
             while self.running:
                 try:
                     client_socket, address = self.socket.accept()
+                    refusal = self.refuse_connection(address)
+                    if refusal is not None:
+                        refuse_thread = threading.Thread(target=self.send_refusal, args=(client_socket, refusal))
+                        refuse_thread.daemon = True
+                        refuse_thread.start()
+                        continue
+                    self.fanout.register_socket(client_socket, address)
                     client_thread = threading.Thread(
                         target=self.handle_client,
                         args=(client_socket, address)
@@ -78,7 +161,15 @@ class MCPServer:
     def stop(self):
         """Stop the MCP server"""
         self.running = False
-        for client in self.clients.values():
+        self.pipeline.stop(drain=self.drain_on_stop)
+        if self.retention is not None:
+            self.retention.stop()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._stopped.set)
+            except RuntimeError:
+                pass  # Event loop already closed
+        for client in list(self.clients.values()):
             try:
                 client.close()
             except:
@@ -86,134 +177,405 @@ class MCPServer:
         self.socket.close()
         logging.info("MCP Server stopped")
 
+    async def serve_async(self):
+        """Accept and serve client connections on the asyncio event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(
+            self.handle_client_async,
+            sock=self.socket,
+            backlog=self.backlog,
+            limit=RECV_SIZE
+        )
+        async with server:
+            await self._stopped.wait()
+
     def handle_client(self, client_socket, address):
         """Handle individual client connections"""
+        channel = self.clients[address]
+        received = MESSAGES_RECEIVED.labels(str(address))
+        # Framed and legacy bare-JSON clients are told apart by their first byte
+        decoder = MessageDecoder(typed=True)
         try:
             while self.running:
                 try:
-                    # Receive message from client
-                    data = client_socket.recv(4096)
-                    if not data:
+                    # Receive data from client
+                    if not decoder.recv_from(client_socket):
                         break
+                    start = time.perf_counter()
+
+                    # Blocks while this client's shard is full
+                    messages = self.accept_messages(decoder, address)
+                    if decoder.hello is not None:
+                        self.negotiate(decoder, channel)
+                    outcomes = self.admit_messages(messages, address)
+                    for message, shed in zip(messages, outcomes):
+                        if shed is None:
+                            self.pipeline.put(address, message)
+
+                    # Send acknowledgments, batched when several messages arrived together
+                    acks = self.build_acks(messages, outcomes)
+                    channel.protocol = decoder.protocol
+                    if acks:
+                        channel.reply(self.encode_acks(decoder.protocol, acks))
+                        received.inc(len(messages))
+                        ACK_LATENCY.since(start)
 
-                    # Parse the message
-                    message = json.loads(data.decode('utf-8'))
-                    message['timestamp'] = datetime.now().isoformat()
-                    message['client_address'] = address
-                    
-                    # Add to processing queue
-                    self.message_queue.put(message)
-                    
-                    # Send acknowledgment
-                    response = {
-                        'status': 'received',
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    client_socket.send(json.dumps(response).encode('utf-8'))
-
-                except json.JSONDecodeError:
-                    logging.error(f"Invalid JSON received from {address}")
+                except ProtocolError as e:
+                    logging.error(f"Invalid data received from {address}: {e}")
+                    # A corrupt frame leaves the stream out of sync
+                    if decoder.protocol != PROTOCOL_JSON:
+                        break
                 except Exception as e:
                     logging.error(f"Error handling client {address}: {e}")
                     break
 
         finally:
+            self.fanout.unregister(address)
+            MESSAGES_RECEIVED.remove(str(address))
             client_socket.close()
-            if address in self.clients:
-                del self.clients[address]
             logging.info(f"Client {address} disconnected")
 
-    def process_messages(self):
-        """Process messages from the queue"""
-        while self.running:
+    async def handle_client_async(self, reader, writer):
+        """Handle an individual client connection in async mode"""
+        address = writer.get_extra_info('peername')
+        refusal = self.refuse_connection(address)
+        if refusal is not None:
             try:
-                # Get message from queue
-                message = self.message_queue.get(timeout=1)
-                
-                # Process message
-                self.handle_message(message)
-                
-                # Mark task as done
-                self.message_queue.task_done()
-                
-            except queue.Empty:
-                continue
-            except Exception as e:
-                logging.error(f"Error processing message: {e}")
+                writer.write(refusal)
+                writer.write_eof()
+                # Closing with the client's hello unread would reset the connection before it reads the refusal
+                await asyncio.wait_for(reader.read(), 1.0)
+            except (ConnectionError, asyncio.TimeoutError):
+                pass
+            writer.close()
+            return
+        logging.info(f"New client connected from {address}")
+        # Bound the bytes queued for a client that is not reading its acks
+        writer.transport.set_write_buffer_limits(high=self.write_buffer_limit)
+        channel = self.fanout.register_stream(writer, address, self._loop)
+        channel_task = asyncio.create_task(channel.run())
+        received = MESSAGES_RECEIVED.labels(str(address))
+        decoder = MessageDecoder(typed=True)
+        try:
+            while self.running:
+                try:
+                    data = await reader.read(RECV_SIZE)
+                    if not data:
+                        break
+                    start = time.perf_counter()
+                    decoder.feed(data)
+
+                    messages = self.accept_messages(decoder, address)
+                    if decoder.hello is not None:
+                        self.negotiate(decoder, channel)
+                    outcomes = self.admit_messages(messages, address)
+                    for message, shed in zip(messages, outcomes):
+                        if shed is not None:
+                            continue
+                        if not self.pipeline.try_put(address, message):
+                            # Wait for room off the event loop, keeping this
+                            # client's messages in order
+                            await self._loop.run_in_executor(None, self.pipeline.put, address, message)
+
+                    acks = self.build_acks(messages, outcomes)
+                    channel.protocol = decoder.protocol
+                    if acks:
+                        channel.reply(self.encode_acks(decoder.protocol, acks))
+                        received.inc(len(messages))
+                        ACK_LATENCY.since(start)
+
+                except ProtocolError as e:
+                    logging.error(f"Invalid data received from {address}: {e}")
+                    if decoder.protocol != PROTOCOL_JSON:
+                        break
+                except Exception as e:
+                    logging.error(f"Error handling client {address}: {e}")
+                    break
+
+        finally:
+            self.fanout.unregister(address)
+            MESSAGES_RECEIVED.remove(str(address))
+            channel_task.cancel()
+            writer.close()
+            logging.info(f"Client {address} disconnected")
+
+    def accept_messages(self, decoder, address):
+        """Return every decoded message stamped with its arrival time and sender.
+
+        The sender's timestamp is kept, so the audit trail records when a
+        message was written even when it was journaled and sent much later;
+        messages without one get the arrival time.
+        """
+        messages = []
+        received = time.perf_counter()
+        for message in decoder.messages():
+            if not message.timestamp:
+                message.timestamp = datetime.now().isoformat()
+            message.received = received
+            message.client_address = address
+            messages.append(message)
+        return messages
+
+    def negotiate(self, decoder, channel):
+        """Answer a client's hello, switching the connection to the compact codec when both sides have it"""
+        hello, decoder.hello = decoder.hello, None
+        codecs = hello.get('codecs', []) if isinstance(hello, dict) else []
+        chosen = [CODEC_COMPACT] if self.compact and CODEC_COMPACT in codecs else []
+        # Queued ahead of anything sent in the new codec
+        channel.reply(encode_hello(chosen))
+        if chosen:
+            decoder.protocol = PROTOCOL_COMPACT
+        channel.protocol = decoder.protocol
+
+    def refuse_connection(self, address):
+        """Busy message for a connection over the limit, sent before closing it, or None to accept it"""
+        if self.admission is None:
+            return None
+        try:
+            self.admission.admit_connection(len(self.clients))
+            return None
+        except Overloaded as e:
+            logging.warning(f"Refusing connection from {address}: {e}")
+            return encode_message({
+                'type': 'system',
+                'command': 'busy',
+                'content': 'Server is at its connection limit',
+                'reason': e.reason,
+                'retry_after': round(e.retry_after, 3),
+                'timestamp': datetime.now().isoformat()
+            }, PROTOCOL_FRAMED)
+
+    def send_refusal(self, client_socket, refusal):
+        """Send a busy message and close the connection once the client has seen it"""
+        try:
+            client_socket.sendall(refusal)
+            client_socket.shutdown(socket.SHUT_WR)
+            # Closing with the client's hello unread would reset the connection before it reads the refusal
+            client_socket.settimeout(1.0)
+            while client_socket.recv(RECV_SIZE):
+                pass
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def admit_messages(self, messages, address):
+        """Pass each message through admission control; returns None for admitted ones and the Overloaded error for shed ones"""
+        if self.admission is None:
+            return [None] * len(messages)
+        outcomes = []
+        # Rate limits apply per host, so opening more connections does not raise a client's share
+        host = address[0] if isinstance(address, tuple) else address
+        for message in messages:
+            try:
+                self.admission.admit(host)
+                self.admission.acquire()
+                outcomes.append(None)
+            except Overloaded as e:
+                outcomes.append(e)
+        return outcomes
+
+    def message_done(self, message, latency):
+        """Give back the concurrency slot of a handled message"""
+        self.admission.release_after(latency)
+
+    def message_dropped(self, message):
+        """Give back the concurrency slot of a message dropped unhandled when the pipeline stopped"""
+        self.admission.cancel()
+
+    def build_acks(self, messages, outcomes=None):
+        """Build one acknowledgment per message, carrying its ID when the client set one; shed messages are acked 'busy'"""
+        timestamp = datetime.now().isoformat()
+        acks = []
+        for index, message in enumerate(messages):
+            shed = outcomes[index] if outcomes is not None else None
+            if shed is None:
+                ack = {'status': 'received', 'timestamp': timestamp}
+            else:
+                ack = {'status': 'busy', 'reason': shed.reason, 'retry_after': round(shed.retry_after, 3),
+                       'timestamp': timestamp}
+            if message.id is not None:
+                ack['id'] = message.id
+            acks.append(ack)
+        return acks
+
+    def encode_acks(self, protocol, acks):
+        """Encode acknowledgments using the client's wire protocol"""
+        if len(acks) == 1:
+            return encode_message(acks[0], protocol)
+        return encode_batch(acks, protocol)
+
+    def get_pipeline_stats(self):
+        """Per-shard queue depth plus enqueue-to-dequeue wait and handler timings"""
+        return self.pipeline.stats()
 
     def handle_message(self, message):
         """Handle individual messages"""
         try:
-            # Log message details
-            logging.info(f"Processing message from {message['client_address']}")
-            logging.info(f"Message type: {message.get('type', 'unknown')}")
+            # Per-message details are only worth the cost when debugging
+            message_type = message.type
+            logging.debug("Processing %s message from %s", message_type or 'unknown', message.client_address)
+            MESSAGES_HANDLED.labels(message_type or 'unknown').inc()
             
             # Handle different message types
-            if message.get('type') == 'chat':
+            if message_type == 'chat':
                 self.handle_chat_message(message)
-            elif message.get('type') == 'system':
+            elif message_type == 'system':
                 self.handle_system_message(message)
             else:
-                logging.warning(f"Unknown message type: {message.get('type')}")
+                logging.warning(f"Unknown message type: {message_type}")
                 
         except Exception as e:
             logging.error(f"Error handling message: {e}")
 
     def handle_chat_message(self, message):
         """Handle chat messages"""
+        start = time.perf_counter()
         try:
             # Log chat message with more details
             log_entry = {
-                'timestamp': message.get('timestamp'),
-                'client': str(message.get('client_address')),
+                'timestamp': message.timestamp,
+                'client': str(message.client_address),
                 'content': message.get('content', ''),
                 'type': 'user_message' if message.get('is_user', True) else 'ai_response'
             }
-            self.chat_logger.info(json.dumps(log_entry))
+            self.chat_log.write(log_entry)
+            if self.chat_store is not None:
+                self.chat_store.write(log_entry)
             
-            # Broadcast to other clients if needed
-            self.broadcast_message({
-                'type': 'chat',
-                'sender': str(message['client_address']),
-                'content': message.get('content', ''),
-                'timestamp': message['timestamp']
-            })
+            # Copy to the other clients that subscribed to chat, encoded once per wire protocol
+            self.broadcast_message(MCPMessage(
+                'chat',
+                sender=str(message.client_address),
+                content=message.get('content', ''),
+                timestamp=message.timestamp
+            ), exclude=message.client_address, topic=TOPIC_CHAT)
+
+            trace_id = message.get('trace_id')
+            if trace_id is not None and self.tracer is not None:
+                self.trace_chat_message(trace_id, message, time.perf_counter() - start)
             
         except Exception as e:
             logging.error(f"Error handling chat message: {e}")
 
+    def trace_chat_message(self, trace_id, message, duration):
+        """Link the handling of a chat message to the web request that sent it"""
+        waited = time.perf_counter() - message.received - duration
+        self.tracer.record(trace_id, 'mcp.handle_chat_message', duration, client=str(message.client_address),
+                           wait_ms=round(max(waited, 0.0) * 1000, 3))
+
     def handle_system_message(self, message):
         """Handle system messages"""
+        if message.command == 'ping':
+            return  # Only asks for the acknowledgment every message gets
         try:
             # Log system message with details
             log_entry = {
-                'timestamp': message.get('timestamp'),
-                'client': str(message.get('client_address')),
+                'timestamp': message.timestamp,
+                'client': str(message.client_address),
                 'content': message.get('content', ''),
-                'command': message.get('command')
+                'command': message.command
             }
-            self.system_logger.info(json.dumps(log_entry))
+            self.system_log.write(log_entry)
             
             # Handle system commands
-            if message.get('command') == 'broadcast':
+            if message.command == 'broadcast':
                 self.broadcast_message(message)
+            elif message.command in ('subscribe', 'unsubscribe'):
+                channel = self.clients.get(message.client_address)
+                if channel is not None:
+                    topic = message.get('content', '')
+                    if message.command == 'subscribe':
+                        channel.subscriptions.add(topic)
+                    else:
+                        channel.subscriptions.discard(topic)
+            elif message.command == 'metrics':
+                self.reply(message.client_address, {
+                    'type': 'system',
+                    'command': 'metrics',
+                    'content': REGISTRY.snapshot(),
+                    'timestamp': datetime.now().isoformat()
+                })
                 
         except Exception as e:
             logging.error(f"Error handling system message: {e}")
 
-    def broadcast_message(self, message):
-        """Broadcast message to all connected clients"""
-        message_data = json.dumps(message).encode('utf-8')
-        for client in self.clients.values():
-            try:
-                client.send(message_data)
-            except Exception as e:
-                logging.error(f"Error broadcasting message: {e}")
+    def broadcast_message(self, message, exclude=None, topic=None):
+        """Broadcast message to all connected clients, or those subscribed to ``topic``"""
+        # Each client gets the message on its own bounded queue, so a slow
+        # reader cannot hold up delivery to the others
+        start = time.perf_counter()
+        delivered = self.fanout.broadcast(message, exclude=exclude, topic=topic)
+        if self.bus is not None:
+            self.bus.publish(message)
+        BROADCAST_TIME.since(start)
+        BROADCAST_DELIVERIES.inc(delivered)
+        return delivered
+
+    def deliver_remote(self, message):
+        """Broadcast a message published by another cluster worker to this worker's clients"""
+        start = time.perf_counter()
+        delivered = self.fanout.broadcast(message, topic=TOPIC_CHAT if message.type == 'chat' else None)
+        BROADCAST_TIME.since(start)
+        BROADCAST_DELIVERIES.inc(delivered)
+        return delivered
+
+    def reply(self, address, message):
+        """Queue a message for one client"""
+        channel = self.clients.get(address)
+        if channel is not None:
+            channel.reply(encode_message(message, channel.protocol or PROTOCOL_FRAMED))
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the MCP server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--mode', choices=[MODE_THREAD, MODE_ASYNC], default=MODE_THREAD)
+    parser.add_argument('--backlog', type=int, default=128)
+    parser.add_argument('--workers', type=int, default=4, help="message processing shards")
+    parser.add_argument('--max-pending', type=int, default=1000, help="queued messages per shard")
+    parser.add_argument('--chat-store', metavar='PATH',
+                        help="also store chat messages in an indexed SQLite database, e.g. logs/chat_history.db")
+    parser.add_argument('--retention', action='store_true',
+                        help="rotate, compress and expire the files in logs/ in the background")
+    parser.add_argument('--retain-days', type=float, default=30)
+    parser.add_argument('--retain-mb', type=float, default=1024, help="disk quota for logs/")
+    parser.add_argument('--trace-sample-rate', type=float, default=0.01,
+                        help="fraction of traced chat messages recorded in logs/mcp_traces.log")
+    parser.add_argument('--trace-slow-ms', type=float, default=100,
+                        help="also record traced chat messages handled slower than this")
+    parser.add_argument('--no-compact', action='store_true',
+                        help="keep every client on JSON frames even when it offers the compact codec")
+    parser.add_argument('--max-clients', type=int, help="refuse connections beyond this many")
+    parser.add_argument('--rate', type=float, help="messages per second accepted from all clients together")
+    parser.add_argument('--burst', type=float, help="messages accepted at once above --rate")
+    parser.add_argument('--client-rate', type=float, help="messages per second accepted from one client IP address")
+    parser.add_argument('--client-burst', type=float, help="messages accepted at once above --client-rate")
+    parser.add_argument('--max-in-flight', type=int,
+                        help="messages queued or being handled at once; adapts down when they slow past the target")
+    parser.add_argument('--latency-target-ms', type=float, default=50,
+                        help="queue wait plus handling time above which --max-in-flight backs off")
+    args = parser.parse_args()
+    retention = None
+    if args.retention:
+        retention = LogRetention('logs', max_age_days=args.retain_days,
+                                 max_total_bytes=int(args.retain_mb * 1024 * 1024))
+    admission = None
+    if args.max_clients or args.rate or args.client_rate or args.max_in_flight:
+        admission = AdmissionController(
+            'mcp', rate=args.rate, burst=args.burst, client_rate=args.client_rate, client_burst=args.client_burst,
+            limiter=AdaptiveLimiter(args.max_in_flight, args.latency_target_ms / 1000) if args.max_in_flight else None,
+            max_connections=args.max_clients
+        )
+
     # Create and start MCP server
-    server = MCPServer()
+    server = MCPServer(args.host, args.port, mode=args.mode, backlog=args.backlog,
+                       workers=args.workers, max_pending=args.max_pending, chat_store=args.chat_store,
+                       retention=retention, compact=not args.no_compact, admission=admission,
+                       tracer=Tracer('mcp_server', SERVER_TRACE_PATH, sample_rate=args.trace_sample_rate,
+                                     slow_ms=args.trace_slow_ms))
     try:
         server.start()
     except KeyboardInterrupt:
-        server.stop() 
\ No newline at end of file
+        server.stop()
\ No newline at end of file
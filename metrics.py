@@ -0,0 +1,339 @@
+import math
+import threading
+import time
+
+# Histograms keep 2**SUB_BITS linear buckets per power of two of microseconds,
+# so any recorded value is known to within about 3%
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_BITS = 40  # About 12 days in microseconds; longer values land in the last bucket
+HISTOGRAM_BUCKETS = (MAX_BITS - SUB_BITS + 1) * SUB_BUCKETS
+
+# Bucket bounds in seconds exported to Prometheus; percentiles use the full resolution
+EXPORT_BOUNDS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Label values beyond this many per metric are counted under OTHER_LABEL
+MAX_SERIES = 1000
+OTHER_LABEL = 'other'
+
+
+def bucket_index(micros):
+    """Histogram bucket of a non-negative integer number of microseconds"""
+    if micros < 2 * SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BITS - 1
+    return min((shift + 1) * SUB_BUCKETS + (micros >> shift) - SUB_BUCKETS, HISTOGRAM_BUCKETS - 1)
+
+
+def bucket_bounds(index):
+    """Lowest and highest microsecond values of a histogram bucket"""
+    if index < 2 * SUB_BUCKETS:
+        return index, index
+    shift = index // SUB_BUCKETS - 1
+    low = (SUB_BUCKETS + index % SUB_BUCKETS) << shift
+    return low, low + (1 << shift) - 1
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    __slots__ = ('value', '_lock')
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return [(f"{name}_total", labels, self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    """Value that goes up and down, such as a queue depth"""
+
+    __slots__ = ('value', '_lock')
+    kind = 'gauge'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self.value)]
+
+    def snapshot(self):
+        return self.value
+
+
+class CallbackGauge(Gauge):
+    """Gauge read from a function when metrics are collected, costing nothing in between"""
+
+    __slots__ = ('fn',)
+
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+
+    @property
+    def current(self):
+        try:
+            return self.fn()
+        except Exception:
+            return math.nan
+
+    def samples(self, name, labels):
+        return [(name, labels, self.current)]
+
+    def snapshot(self):
+        return self.current
+
+
+class CallbackCounter(Counter):
+    """Counter read from a function when metrics are collected, for totals kept elsewhere"""
+
+    __slots__ = ('fn',)
+
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+
+    @property
+    def current(self):
+        try:
+            return self.fn()
+        except Exception:
+            return math.nan
+
+    def samples(self, name, labels):
+        return [(f"{name}_total", labels, self.current)]
+
+    def snapshot(self):
+        return self.current
+
+
+class Histogram:
+    """Latency distribution in log-linear buckets, HdrHistogram style.
+
+    ``observe`` takes seconds and costs one bucket computation and a locked
+    increment, whatever the range of values. Memory is fixed per histogram.
+    """
+
+    __slots__ = ('counts', 'count', 'sum', 'max', '_lock')
+    kind = 'histogram'
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        micros = int(seconds * 1000000)
+        if micros < 0:
+            micros = 0
+        index = micros if micros < 2 * SUB_BUCKETS else bucket_index(micros)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def since(self, start):
+        """Observe the time elapsed since a ``time.perf_counter()`` reading"""
+        self.observe(time.perf_counter() - start)
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding the given fraction of observations"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = max(1, math.ceil(total * fraction))
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_bounds(index)[1] / 1000000, self.max)
+        return self.max
+
+    def cumulative(self, bounds=EXPORT_BOUNDS):
+        """Observations at or below each bound in seconds"""
+        with self._lock:
+            counts = list(self.counts)
+        result = []
+        index = 0
+        seen = 0
+        for bound in bounds:
+            limit = bound * 1000000
+            while index < len(counts) and bucket_bounds(index)[1] <= limit:
+                seen += counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+    def samples(self, name, labels):
+        samples = [(f"{name}_bucket", labels + (('le', repr(bound)),), count)
+                   for bound, count in zip(EXPORT_BOUNDS, self.cumulative())]
+        samples.append((f"{name}_bucket", labels + (('le', '+Inf'),), self.count))
+        samples.append((f"{name}_sum", labels, self.sum))
+        samples.append((f"{name}_count", labels, self.count))
+        return samples
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'avg_ms': self.sum / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p90_ms': self.percentile(0.9) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.max * 1000
+        }
+
+
+class MetricFamily:
+    """One metric name with a series per combination of label values"""
+
+    def __init__(self, metric_class, name, documentation, labelnames):
+        self.metric_class = metric_class
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Series for the given label values, created on first use"""
+        metric = self.series.get(values)
+        if metric is None:
+            with self._lock:
+                metric = self.series.get(values)
+                if metric is None:
+                    if len(self.series) >= MAX_SERIES:
+                        # Keep an unbounded label such as the client address from growing without limit
+                        values = (OTHER_LABEL,) * len(self.labelnames)
+                        metric = self.series.get(values)
+                    if metric is None:
+                        metric = self.series[values] = self.metric_class()
+        return metric
+
+    def remove(self, *values):
+        """Forget a series, such as the one of a client that disconnected"""
+        with self._lock:
+            self.series.pop(values, None)
+
+    def samples(self):
+        samples = []
+        for values, metric in list(self.series.items()):
+            samples.extend(metric.samples(self.name, tuple(zip(self.labelnames, values))))
+        return samples
+
+    def snapshot(self):
+        if not self.labelnames:
+            metric = self.series.get(())
+            return metric.snapshot() if metric is not None else None
+        return {','.join(str(value) for value in values): metric.snapshot()
+                for values, metric in list(self.series.items())}
+
+
+class MetricsRegistry:
+    """Named metrics of a process, rendered as Prometheus text or a JSON-ready dict.
+
+    ``counter``, ``gauge`` and ``histogram`` return the existing metric when
+    the name is already registered, so modules can declare their metrics at
+    import time. Without label names the metric itself is returned; with
+    label names a family whose ``labels(...)`` gives the series.
+    """
+
+    def __init__(self):
+        self.families = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, documentation, labelnames, metric=None):
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = self.families[name] = MetricFamily(metric_class, name, documentation, tuple(labelnames))
+                if metric is not None:
+                    family.series[()] = metric
+            elif family.metric_class is not metric_class or family.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            elif metric is not None:
+                family.series[()] = metric  # A newer callback replaces the old one
+        return family if labelnames else family.labels()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=()):
+        return self._register(Histogram, name, documentation, labelnames)
+
+    def gauge_function(self, name, documentation, fn):
+        """Gauge whose value is ``fn()`` at collection time"""
+        return self._register(CallbackGauge, name, documentation, (), CallbackGauge(fn))
+
+    def counter_function(self, name, documentation, fn):
+        """Counter whose value is ``fn()`` at collection time; ``fn`` must never decrease"""
+        return self._register(CallbackCounter, name, documentation, (), CallbackCounter(fn))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, family in sorted(self.families.items()):
+            lines.append(f"# HELP {name} {family.documentation}")
+            lines.append(f"# TYPE {name} {family.metric_class.kind}")
+            for sample, labels, value in family.samples():
+                if labels:
+                    rendered = ','.join(f'{label}="{escape(str(value_))}"' for label, value_ in labels)
+                    lines.append(f"{sample}{{{rendered}}} {format_value(value)}")
+                else:
+                    lines.append(f"{sample} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Every metric as plain values, with percentiles in milliseconds for histograms"""
+        return {name: family.snapshot() for name, family in sorted(self.families.items())}
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        if math.isnan(value):
+            return 'NaN'
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+# Metrics of this process, shared by the server, client and web app modules
+REGISTRY = MetricsRegistry()
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,529 @@
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import aiohttp
+from admission import Overloaded
+from bench_async_mode import SYNC_SERVER, launch
+from load_generator import free_port, percentile, raise_file_limit, start_server
+from log_analytics import KIND_CHAT, KIND_CLIENT, find_logs, kind_of, to_seconds
+from mcp_client import AckTimeout, MCPClient
+from mcp_protocol import PROTOCOL_COMPACT
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Bumped when the layout of the results file changes
+RESULTS_VERSION = 1
+
+TARGET_CHAT = 'chat'
+TARGET_MCP = 'mcp'
+
+# Arrival schedules: recorded times, recorded times sped up or slowed down,
+# or Poisson arrivals at a fixed rate whatever the recording says
+SCHEDULE_ORIGINAL = 'original'
+SCHEDULE_SCALED = 'scaled'
+SCHEDULE_OPEN = 'open'
+
+# Questions for synthetic traces: repeated FAQs, a few rewordings and one-off account questions
+SYNTHETIC_QUESTIONS = [
+    "What are your opening hours?",
+    "Are you open on Saturday?",
+    "Where is the Brooklyn branch?",
+    "How do I report fraud?",
+    "What is the support email?",
+    "Do you offer mortgage loans?",
+    "Can you help me plan my savings?",
+    "How do I reset my online banking password?"
+]
+SYNTHETIC_ANSWER = "Thank you for contacting Global Trust Bank. Is there anything else I can help you with today?"
+
+
+class ReplayEvent:
+    """One recorded message: seconds after the first one, its client, text and side"""
+
+    __slots__ = ('offset', 'client', 'content', 'is_user')
+
+    def __init__(self, offset, client, content, is_user):
+        self.offset = offset
+        self.client = client
+        self.content = content
+        self.is_user = is_user
+
+
+def read_records(path):
+    """JSON records of a chat_history.log or client_messages.log file, rotated and compressed ones included"""
+    decode = json.JSONDecoder().raw_decode
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as stream:
+        for line in stream:
+            # JSON records follow the asctime prefix, which has no brace
+            brace = line.find('{')
+            if brace < 0:
+                continue
+            try:
+                record = decode(line, brace)[0]
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def load_trace(paths, max_idle=None, limit=None):
+    """Chat messages recorded in the logs under ``paths``, oldest first.
+
+    chat_history.log has every client's messages as the server saw them.
+    client_messages.log, written by one client, is only used when there is
+    no chat history, since it records the same messages again. Pauses longer
+    than ``max_idle`` seconds, such as nights, are shortened to it.
+    Returns the events and the files they came from.
+    """
+    files = find_logs(paths)
+    chat_files = [path for path in files if kind_of(path) == KIND_CHAT]
+    files = chat_files or [path for path in files if kind_of(path) == KIND_CLIENT]
+    timed = []
+    for path in files:
+        from_client_log = kind_of(path) == KIND_CLIENT
+        for record in read_records(path):
+            content = record.get('content')
+            seconds = to_seconds(record.get('timestamp') or '')
+            if not content or not isinstance(content, str) or seconds is None:
+                continue
+            if from_client_log:
+                if record.get('direction') != 'outgoing' or record.get('type') != 'chat':
+                    continue
+                client, is_user = os.path.basename(path), record.get('sender') == 'user'
+            else:
+                client, is_user = str(record.get('client')), record.get('type') != 'ai_response'
+            timed.append((seconds, client, content, is_user))
+    timed.sort(key=lambda item: item[0])
+    if limit:
+        timed = timed[:limit]
+
+    events = []
+    offset = 0.0
+    previous = timed[0][0] if timed else 0.0
+    for seconds, client, content, is_user in timed:
+        gap = seconds - previous
+        offset += min(gap, max_idle) if max_idle is not None else gap
+        previous = seconds
+        events.append(ReplayEvent(offset, client, content, is_user))
+    return events, files
+
+
+def plan(events, schedule, speed=1.0, rate=None, clients=None, seed=1):
+    """Send time, simulated client and event for each message to replay.
+
+    Each recorded client is one simulated client, unless ``clients`` is
+    set: then messages are dealt round robin to that many.
+    """
+    if schedule == SCHEDULE_OPEN:
+        if not rate:
+            raise ValueError("The open schedule needs an arrival rate")
+        rng = random.Random(seed)
+        due, times = 0.0, []
+        for _ in events:
+            times.append(due)
+            due += rng.expovariate(rate)
+    else:
+        scale = 1.0 if schedule == SCHEDULE_ORIGINAL else 1.0 / speed
+        times = [event.offset * scale for event in events]
+
+    if clients:
+        names = [f"replay-{index % clients}" for index in range(len(events))]
+    else:
+        names = [f"replay-{event.client}" for event in events]
+    return list(zip(times, names, events))
+
+
+class Recorder:
+    """Outcome of every replayed message: latency when it succeeded, error kind when not"""
+
+    def __init__(self):
+        self.latencies = []  # ms
+        self.lags = []       # ms each send started after its scheduled time
+        self.errors = Counter()
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def sent(self, lag):
+        with self._lock:
+            self.requests += 1
+            self.lags.append(lag * 1000)
+
+    def succeeded(self, latency):
+        with self._lock:
+            self.latencies.append(latency * 1000)
+
+    def failed(self, kind):
+        with self._lock:
+            self.errors[kind] += 1
+
+    def results(self, elapsed):
+        """Counts, rates and percentiles, rounded so unchanged runs diff cleanly"""
+        latencies = self.latencies
+        ok = len(latencies)
+        return {
+            'requests': self.requests,
+            'ok': ok,
+            'errors': dict(sorted(self.errors.items())),
+            'error_rate': round(1 - ok / self.requests, 4) if self.requests else 0.0,
+            'duration_seconds': round(elapsed, 3),
+            'offered_rate': round(self.requests / elapsed, 2) if elapsed else 0.0,
+            'throughput': round(ok / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p90': round(percentile(latencies, 90), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'p999': round(percentile(latencies, 99.9), 2),
+                'max': round(max(latencies, default=0.0), 2),
+                'mean': round(sum(latencies) / ok, 2) if ok else 0.0
+            },
+            'schedule_lag_ms': {
+                'p50': round(percentile(self.lags, 50), 2),
+                'p99': round(percentile(self.lags, 99), 2),
+                'max': round(max(self.lags, default=0.0), 2)
+            }
+        }
+
+
+async def replay_chat(url, schedule, recorder, timeout, sessions=True):
+    """Post each user message to /chat at its scheduled time, without waiting for earlier answers"""
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async def request(client, event):
+            body = {'message': event.content}
+            if sessions:
+                # Each simulated client keeps its own conversation, as a browser tab does
+                body['session_id'] = session_ids[client]
+            start = time.perf_counter()
+            try:
+                async with session.post(f'{url}/chat', json=body) as response:
+                    await response.read()
+                    status = response.status
+            except asyncio.TimeoutError:
+                recorder.failed('timeout')
+                return
+            except aiohttp.ClientError:
+                recorder.failed('connection')
+                return
+            if status == 200:
+                recorder.succeeded(time.perf_counter() - start)
+            else:
+                recorder.failed(f'http_{status}')
+
+        # Conversation ids are issued by the app, one per simulated client, before the clock starts
+        session_ids = {}
+        if sessions:
+            for client in {client for _, client, _ in schedule}:
+                async with session.post(f'{url}/session') as response:
+                    session_ids[client] = (await response.json())['session_id']
+
+        tasks = []
+        start = time.perf_counter()
+        for due, client, event in schedule:
+            delay = start + due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            recorder.sent(time.perf_counter() - start - due)
+            tasks.append(asyncio.create_task(request(client, event)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+
+def replay_mcp(host, port, schedule, recorder, timeout, protocol=PROTOCOL_COMPACT, connect_workers=64):
+    """Send each chat message over its simulated client's connection at its scheduled time, timing the acks"""
+    clients = {name: MCPClient(host, port, protocol=protocol, ack_timeout=timeout)
+               for name in sorted({name for _, name, _ in schedule})}
+    with ThreadPoolExecutor(max_workers=connect_workers) as pool:
+        list(pool.map(lambda client: client.connect(), clients.values()))
+
+    def settled(future, sent):
+        error = future.exception()
+        if error is None:
+            recorder.succeeded(time.perf_counter() - sent)
+        elif isinstance(error, Overloaded):
+            recorder.failed(f'busy_{error.reason}')
+        elif isinstance(error, AckTimeout):
+            recorder.failed('ack_timeout')
+        else:
+            recorder.failed('connection')
+
+    futures = []
+    start = time.perf_counter()
+    try:
+        for due, name, event in schedule:
+            delay = start + due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            recorder.sent(time.perf_counter() - start - due)
+            client = clients[name]
+            if not client.connected:
+                recorder.failed('not_connected')
+                continue
+            sent = time.perf_counter()
+            try:
+                # Sent the way the web app's audit outbox sends, without the client-side message log
+                future = client.send_message_async('chat', event.content, is_user=event.is_user,
+                                                   timestamp=datetime.now().isoformat())
+            except AckTimeout:
+                recorder.failed('ack_timeout')
+                continue
+            future.add_done_callback(lambda future, sent=sent: settled(future, sent))
+            futures.append(future)
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass  # Counted by the callback
+        return time.perf_counter() - start
+    finally:
+        for client in clients.values():
+            client.disconnect()
+
+
+def synthesize(directory, messages, clients, rate, seed=1):
+    """Write a chat_history.log of ``messages`` questions from ``clients`` clients at about ``rate`` per second"""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    now = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    records = []
+    for index in range(messages):
+        now += timedelta(seconds=rng.expovariate(rate))
+        index = rng.randrange(clients)
+        client = str((f'10.0.{index // 250}.{index % 250 + 1}', 40000 + index))
+        if rng.random() < 0.2:
+            question = f"What is the balance of my account ending {rng.randrange(10000):04d}?"
+        else:
+            question = rng.choice(SYNTHETIC_QUESTIONS)
+        answered = now + timedelta(seconds=rng.uniform(0.5, 3.0))
+        records.append((now, {'timestamp': now.isoformat(), 'client': client, 'content': question,
+                              'type': 'user_message'}))
+        records.append((answered, {'timestamp': answered.isoformat(), 'client': client,
+                                   'content': SYNTHETIC_ANSWER, 'type': 'ai_response'}))
+    records.sort(key=lambda item: item[0])
+    with open(os.path.join(directory, 'chat_history.log'), 'w', encoding='utf-8') as stream:
+        for written, record in records:
+            stream.write(f"{written.strftime('%Y-%m-%d %H:%M:%S')},{written.microsecond // 1000:03d} - "
+                         f"{json.dumps(record)}\n")
+    return len(records)
+
+
+def start_chat_stack(args, workdir):
+    """Stub LLM, MCP server and web app processes for a self-contained /chat replay; returns the URL and processes"""
+    os.makedirs(os.path.join(workdir, 'logs'), exist_ok=True)
+    stub_port, mcp_port, app_port = free_port(), free_port(), free_port()
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        ENDPOINT_URL=f'http://127.0.0.1:{stub_port}',
+        AZURE_OPENAI_API_KEY='stub',
+        DEPLOYMENT_NAME='stub',
+        MCP_PORT=str(mcp_port),
+        LLM_TIMEOUT=str(args.timeout)
+    )
+    processes = [start_server('async', mcp_port, 1024, workdir)]
+    stub_command = [sys.executable, os.path.join(ROOT, 'stub_llm_server.py'), '--host', '127.0.0.1',
+                    '--port', str(stub_port), '--latency', str(args.llm_latency)]
+    if args.llm_capacity:
+        stub_command += ['--capacity', str(args.llm_capacity)]
+    processes.append(launch(stub_command, stub_port, env, workdir))
+    if args.app_mode == 'async':
+        app_command = [sys.executable, os.path.join(ROOT, 'async_app.py'), '--host', '127.0.0.1',
+                       '--port', str(app_port), '--timeout', str(args.timeout)]
+    else:
+        app_command = [sys.executable, '-c', SYNC_SERVER, str(app_port)]
+    processes.append(launch(app_command, app_port, env, workdir))
+    return f'http://127.0.0.1:{app_port}', processes
+
+
+def run(args):
+    """Replay the trace against one target and return the results document"""
+    if args.synthesize:
+        events, files = load_trace([args.synthesize], args.max_idle, args.limit)
+    else:
+        events, files = load_trace(args.paths, args.max_idle, args.limit)
+    if args.target == TARGET_CHAT:
+        # The web app generates the answers; only questions are replayed
+        events = [event for event in events if event.is_user]
+    if not events:
+        raise SystemExit(f"No chat messages found in {', '.join(args.paths)}")
+    schedule = plan(events, args.schedule, args.speed, args.rate, args.clients, args.seed)
+    recorder = Recorder()
+
+    processes = []
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            if args.target == TARGET_CHAT:
+                url = args.url
+                if url is None:
+                    url, processes = start_chat_stack(args, workdir)
+                elapsed = asyncio.run(replay_chat(url.rstrip('/'), schedule, recorder, args.timeout,
+                                                  sessions=not args.no_sessions))
+            else:
+                port = args.mcp_port
+                if port is None:
+                    port = free_port()
+                    processes.append(start_server(args.mcp_mode, port, 1024, workdir))
+                elapsed = replay_mcp(args.mcp_host, port, schedule, recorder, args.timeout)
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    return {
+        'version': RESULTS_VERSION,
+        'target': args.target,
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'schedule': args.schedule,
+            'speed': args.speed if args.schedule == SCHEDULE_SCALED else None,
+            'rate': args.rate if args.schedule == SCHEDULE_OPEN else None,
+            'clients': args.clients,
+            'sessions': not args.no_sessions if args.target == TARGET_CHAT else None,
+            'app_mode': args.app_mode if args.target == TARGET_CHAT and args.url is None else None,
+            'llm_latency': args.llm_latency if args.target == TARGET_CHAT and args.url is None else None,
+            'llm_capacity': args.llm_capacity if args.target == TARGET_CHAT and args.url is None else None,
+            'mcp_mode': args.mcp_mode if args.target == TARGET_MCP and args.mcp_port is None else None,
+            'max_idle': args.max_idle,
+            'seed': args.seed
+        },
+        'trace': {
+            'files': [os.path.basename(path) for path in files],
+            'events': len(events),
+            'clients': len({name for _, name, _ in schedule}),
+            'span_seconds': round(schedule[-1][0], 3)
+        },
+        **recorder.results(elapsed)
+    }
+
+
+# Compared metrics, whether a higher value is better, and their labels
+COMPARED = [
+    (('throughput',), True, 'throughput/s'),
+    (('error_rate',), False, 'error rate'),
+    (('latency_ms', 'p50'), False, 'p50 ms'),
+    (('latency_ms', 'p90'), False, 'p90 ms'),
+    (('latency_ms', 'p99'), False, 'p99 ms'),
+    (('latency_ms', 'max'), False, 'max ms')
+]
+
+
+def compare(base, new, threshold=10.0, error_threshold=1.0):
+    """Rows of base value, new value and change per metric, and the metrics that got worse by over ``threshold`` percent.
+
+    The error rate is compared in percentage points against ``error_threshold``, since the base is often zero.
+    """
+    rows, regressions = [], []
+    for keys, higher_is_better, label in COMPARED:
+        before, after = base, new
+        for key in keys:
+            before, after = before.get(key, 0.0), after.get(key, 0.0)
+        if keys == ('error_rate',):
+            change = (after - before) * 100
+            worse = change > error_threshold
+        else:
+            change = (after - before) / before * 100 if before else 0.0
+            worse = (-change if higher_is_better else change) > threshold
+        rows.append((label, before, after, change))
+        if worse:
+            regressions.append(label)
+    return rows, regressions
+
+
+def print_results(results):
+    latency = results['latency_ms']
+    print(f"{results['target']}: {results['requests']} messages from {results['trace']['clients']} clients "
+          f"in {results['duration_seconds']:.1f}s ({results['offered_rate']:,.1f}/s offered)")
+    print(f"  ok {results['ok']}, throughput {results['throughput']:,.1f}/s, error rate {results['error_rate']:.2%}")
+    print(f"  latency ms: p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}  p99 {latency['p99']:.1f}  "
+          f"max {latency['max']:.1f}")
+    print(f"  schedule lag ms: p99 {results['schedule_lag_ms']['p99']:.1f}  max {results['schedule_lag_ms']['max']:.1f}")
+    for kind, count in results['errors'].items():
+        print(f"  {kind}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded chat traffic against /chat or the MCP server")
+    parser.add_argument('paths', nargs='*', default=['logs'],
+                        help="log files or directories with chat_history.log or client_messages.log, logs/ by default")
+    parser.add_argument('--target', choices=[TARGET_CHAT, TARGET_MCP], default=TARGET_CHAT)
+    parser.add_argument('--schedule', choices=[SCHEDULE_ORIGINAL, SCHEDULE_SCALED, SCHEDULE_OPEN],
+                        default=SCHEDULE_ORIGINAL)
+    parser.add_argument('--speed', type=float, default=10.0, help="scaled schedule: times faster than recorded")
+    parser.add_argument('--rate', type=float, default=50.0, help="open schedule: messages per second")
+    parser.add_argument('--clients', type=int, help="deal messages to this many simulated clients "
+                                                    "instead of one per recorded client")
+    parser.add_argument('--limit', type=int, help="replay only the first N recorded messages")
+    parser.add_argument('--max-idle', type=float, default=60.0, help="shorten recorded pauses to this many seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=60.0, help="seconds to wait for each answer or ack")
+    parser.add_argument('--url', help="replay against this running web app instead of starting one")
+    parser.add_argument('--app-mode', choices=['sync', 'async'], default='sync', help="web app started for /chat")
+    parser.add_argument('--no-sessions', action='store_true', help="send questions without a session_id")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="stub LLM latency in seconds")
+    parser.add_argument('--llm-capacity', type=int, help="requests the stub LLM answers at once; unlimited by default")
+    parser.add_argument('--mcp-host', default='localhost')
+    parser.add_argument('--mcp-port', type=int, help="replay against this running MCP server instead of starting one")
+    parser.add_argument('--mcp-mode', choices=['thread', 'async'], default='thread', help="MCP server started for mcp")
+    parser.add_argument('--output', metavar='PATH', help="write the results as JSON")
+    parser.add_argument('--synthesize', metavar='DIR',
+                        help="write a synthetic chat_history.log to this directory first and replay it")
+    parser.add_argument('--messages', type=int, default=1000, help="questions in a synthetic trace")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help="compare two results files; exits 1 when NEW is worse")
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent change counted as a regression")
+    parser.add_argument('--error-threshold', type=float, default=1.0,
+                        help="error rate increase, in percentage points, counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as stream:
+            base = json.load(stream)
+        with open(args.compare[1], encoding='utf-8') as stream:
+            new = json.load(stream)
+        rows, regressions = compare(base, new, args.threshold, args.error_threshold)
+        base_config, new_config = base.get('config', {}), new.get('config', {})
+        differing = [key for key in sorted(set(base_config) | set(new_config))
+                     if base_config.get(key) != new_config.get(key)]
+        if base.get('target') != new.get('target'):
+            differing.insert(0, 'target')
+        if differing:
+            print(f"Runs differ in {', '.join(differing)}; compare runs of the same configuration")
+        print(f"{'metric':<14} {'base':>12} {'new':>12} {'change':>9}")
+        for label, before, after, change in rows:
+            unit = ' pt' if label == 'error rate' else ' %'
+            print(f"{label:<14} {before:>12,.4g} {after:>12,.4g} {change:>+7.1f}{unit}")
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+        return
+
+    logging.getLogger().setLevel(logging.WARNING)
+    raise_file_limit()
+    if args.synthesize:
+        written = synthesize(args.synthesize, args.messages, args.clients or 50, args.rate)
+        print(f"Wrote {written} records to {os.path.join(args.synthesize, 'chat_history.log')}")
+        # The synthetic trace's clients are the simulated ones
+        args.clients = None
+
+    results = run(args)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
+            stream.write('\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def normalize_message(text):
+    """Lowercase a message and reduce it to its words, so trivial variations share a key"""
+    return ' '.join(_WORD.findall(text.lower()))
+
+
+def fingerprint(*parts):
+    """Stable hash of JSON-serializable values"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def numbers(normalized):
+    """Words of a normalized message containing digits, such as amounts or account numbers"""
+    return {word for word in normalized.split() if any(char.isdigit() for char in word)}
+
+
+def shingles(normalized, size=2):
+    """Word shingles of a normalized message"""
+    words = normalized.split()
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[index:index + size]) for index in range(len(words) - size + 1)}
+
+
+class CacheEntry:
+    __slots__ = ('key', 'normalized', 'response', 'latency', 'created', 'shingles')
+
+    def __init__(self, key, normalized, response, latency, created, shingle_set):
+        self.key = key
+        self.normalized = normalized
+        self.response = response
+        self.latency = latency
+        self.created = created
+        self.shingles = shingle_set
+
+
+class ResponseCache:
+    """Cache of LLM answers keyed by the normalized user message.
+
+    Keys also include a namespace, a hash of the system prompt, bank
+    information and model parameters, so changing any of those invalidates
+    every cached answer. An in-memory LRU tier with a TTL sits in front of an
+    optional SQLite tier that survives restarts. With ``similarity_threshold``
+    set, a miss falls back to the most similar cached message by word
+    shingle Jaccard similarity, provided both mention the same numbers.
+    """
+
+    def __init__(self, namespace, max_entries=1024, ttl=3600.0, disk_path=None,
+                 similarity_threshold=None, shingle_size=2):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.shingle_size = shingle_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._entries = OrderedDict()  # key -> CacheEntry, least recently used first
+        self._index = {}  # shingle -> keys of cached messages containing it
+        self._lock = threading.Lock()
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, namespace TEXT, normalized TEXT, "
+                "response TEXT, latency REAL, created REAL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE namespace != ?", (namespace,))
+            self._db.commit()
+
+    def key_for(self, normalized):
+        return hashlib.sha256(f"{self.namespace}\n{normalized}".encode('utf-8')).hexdigest()
+
+    def set_namespace(self, namespace):
+        """Switch to a new namespace, dropping every answer cached under the old one"""
+        if namespace == self.namespace:
+            return
+        with self._lock:
+            self.namespace = namespace
+            self._entries.clear()
+            self._index.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE namespace != ?", (namespace,))
+                self._db.commit()
+
+    def get(self, message):
+        """Return the cached answer for a message, or None"""
+        normalized = normalize_message(message)
+        key = self.key_for(normalized)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.created > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                entry = self._load(key, now)
+                if entry is not None:
+                    self.disk_hits += 1
+                else:
+                    entry = self._nearest(normalized, now)
+                    if entry is not None:
+                        self.near_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            self.saved_seconds += entry.latency
+            return entry.response
+
+    def put(self, message, response, latency=0.0):
+        """Cache the answer to a message along with how long it took to generate"""
+        normalized = normalize_message(message)
+        key = self.key_for(normalized)
+        now = time.time()
+        with self._lock:
+            self._store(CacheEntry(key, normalized, response, latency, now,
+                                   shingles(normalized, self.shingle_size)))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, self.namespace, normalized, response, latency, now)
+                )
+                self._db.commit()
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _store(self, entry):
+        if entry.key in self._entries:
+            self._remove(entry.key)
+        self._entries[entry.key] = entry
+        for shingle in entry.shingles:
+            self._index.setdefault(shingle, set()).add(entry.key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for shingle in entry.shingles:
+            keys = self._index.get(shingle)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._index[shingle]
+
+    def _load(self, key, now):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT normalized, response, latency, created FROM responses WHERE key = ? AND namespace = ?",
+            (key, self.namespace)
+        ).fetchone()
+        if row is None or now - row[3] > self.ttl:
+            return None
+        entry = CacheEntry(key, row[0], row[1], row[2], row[3], shingles(row[0], self.shingle_size))
+        self._store(entry)
+        return entry
+
+    def _nearest(self, normalized, now):
+        if self.similarity_threshold is None:
+            return None
+        query = shingles(normalized, self.shingle_size)
+        if not query:
+            return None
+        query_numbers = numbers(normalized)
+        # Only cached messages sharing at least one shingle are candidates
+        overlap = {}
+        for shingle in query:
+            for key in self._index.get(shingle, ()):
+                overlap[key] = overlap.get(key, 0) + 1
+        best, best_score = None, self.similarity_threshold
+        for key, shared in overlap.items():
+            entry = self._entries[key]
+            score = shared / (len(query) + len(entry.shingles) - shared)
+            if score < best_score or now - entry.created > self.ttl:
+                continue
+            # Questions about different amounts or accounts are never near duplicates
+            if numbers(entry.normalized) != query_numbers:
+                continue
+            best, best_score = entry, score
+        if best is not None:
+            self._entries.move_to_end(best.key)
+        return best
+
+    def stats(self):
+        """Hit/miss counters and the LLM time saved by hits"""
+        lookups = self.hits + self.disk_hits + self.near_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': (lookups - self.misses) / lookups if lookups else 0.0,
+            'saved_seconds': self.saved_seconds
+        }
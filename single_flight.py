@@ -0,0 +1,120 @@
+import asyncio
+import threading
+
+
+class FlightTimeout(TimeoutError):
+    """Raised when a coalesced request gives up waiting for the shared call"""
+
+
+class Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one.
+
+    The first thread to ask for a key runs the call; threads asking for the
+    same key while it is in flight wait for it and receive the same result,
+    or the same exception. Nothing is kept once the call returns, so later
+    requests start a fresh call; caching is left to the response cache.
+    """
+
+    def __init__(self, timeout=30.0):
+        self.timeout = timeout
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return ``fn()``, sharing one call among concurrent callers with the same key"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                flight.result = fn()
+                return flight.result
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+        if not flight.done.wait(self.timeout):
+            self.timeouts += 1
+            raise FlightTimeout(f"No result for a coalesced request after {self.timeout}s")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def stats(self):
+        """Upstream calls made and requests that shared one"""
+        return {
+            'in_flight': len(self._flights),
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts
+        }
+
+
+class AsyncFlight:
+    __slots__ = ('task', 'waiters')
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for coroutines on one event loop.
+
+    The shared call runs as its own task, so one caller disconnecting does
+    not cancel it for the others; it is cancelled once every caller waiting
+    on it has gone.
+    """
+
+    async def do(self, key, factory):
+        """Await ``factory()``, sharing one task among concurrent callers with the same key"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = AsyncFlight(asyncio.ensure_future(factory()))
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.task), self.timeout)
+        except asyncio.TimeoutError:
+            if flight.task.done():
+                # The shared call itself timed out
+                raise
+            self.timeouts += 1
+            raise FlightTimeout(f"No result for a coalesced request after {self.timeout}s")
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Retrieve the exception so an abandoned call is not reported as unhandled
+        if not flight.task.cancelled():
+            flight.task.exception()
@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+from aiohttp import web
+
+ANSWER = (
+    "Thank you for contacting Global Trust Bank. Our branches are open 9:00 AM - 5:00 PM EST "
+    "on weekdays and 10:00 AM - 2:00 PM EST on Saturday.\n\n"
+    "Is there anything else I can help you with today?"
+)
+
+
+class StubLLMServer:
+    """Local stand-in for the Azure OpenAI chat completions endpoint.
+
+    Every request is answered with the same text after a fixed latency,
+    either as one JSON body or, with ``stream`` set, as server-sent chunks
+    spread over the same time. Used by the load tests so they measure the
+    app rather than the model. With ``capacity`` set, at most that many
+    requests are answered at once and the rest wait their turn, like a
+    deployment at its throughput limit.
+    """
+
+    def __init__(self, latency=0.2, token_interval=0.0, answer=ANSWER, capacity=None):
+        self.latency = latency
+        self.capacity = asyncio.Semaphore(capacity) if capacity else None
+        self.token_interval = token_interval
+        self.answer = answer
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.cancelled = 0
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/openai/deployments/{deployment}/chat/completions', self.completions)
+        app.router.add_get('/stats', self.stats)
+        return app
+
+    async def completions(self, request):
+        body = await request.json()
+        self.requests += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.capacity is None:
+                return await self.answer_request(request, body)
+            async with self.capacity:
+                return await self.answer_request(request, body)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+
+    async def answer_request(self, request, body):
+        if body.get('stream'):
+            return await self.stream(request, body)
+        await asyncio.sleep(self.latency)
+        return web.json_response({
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.match_info['deployment'],
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': self.answer}
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        })
+
+    async def stream(self, request, body):
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep(self.latency)
+        words = self.answer.split(' ')
+        for index, word in enumerate(words):
+            if index and self.token_interval:
+                await asyncio.sleep(self.token_interval)
+            chunk = {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': request.match_info['deployment'],
+                'choices': [{
+                    'index': 0,
+                    'finish_reason': None,
+                    'delta': {'content': word if index == len(words) - 1 else word + ' '}
+                }]
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def stats(self, request):
+        return web.json_response({
+            'requests': self.requests,
+            'active': self.active,
+            'max_active': self.max_active,
+            'cancelled': self.cancelled
+        })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub Azure OpenAI chat completions server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8400)
+    parser.add_argument('--latency', type=float, default=0.2, help="seconds before the answer or first token")
+    parser.add_argument('--token-interval', type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument('--capacity', type=int, help="requests answered at once; the rest queue")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    server = StubLLMServer(args.latency, args.token_interval, capacity=args.capacity)
+    web.run_app(server.make_app(), host=args.host, port=args.port, handler_cancellation=True,
+                access_log=None, print=lambda message: logging.warning(message))
@@ -0,0 +1,17 @@
+from chat_store import ChatStore
+
+
+def test_search_results_follow_message_time(tmp_path):
+    # Stored out of time order, as journal replays and log imports do
+    store = ChatStore(str(tmp_path / 'chat.db'))
+    for day in ('03', '01', '02'):
+        store.write({'timestamp': f'2024-01-{day}T10:00:00', 'client': 'a', 'type': 'user_message',
+                     'content': f'loan question {day}'})
+    store.flush()
+    try:
+        oldest = [row['timestamp'][:10] for row in store.query(search='loan', limit=2)]
+        newest = [row['timestamp'][:10] for row in store.query(search='loan', limit=2, newest_first=True)]
+        assert oldest == ['2024-01-01', '2024-01-02']
+        assert newest == ['2024-01-03', '2024-01-02']
+    finally:
+        store.close()
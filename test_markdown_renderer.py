@@ -0,0 +1,25 @@
+from markdown_renderer import MarkdownRenderer
+
+# Script URLs hidden behind entities and characters browsers ignore
+ENTITY_PAYLOADS = [
+    "[x](javascript&#58;alert(1))",
+    "[x](javascript&#x3A;alert(1))",
+    "[x](&#106;avascript:alert(1))",
+    "[x](jav&#x09;ascript:alert(1))"
+]
+
+
+def test_entity_encoded_script_links_are_dropped():
+    renderer = MarkdownRenderer(max_entries=0)
+    for payload in ENTITY_PAYLOADS:
+        rendered = renderer.render(payload)
+        assert 'href' not in rendered, payload
+        assert '>x</a>' in rendered
+
+
+def test_safe_links_are_kept():
+    renderer = MarkdownRenderer(max_entries=0)
+    assert 'href="https://www.globaltrustbank.com/?a=1&amp;b=2"' in renderer.render(
+        "[site](https://www.globaltrustbank.com/?a=1&b=2)")
+    assert 'href="mailto:support@globaltrust.com"' in renderer.render("[mail](mailto:support@globaltrust.com)")
+    assert 'href="/branches"' in renderer.render("[branches](/branches)")
@@ -0,0 +1,41 @@
+import json
+import pytest
+from mcp_protocol import MessageDecoder, ProtocolError, PROTOCOL_FRAMED, PROTOCOL_JSON, encode_message
+
+MESSAGES = [
+    {'type': 'chat', 'content': 'Is my card "blocked"? \\ café ☕', 'is_user': True, 'id': 12, 'timestamp': None},
+    {'type': 'chat', 'content': '', 'is_user': False, 'score': -1.25e-3, 'tags': [1, 2.5, [], {}]},
+    {'type': 'system', 'content': '{"not": "a document"}', 'command': 'metrics'}
+]
+
+
+def decode_split(data, protocol, offset):
+    """Messages decoded from ``data`` arriving as two reads split at ``offset``"""
+    decoder = MessageDecoder(protocol)
+    decoded = []
+    for part in (data[:offset], data[offset:]):
+        decoder.feed(part)
+        decoded.extend(decoder.messages())
+    return decoded
+
+
+def test_json_split_at_every_offset():
+    # Reads can end inside a literal, a number, an escape or a multi-byte character
+    data = ''.join(json.dumps(message, ensure_ascii=False) for message in MESSAGES).encode('utf-8')
+    for offset in range(len(data) + 1):
+        assert decode_split(data, PROTOCOL_JSON, offset) == MESSAGES, offset
+
+
+def test_framed_split_at_every_offset():
+    data = b''.join(encode_message(message, PROTOCOL_FRAMED) for message in MESSAGES)
+    for offset in range(len(data) + 1):
+        assert decode_split(data, PROTOCOL_FRAMED, offset) == MESSAGES, offset
+
+
+def test_invalid_json_is_rejected_once_complete():
+    decoder = MessageDecoder(PROTOCOL_JSON)
+    decoder.feed(b'{"type": "chat", "is_user": tru')
+    assert list(decoder.messages()) == []
+    decoder.feed(b'th}')
+    with pytest.raises(ProtocolError):
+        list(decoder.messages())
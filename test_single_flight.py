@@ -0,0 +1,91 @@
+import threading
+import time
+from types import SimpleNamespace
+import app as chat_app
+from single_flight import SingleFlight, FlightTimeout
+
+
+class DiscardOutbox:
+    def emit(self, content, is_user=True, **fields):
+        return True
+
+
+def slow_llm(calls, latency=0.3):
+    """Stubbed ChatCompletion.create that counts upstream calls"""
+    def create(**kwargs):
+        calls.append(kwargs['messages'][-1]['content'])
+        time.sleep(latency)
+        message = SimpleNamespace(content="Our branches are open 9:00 AM - 5:00 PM EST on weekdays.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+    return create
+
+
+def test_coalescing(monkeypatch):
+    # 50 customers ask the same question at the same moment, written slightly differently
+    calls = []
+    monkeypatch.setattr(chat_app.openai.ChatCompletion, 'create', slow_llm(calls))
+    monkeypatch.setattr(chat_app, 'audit_outbox', DiscardOutbox())
+    monkeypatch.setattr(chat_app, 'single_flight', SingleFlight(timeout=5.0))
+    chat_app.response_cache.clear()
+
+    questions = ["Is the outage affecting my card payments?", "is the outage affecting my card payments"]
+    responses = []
+
+    def ask(question):
+        response = chat_app.app.test_client().post('/chat', json={'message': question})
+        responses.append((response.status_code, response.get_json()))
+
+    threads = [threading.Thread(target=ask, args=(questions[index % 2],)) for index in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = chat_app.single_flight.stats()
+    assert len(calls) == 1
+    assert stats['coalesced'] == 49
+    assert all(status == 200 for status, _ in responses)
+    assert len({body['response'] for _, body in responses}) == 1
+
+
+def test_error_propagation():
+    # Every waiter sees the leader's exception, and the next call starts afresh
+    flights = SingleFlight(timeout=5.0)
+    errors = []
+
+    def failing():
+        time.sleep(0.2)
+        raise RuntimeError("upstream unavailable")
+
+    def call():
+        try:
+            flights.do('question', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["upstream unavailable"] * 10
+    assert flights.do('question', lambda: 'answer') == 'answer'
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_timeout():
+    # Waiters give up after the timeout while the leader carries on
+    flights = SingleFlight(timeout=0.1)
+    leader = threading.Thread(target=flights.do, args=('question', lambda: time.sleep(0.5)))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        flights.do('question', lambda: None)
+        timed_out = False
+    except FlightTimeout:
+        timed_out = True
+    leader.join()
+
+    assert timed_out
+    assert flights.stats()['timeouts'] == 1
@@ -0,0 +1,312 @@
+import argparse
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from audit_log import get_audit_log
+from log_retention import open_log
+
+TRACE_PATH = os.path.join('logs', 'traces.log')
+SERVER_TRACE_PATH = os.path.join('logs', 'mcp_traces.log')
+PROFILE_DIR = os.path.join('logs', 'profiles')
+
+# Trace of the request being handled by this thread or task, if any
+_current = contextvars.ContextVar('trace', default=None)
+
+
+def new_trace_id():
+    return os.urandom(16).hex()
+
+
+def is_sampled(trace_id, sample_rate):
+    """Sampling decision derived from the trace ID alone, so every process keeps the same traces"""
+    if sample_rate >= 1:
+        return True
+    return int(trace_id[:8], 16) < sample_rate * 0x100000000
+
+
+def current_trace_id():
+    """ID of the trace being recorded in this context, or None"""
+    trace = _current.get()
+    return trace.trace_id if trace is not None else None
+
+
+class Trace:
+    """Spans of one request, kept in memory until the request ends"""
+
+    __slots__ = ('trace_id', 'name', 'started', 'start', 'duration', 'attributes', 'spans', 'depth',
+                 'error', 'profiled', 'token')
+
+    def __init__(self, name, trace_id=None, **attributes):
+        self.trace_id = trace_id or new_trace_id()
+        self.name = name
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.attributes = attributes
+        self.spans = []  # (name, depth, offset, duration, attributes), in start order
+        self.depth = 0
+        self.error = None
+        self.profiled = False
+        self.token = None
+
+    def as_dict(self, service):
+        return {
+            'trace_id': self.trace_id,
+            'service': service,
+            'name': self.name,
+            'start': datetime.fromtimestamp(self.started).isoformat(),
+            'duration_ms': round(self.duration * 1000, 3),
+            'error': self.error,
+            'attributes': self.attributes,
+            'spans': [
+                {'name': name, 'depth': depth, 'offset_ms': round(offset * 1000, 3),
+                 'duration_ms': round(duration * 1000, 3), **({'attributes': attributes} if attributes else {})}
+                for name, depth, offset, duration, attributes in filter(None, self.spans)
+            ]
+        }
+
+
+class Span:
+    """Time a block as a span of the current trace, and optionally into a metrics histogram.
+
+    Outside a trace only the histogram is updated, so instrumented code
+    costs about the same whether or not the request is traced.
+    """
+
+    __slots__ = ('name', 'histogram', 'attributes', 'trace', 'start', 'index')
+
+    def __init__(self, name, histogram=None, **attributes):
+        self.name = name
+        self.histogram = histogram
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.trace = trace = _current.get()
+        if trace is not None:
+            self.index = len(trace.spans)
+            trace.spans.append(None)
+            trace.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if self.histogram is not None:
+            self.histogram.observe(end - self.start)
+        trace = self.trace
+        if trace is not None:
+            trace.depth -= 1
+            attributes = self.attributes
+            if exc_type is not None:
+                attributes = {**attributes, 'error': exc_type.__name__}
+            # Placed at its start so nested spans follow their parent
+            trace.spans[self.index] = (self.name, trace.depth, self.start - trace.start, end - self.start,
+                                       attributes)
+        return False
+
+
+class SamplingProfiler:
+    """Samples the call stacks of watched threads from a background thread.
+
+    Stacks are counted in the folded format read by flamegraph.pl and
+    speedscope: frames from the outermost call, separated by semicolons.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self._watched = {}  # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def watch(self, thread_id):
+        with self._lock:
+            self._watched[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='sampling-profiler')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+
+    def unwatch(self, thread_id):
+        """Stop sampling a thread, returning its stack counts"""
+        with self._lock:
+            return self._watched.pop(thread_id, Counter())
+
+    def run(self):
+        while True:
+            if not self._watched:
+                # Sleep until a request is watched
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, stacks in self._watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[fold(frame)] += 1
+                        self.samples += 1
+
+
+def fold(frame):
+    """One line of a folded stack, outermost frame first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Tracer:
+    """Records request traces and writes a sample of them to a JSON lines file.
+
+    ``sample_rate`` of traces are kept, chosen by trace ID so that a
+    request sampled by the web app is also sampled by the MCP server;
+    traces slower than ``slow_ms`` are kept regardless. With
+    ``profile_ms`` every request is watched by a sampling profiler and
+    the folded stacks of those slower than ``profile_ms`` are written to
+    ``profile_dir`` as ``<trace_id>.folded``.
+    """
+
+    def __init__(self, service, path=TRACE_PATH, sample_rate=0.01, slow_ms=None, profile_ms=None,
+                 profile_interval=0.005, profile_dir=PROFILE_DIR):
+        self.service = service
+        self.sample_rate = sample_rate
+        self.slow = slow_ms / 1000 if slow_ms is not None else None
+        self.profile = profile_ms / 1000 if profile_ms is not None else None
+        self.profile_dir = profile_dir
+        self.profiler = SamplingProfiler(profile_interval) if profile_ms is not None else None
+        self.log = get_audit_log(path, timestamp_prefix=False)
+        self.traces = 0
+        self.kept = 0
+        self.profiles = 0
+
+    def begin(self, name, trace_id=None, **attributes):
+        """Start a trace and make it current in this thread or task"""
+        trace = Trace(name, trace_id, **attributes)
+        trace.token = _current.set(trace)
+        if self.profiler is not None:
+            trace.profiled = True
+            self.profiler.watch(threading.get_ident())
+        return trace
+
+    def end(self, trace, error=None):
+        """Finish a trace, keeping it if it was sampled or slow"""
+        trace.duration = time.perf_counter() - trace.start
+        try:
+            _current.reset(trace.token)
+        except ValueError:
+            _current.set(None)  # Ended in another context than it began in
+        if error is not None:
+            trace.error = str(error) or type(error).__name__
+        self.traces += 1
+        stacks = self.profiler.unwatch(threading.get_ident()) if trace.profiled else None
+        if stacks and trace.duration >= self.profile:
+            self._logged(self.write_profile, trace, stacks)
+        if is_sampled(trace.trace_id, self.sample_rate) or (self.slow is not None and trace.duration >= self.slow):
+            self.log.write(trace.as_dict(self.service))
+            self.kept += 1
+
+    def record(self, trace_id, name, duration, **attributes):
+        """Keep a single span done on behalf of another process's trace, such as an MCP message it sent"""
+        if is_sampled(trace_id, self.sample_rate) or (self.slow is not None and duration >= self.slow):
+            self.log.write({
+                'trace_id': trace_id,
+                'service': self.service,
+                'name': name,
+                'start': datetime.fromtimestamp(time.time() - duration).isoformat(),
+                'duration_ms': round(duration * 1000, 3),
+                'attributes': attributes
+            })
+            self.kept += 1
+
+    def write_profile(self, trace, stacks):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{trace.trace_id}.folded")
+        with open(path, 'w', encoding='utf-8') as stream:
+            for stack, count in stacks.most_common():
+                stream.write(f"{stack} {count}\n")
+        self.profiles += 1
+        logging.info(f"Profiled slow request {trace.trace_id} ({trace.duration * 1000:.0f} ms): {path}")
+
+    def _logged(self, fn, *args):
+        try:
+            fn(*args)
+        except OSError as e:
+            logging.error(f"Trace profile error: {e}")
+
+    def stats(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'traces': self.traces,
+            'kept': self.kept,
+            'profiles': self.profiles,
+            'profiler_samples': self.profiler.samples if self.profiler is not None else 0
+        }
+
+
+def read_traces(paths):
+    """Trace records from trace files, plain or gzipped, skipping unreadable lines"""
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open_log(path) as stream:
+            for line in stream:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def print_trace(records):
+    """Timeline of one trace across services, offsets from the earliest record"""
+    records = sorted(records, key=lambda record: record['start'])
+    origin = datetime.fromisoformat(records[0]['start'])
+    for record in records:
+        offset = (datetime.fromisoformat(record['start']) - origin).total_seconds() * 1000
+        print(f"{offset:>10.1f} ms {record['duration_ms']:>10.1f} ms  {record['service']}: {record['name']}"
+              f"{' ' + json.dumps(record['attributes']) if record.get('attributes') else ''}"
+              f"{' ERROR ' + record['error'] if record.get('error') else ''}")
+        for child in record.get('spans', []):
+            print(f"{offset + child['offset_ms']:>10.1f} ms {child['duration_ms']:>10.1f} ms  "
+                  f"{'  ' * (child['depth'] + 1)}{child['name']}"
+                  f"{' ' + json.dumps(child['attributes']) if child.get('attributes') else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect sampled request traces")
+    parser.add_argument('--files', nargs='+', default=[TRACE_PATH, SERVER_TRACE_PATH])
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help="timeline of one trace across the web app and MCP server")
+    show.add_argument('trace_id')
+    slowest = commands.add_parser('slowest', help="slowest kept traces")
+    slowest.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'show':
+        records = [record for record in read_traces(args.files) if record.get('trace_id') == args.trace_id]
+        if not records:
+            print(f"No trace {args.trace_id}")
+            return
+        print_trace(records)
+    else:
+        traces = [record for record in read_traces(args.files) if 'spans' in record]
+        traces.sort(key=lambda record: record['duration_ms'], reverse=True)
+        for record in traces[:args.top]:
+            slowest_span = max(record['spans'], key=lambda child: child['duration_ms'], default=None)
+            print(f"{record['trace_id']}  {record['start']}  {record['duration_ms']:>10.1f} ms  {record['name']}"
+                  f"{'  slowest: ' + slowest_span['name'] if slowest_span else ''}")
+
+
+if __name__ == "__main__":
+    main()